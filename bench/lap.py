@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""
+    bench/lap.py
+
+    Compare the LAP solvers used inside `run_mgmmf`
+        - padded : dense lapjv on the (n + u) x (n + u) padded top-k problem
+        - sap    : shortest augmenting paths on the n x u candidate graph
+
+    Both should find assignments w/ the same objective.
+"""
+
+import sys
+import argparse
+import numpy as np
+from time import perf_counter
+
+from mgmmf._mgmmf_cpp import _rect_lap
+
+# --
+# CLI
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nts',     type=int, nargs='+', default=[5, 10, 25, 50, 100])
+    parser.add_argument('--nw',      type=int, default=10000)
+    parser.add_argument('--n_iters', type=int, default=5)
+    parser.add_argument('--binary',  action='store_true', help='0/1 costs (many ties), like exact-match templates')
+    parser.add_argument('--seed',    type=int, default=123)
+    return parser.parse_args()
+
+
+def run_lap(cost, lap):
+    nt, nw = cost.shape
+    ind    = np.zeros(nt, dtype=np.int32)
+
+    t = perf_counter()
+    _rect_lap(ind=ind, cost=cost.ravel(), nt=nt, nw=nw, lap=lap)
+    elapsed = perf_counter() - t
+
+    return ind, elapsed
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rng  = np.random.default_rng(args.seed)
+
+    print('nt\tnw\tpadded_ms\tsap_ms\tspeedup\tsame_obj')
+    for nt in args.nts:
+        t_padded, t_sap, same = [], [], True
+        for _ in range(args.n_iters):
+            if args.binary:
+                cost = (rng.random((nt, args.nw)) < 0.01).astype(np.float64)
+            else:
+                cost = rng.random((nt, args.nw))
+
+            ind_padded, e_padded = run_lap(cost, 'padded')
+            ind_sap,    e_sap    = run_lap(cost, 'sap')
+
+            assert len(set(ind_sap)) == nt, 'sap: assignment is not injective'
+
+            obj_padded = cost[np.arange(nt), ind_padded].sum()
+            obj_sap    = cost[np.arange(nt), ind_sap].sum()
+            same      &= bool(np.isclose(obj_padded, obj_sap))
+
+            t_padded.append(e_padded)
+            t_sap.append(e_sap)
+
+        t_padded = 1000 * np.median(t_padded)
+        t_sap    = 1000 * np.median(t_sap)
+        print(f'{nt}\t{args.nw}\t{t_padded:.3f}\t{t_sap:.3f}\t{t_padded / t_sap:.1f}x\t{same}')
+        sys.stdout.flush()
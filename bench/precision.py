@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+"""
+    bench/precision.py
+    
+    float64 vs float32 solver on the same planted problems (see `bench/synth.py`).
+    float32 should match float64 recall, w/ lower peak memory.
+    
+    Example:
+        python -m bench.precision --nw 2000 --nt 5 10 --seeds 5
+"""
+
+import sys
+import argparse
+import numpy as np
+
+from bench.sweep import run_isolated
+
+# --
+# CLI
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nt',      type=int,   nargs='+', default=[5, 10])
+    parser.add_argument('--nw',      type=int,   default=2000)
+    parser.add_argument('--nc',      type=int,   default=3)
+    parser.add_argument('--deg',     type=float, default=4)
+    parser.add_argument('--n_runs',  type=int,   default=100)
+    parser.add_argument('--seeds',   type=int,   default=5)
+    parser.add_argument('--sparse',  action='store_true')
+    parser.add_argument('--lap',     type=str,   default='padded', choices=['padded', 'sap'])
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    
+    print('nt\tdtype\trecall_planted\tfrac_exact\trecall_node\tsolve_s\tpeak_rss_mb')
+    for nt in args.nt:
+        for dtype in ['float64', 'float32']:
+            res = [run_isolated(dict(
+                graph        = 'er',
+                nw           = args.nw,
+                nt           = nt,
+                nc           = args.nc,
+                deg          = args.deg,
+                n_runs       = args.n_runs,
+                n_node_types = 3,
+                t_density    = 0.2,
+                sparse       = args.sparse,
+                lap          = args.lap,
+                parallel     = 'auto',
+                dtype        = dtype,
+                prune        = False,
+                seed         = seed,
+                rep          = seed,
+            )) for seed in range(args.seeds)]
+            
+            recall_planted = np.mean([r['recall_planted'] for r in res])
+            frac_exact     = np.mean([r['frac_exact']     for r in res])
+            recall_node    = np.mean([r['recall_node']    for r in res])
+            solve          = np.mean([r['time']['solve']  for r in res])
+            peak_rss       = np.mean([r['peak_rss_mb']    for r in res])
+            print(f'{nt}\t{dtype}\t{recall_planted:.3f}\t{frac_exact:.3f}\t{recall_node:.3f}\t{solve:.3f}\t{peak_rss:.1f}')
+            sys.stdout.flush()
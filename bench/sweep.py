@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+"""
+    bench/sweep.py
+    
+    End-to-end scale sweeps on planted synthetic problems (see `bench/synth.py`).
+    
+    One JSON record per configuration x repetition, w/
+        - wall time per phase (generate, filter, node_sim, edge_sim, multiplex, prune, prep_world, solve)
+        - solver counters from `run_mgmmf(..., stats=True)`: per-phase solver time, iterations, exit reasons
+        - peak RSS of the (fresh) worker process
+        - restarts / sec
+        - recall of the planted match, and the fraction of restarts that find some exact match
+    
+    Example:
+        python -m bench.sweep --nw 1000 10000 --nt 5 10 --n_runs 100 --out sweep.jsonl
+"""
+
+import sys
+import json
+import argparse
+import resource
+import itertools
+import numpy as np
+import multiprocessing as mp
+from time import perf_counter
+from contextlib import redirect_stdout
+
+# --
+# CLI
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nt',        type=int,   nargs='+', default=[5])
+    parser.add_argument('--nw',        type=int,   nargs='+', default=[1000])
+    parser.add_argument('--nc',        type=int,   nargs='+', default=[3])
+    parser.add_argument('--deg',       type=float, nargs='+', default=[10])
+    parser.add_argument('--n_runs',    type=int,   nargs='+', default=[100])
+    parser.add_argument('--graph',     type=str,   nargs='+', default=['er'], choices=['er', 'powerlaw'])
+    parser.add_argument('--n_node_types', type=int, default=3)
+    parser.add_argument('--t_density', type=float, default=0.2)
+    parser.add_argument('--sparse',    action='store_true')
+    parser.add_argument('--lap',       type=str,   default='padded', choices=['padded', 'sap'])
+    parser.add_argument('--parallel',  type=str,   default='auto', choices=['auto', 'runs', 'kernel'])
+    parser.add_argument('--dtype',     type=str,   nargs='+', default=['float64'], choices=['float64', 'float32'])
+    parser.add_argument('--prune',     action='store_true')
+    parser.add_argument('--reps',      type=int,   default=1)
+    parser.add_argument('--seed',      type=int,   default=123)
+    parser.add_argument('--out',       type=str,   default=None, help='append JSON lines here (default: stdout)')
+    return parser.parse_args()
+
+# --
+# Helpers
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # kilobytes on linux
+
+
+def run_one(config):
+    """ run a single configuration.  meant to run in a fresh process, so peak RSS is per-configuration """
+    from mgmmf import run_mgmmf, PreparedWorld
+    from mgmmf.prep.helpers import missing_node_edge_filter, arc_consistency_filter
+    from mgmmf.prep.generic_helpers import generic_sim, generic_sim_sparse, make_multiplex
+    from bench.synth import make_problem
+    
+    timings = {}
+    
+    def phase(name, fn, *args, **kwargs):
+        with redirect_stdout(sys.stderr): # keep stdout for JSON records
+            t   = perf_counter()
+            out = fn(*args, **kwargs)
+            timings[name] = perf_counter() - t
+        
+        return out
+    
+    w_node, w_edge, tmplt, truth = phase('generate', make_problem,
+        nt=config['nt'], nw=config['nw'], nc=config['nc'], deg=config['deg'],
+        n_node_types=config['n_node_types'], t_density=config['t_density'],
+        graph=config['graph'], seed=config['seed'],
+    )
+    
+    # same steps as `prep_generic`, each timed once
+    w_edge         = phase('filter', missing_node_edge_filter, w_node, w_edge)
+    nodesim        = phase('node_sim', generic_sim, tmplt['nodedef'], w_node)
+    edgesim        = phase('edge_sim', generic_sim_sparse, tmplt['edgedef'], w_edge)
+    t_adjs, w_adjs = phase('multiplex', make_multiplex, tmplt, w_node, w_edge, edgesim)
+    
+    meta = {}
+    if config['prune']:
+        keep, nodesim  = phase('prune', arc_consistency_filter, t_adjs, w_adjs, nodesim)
+        w_adjs         = {c : a[keep][:, keep] for c, a in w_adjs.items()}
+        meta['w_keep'] = keep
+    
+    world = phase('prep_world', PreparedWorld, w_adjs, dtype=config['dtype'])
+    
+    ind, _, stats = phase('solve', run_mgmmf, t_adjs, world, nodesim,
+        n_runs=config['n_runs'], seed=config['seed'],
+        sparse=config['sparse'], lap=config['lap'], parallel=config['parallel'],
+        dtype=config['dtype'], stats=True,
+    )
+    
+    # runs that are exact matches (every template edge maps to a world edge on the same channel)
+    exact = np.ones(ind.shape[0], dtype=bool)
+    for c in t_adjs.keys():
+        a, b   = t_adjs[c].nonzero()
+        w_adj  = w_adjs[c].tocsr()
+        exact &= (np.asarray(w_adj[ind[:, a].ravel(), ind[:, b].ravel()]).reshape(ind.shape[0], -1) != 0).all(axis=1)
+    
+    if 'w_keep' in meta:
+        ind = np.flatnonzero(meta['w_keep'])[ind]
+    
+    hits = (ind == truth[None]) # run x template node
+    
+    return dict(
+        **config,
+        n_world_edges  = int(w_edge.shape[0]),
+        n_tmplt_edges  = len(tmplt['edgedef']),
+        n_channels     = len(t_adjs),
+        n_cand         = int((nodesim != 0).sum()),
+        time           = timings,
+        wall           = sum(timings.values()),
+        peak_rss_mb    = peak_rss_mb(),
+        restarts_per_s = config['n_runs'] / timings['solve'],
+        solver_us      = stats['phase_us'],                  # summed over restarts + threads
+        n_iter_mean    = float(stats['n_iter'].mean()),
+        n_iter_max     = int(stats['n_iter'].max()),
+        exit_reasons   = {r : int(n) for r, n in zip(*np.unique(stats['exit_reason'], return_counts=True))},
+        recall_node    = float(hits.mean(axis=1).max()),     # best run: fraction of template nodes on the planted match
+        recall_planted = bool(hits.all(axis=1).any()),       # planted match found by some run
+        frac_planted   = float(hits.all(axis=1).mean()),     # fraction of runs that found it
+        frac_exact     = float(exact.mean()),                # fraction of runs that found some exact match
+        n_unique_exact = len(set(map(tuple, ind[exact]))),
+    )
+
+
+def run_isolated(config):
+    ctx = mp.get_context('spawn')
+    with ctx.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(run_one, (config,))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    
+    out = open(args.out, 'a') if args.out is not None else sys.stdout
+    
+    grid = itertools.product(args.graph, args.nw, args.nt, args.nc, args.deg, args.n_runs, args.dtype, range(args.reps))
+    for graph, nw, nt, nc, deg, n_runs, dtype, rep in grid:
+        config = dict(
+            graph        = graph,
+            nw           = nw,
+            nt           = nt,
+            nc           = nc,
+            deg          = deg,
+            n_runs       = n_runs,
+            n_node_types = args.n_node_types,
+            t_density    = args.t_density,
+            sparse       = args.sparse,
+            lap          = args.lap,
+            parallel     = args.parallel,
+            dtype        = dtype,
+            prune        = args.prune,
+            seed         = args.seed + rep,
+            rep          = rep,
+        )
+        
+        res = run_isolated(config)
+        print(json.dumps(res), file=out)
+        out.flush()
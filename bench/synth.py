@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""
+    bench/synth.py
+    
+    Deterministic synthetic worlds + templates, in the format used by `mgmmf.prep.generic`
+        - world   : Erdos-Renyi or power-law (Chung-Lu) directed multiplex graph
+        - template: random connected graph, planted into the world
+    
+    Node types / edge types are the node / edge similarity fields, so a planted template is an
+    exact match in the world.
+"""
+
+import numpy as np
+import pandas as pd
+
+# --
+# World
+
+def world_edges(nw, deg, graph='er', exponent=2.5, rng=None):
+    """ (src, dst) arrays for a directed graph w/ ~`deg` average out-degree and no self-loops """
+    n_edges = int(nw * deg)
+    
+    if graph == 'er':
+        src = rng.integers(0, nw, n_edges)
+        dst = rng.integers(0, nw, n_edges)
+    
+    elif graph == 'powerlaw':
+        # Chung-Lu: endpoints drawn proportional to power-law weights
+        w   = (np.arange(nw) + 1.0) ** (-1 / (exponent - 1))
+        p   = w / w.sum()
+        src = rng.choice(nw, n_edges, p=p)
+        dst = rng.choice(nw, n_edges, p=rng.permutation(p))
+    
+    else:
+        raise Exception(f'!! unsupported graph {graph}')
+    
+    sel = src != dst
+    return src[sel], dst[sel]
+
+
+def template_edges(nt, density, rng):
+    """ (src, dst) arrays for a random connected directed template: random spanning tree + extra edges """
+    order = rng.permutation(nt)
+    src   = [order[rng.integers(0, i)] for i in range(1, nt)]
+    dst   = [order[i]                   for i in range(1, nt)]
+    
+    for i in range(nt):
+        for j in range(nt):
+            if i != j and rng.random() < density:
+                src.append(i)
+                dst.append(j)
+    
+    edges = pd.DataFrame({"src" : src, "dst" : dst}).drop_duplicates()
+    return edges.src.values, edges.dst.values
+
+# --
+# Planted problem
+
+def make_problem(nt=5, nw=1000, nc=3, deg=10, n_node_types=3, t_density=0.2, graph='er', seed=123):
+    """
+        returns
+            w_node, w_edge : world tables (`name`, `node_type` / `node1`, `node2`, `edge_type`)
+            tmplt          : template in `mgmmf.prep.generic` format
+            truth          : (nt,) world row planted for each template node (in `nodedef` order)
+    """
+    rng = np.random.default_rng(seed)
+    
+    node_types = np.array([f'n{i}' for i in range(n_node_types)])
+    edge_types = np.array([f'e{i}' for i in range(nc)])
+    
+    # world
+    w_type   = rng.integers(0, n_node_types, nw)
+    src, dst = world_edges(nw, deg, graph=graph, rng=rng)
+    e_type   = rng.integers(0, nc, src.shape[0])
+    
+    # template
+    t_type       = rng.integers(0, n_node_types, nt)
+    t_src, t_dst = template_edges(nt, t_density, rng)
+    t_etype      = rng.integers(0, nc, t_src.shape[0])
+    
+    # plant
+    truth         = rng.choice(nw, nt, replace=False)
+    w_type[truth] = t_type
+    
+    src    = np.hstack([src, truth[t_src]])
+    dst    = np.hstack([dst, truth[t_dst]])
+    e_type = np.hstack([e_type, t_etype])
+    
+    w_node = pd.DataFrame({
+        "name"      : np.arange(nw),
+        "node_type" : node_types[w_type],
+    })
+    
+    w_edge = pd.DataFrame({
+        "node1"     : src,
+        "node2"     : dst,
+        "edge_type" : edge_types[e_type],
+    })
+    
+    def _exact(field, value):
+        return [{"field_name" : field, "function" : {"type" : "exact", "values" : [value]}}]
+    
+    tmplt = {
+        "nodedef" : [
+            {
+                "template_id"  : f'TemplateNode{i}',
+                "importance"   : 1,
+                "similarities" : _exact('node_type', node_types[t_type[i]]),
+            } for i in range(nt)
+        ],
+        "edgedef" : [
+            {
+                "template_id"  : f'TemplateEdge{k}',
+                "importance"   : 1,
+                "node1"        : f'TemplateNode{t_src[k]}',
+                "node2"        : f'TemplateNode{t_dst[k]}',
+                "similarities" : _exact('edge_type', edge_types[t_etype[k]]),
+            } for k in range(t_src.shape[0])
+        ],
+    }
+    
+    return w_node, w_edge, tmplt, truth
@@ -10,5 +10,5 @@ cd build
 cmake ..
 make -j12 VERBOSE=1
 cd ..
-mv build/_mgmmf_cpp.so mgmmf/_mgmmf_cpp.so
+mv build/_mgmmf_cpp*.so mgmmf/
 rm -rf build
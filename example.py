@@ -145,13 +145,12 @@ print('nodesim.shape: ', nodesim.shape)
 # --
 # Run match
 
-cands, elapsed = run_mgmmf(t_adjs, w_adjs, nodesim, n_runs=1000, seed=567)
+matches, elapsed = run_mgmmf(t_adjs, w_adjs, nodesim, n_runs=1000, seed=567, unique=True)
 
 # --
 # Verify
 
-cands = w_node.name.values[cands]
-cands = pd.DataFrame(cands).drop_duplicates().values
+cands = w_node.name.values[matches.ind] # unique, best objective first
 
 T = nx.DiGraph()
 for node in tmplt['nodedef']:
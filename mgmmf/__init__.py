@@ -1 +1,2 @@
-from .mgmmf import run_mgmmf
\ No newline at end of file
+from .mgmmf import run_mgmmf, PreparedWorld, set_stats_hook, Matches, STATS_PHASES, EXIT_REASONS
+from .jobs import submit, run_mgmmf_async, stream_mgmmf, MGMMFJob, MGMMFStream
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+
+"""
+  mgmmf/io_helpers.py
+"""
+
+import io
+import os
+import numpy as np
+import pandas as pd
+from joblib import dump, load
+from scipy import sparse as sp
+
+# --
+# Binary CSR format
+#
+#   Like `csr_t::read` in `src/data.h`, but each array starts on an 8-byte boundary so it can be
+#   memory-mapped and handed to the C++ core w/o a copy:
+#
+#     magic    : 8 bytes, b'MGMMFCSR'
+#     header   : int64[6] = [indptr itemsize, indices itemsize, data itemsize, nrow, ncol, nnz]
+#     indptr   : (nrow + 1) ints, zero-padded to a multiple of 8 bytes
+#     indices  : nnz ints, zero-padded to a multiple of 8 bytes
+#     data     : nnz floats
+
+_CSR_MAGIC   = b'MGMMFCSR'
+_INT_DTYPES  = {4 : np.int32,   8 : np.int64}
+_VAL_DTYPES  = {4 : np.float32, 8 : np.float64}
+
+def _pad8(n):
+  return (8 - n % 8) % 8
+
+
+def save_csr(path, X):
+  X = sp.csr_matrix(X)
+  X.sort_indices()
+
+  nrow, ncol = X.shape
+  header     = np.array([
+    X.indptr.itemsize,
+    X.indices.itemsize,
+    X.data.itemsize,
+    nrow,
+    ncol,
+    X.nnz,
+  ], dtype=np.int64)
+
+  with open(path, 'wb') as f:
+    f.write(_CSR_MAGIC)
+    f.write(header.tobytes())
+    for arr in [X.indptr, X.indices, X.data]:
+      arr = np.ascontiguousarray(arr)
+      f.write(arr.tobytes())
+      f.write(b'\x00' * _pad8(arr.nbytes))
+
+
+def load_csr(path, mmap=True):
+  """ load a matrix written by `save_csr`.  w/ `mmap=True`, arrays are read-only views of the file. """
+  with open(path, 'rb') as f:
+    magic  = f.read(len(_CSR_MAGIC))
+    assert magic == _CSR_MAGIC, f'load_csr: {path} is not an mgmmf CSR file'
+    header = np.frombuffer(f.read(6 * 8), dtype=np.int64)
+
+  ptr_size, idx_size, val_size, nrow, ncol, nnz = [int(x) for x in header]
+
+  specs = [
+    (_INT_DTYPES[ptr_size], nrow + 1),
+    (_INT_DTYPES[idx_size], nnz),
+    (_VAL_DTYPES[val_size], nnz),
+  ]
+
+  offset = len(_CSR_MAGIC) + header.nbytes
+  arrs   = []
+  for dtype, n in specs:
+    if mmap and n > 0:
+      arr = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(n,))
+    else:
+      arr = np.fromfile(path, dtype=dtype, count=n, offset=offset)
+
+    arrs.append(arr)
+    offset += n * np.dtype(dtype).itemsize
+    offset += _pad8(n * np.dtype(dtype).itemsize)
+
+  indptr, indices, data = arrs
+
+  # set the arrays directly -- the (data, indices, indptr) constructor downcasts int64 indices to
+  # int32 when they fit, which copies them out of the map (and hides them from the 64-bit core)
+  X = sp.csr_matrix((nrow, ncol), dtype=data.dtype)
+  X.data, X.indices, X.indptr = data, indices, indptr
+  X.has_sorted_indices = True # written sorted -- don't let scipy touch read-only arrays
+  return X
+
+# --
+# Prep outputs
+
+def save_prep(outdir, t_adjs, w_adjs, nodesim, meta, pickle_world=False):
+  """
+    write outputs of `mgmmf.prep` -- pickles, plus the stacked world in binary CSR format.
+    `pickle_world=True` also writes the per-channel world adjacencies to `w_adjs.pkl` (not read by
+    `load_prep`; doubles disk use for large worlds).
+  """
+  from mgmmf.mgmmf import PreparedWorld
+
+  os.makedirs(outdir, exist_ok=True)
+
+  _ = dump(t_adjs, os.path.join(outdir, 't_adjs.pkl'))
+  _ = dump(meta,   os.path.join(outdir, 'meta.pkl'))
+  if pickle_world:
+    _ = dump(w_adjs, os.path.join(outdir, 'w_adjs.pkl'))
+
+  PreparedWorld(w_adjs).save(os.path.join(outdir, 'world'))
+
+  np.save(os.path.join(outdir, 'nodesim.npy'), nodesim)
+
+
+def load_prep(outdir, mmap=True):
+  """
+    load outputs of `save_prep`, w/ the world as a memory-mapped `PreparedWorld`.  Pages are
+    shared between processes that load the same files.
+  """
+  from mgmmf.mgmmf import PreparedWorld
+
+  t_adjs  = load(os.path.join(outdir, 't_adjs.pkl'))
+  meta    = load(os.path.join(outdir, 'meta.pkl'))
+  world   = PreparedWorld.load(os.path.join(outdir, 'world'), mmap=mmap)
+  nodesim = np.load(os.path.join(outdir, 'nodesim.npy'), mmap_mode='r' if mmap else None)
+
+  return t_adjs, world, nodesim, meta
+
+# --
+# GDF
+
+_GDF_BLOCK = 1 << 24
+
+_GDF_TYPES = {
+  'varchar'  : 'string',
+  'char'     : 'string',
+  'string'   : 'string',
+  'text'     : 'string',
+  'double'   : 'float',
+  'float'    : 'float',
+  'real'     : 'float',
+  'int'      : 'int',
+  'integer'  : 'int',
+  'tinyint'  : 'int',
+  'smallint' : 'int',
+  'bigint'   : 'int',
+  'long'     : 'int',
+  'boolean'  : 'bool',
+  'bool'     : 'bool',
+}
+
+_PD_DTYPES = {'string' : object, 'float' : np.float64, 'int' : 'Int64', 'bool' : 'boolean'}
+
+
+class _GdfSection(io.RawIOBase):
+  """
+    read-only stream over one section of a GDF file -- stops before the `stop` header line (matched
+    case-insensitively), or at EOF if `stop=None`
+  """
+  def __init__(self, f, prefix=b'', stop=b'\nedgedef>'):
+    self.f       = f
+    self.buf     = prefix
+    self.stop    = stop.lower() if stop is not None else None
+    self.done    = False
+    self.rest    = None # bytes read past the end of the section
+    self.scanned = 0    # prefix of `buf` already searched for `stop`
+  
+  def readable(self):
+    return True
+  
+  def _split(self):
+    if self.stop is None:
+      return
+    
+    # lower-cased copy of the unsearched tail (+ overlap, for a header split across blocks)
+    start = max(0, self.scanned - len(self.stop) + 1)
+    k     = self.buf[start:].lower().find(self.stop)
+    if k >= 0:
+      k += start
+      self.buf, self.rest = self.buf[:k + 1], self.buf[k + 1:]
+      self.done = True
+    
+    self.scanned = len(self.buf)
+  
+  def readinto(self, b):
+    margin = len(self.stop) if self.stop is not None else 0
+    while not self.done and len(self.buf) < len(b) + margin:
+      block = self.f.read(_GDF_BLOCK)
+      if not block:
+        break
+      
+      self.buf += block
+      self._split()
+    
+    if not self.done:
+      self._split()
+    
+    n = min(len(b), len(self.buf))
+    b[:n] = self.buf[:n]
+    self.buf     = self.buf[n:]
+    self.scanned = max(0, self.scanned - n)
+    return n
+
+
+def _parse_gdf_header(line):
+  """ 'nodedef>name VARCHAR,rdf:type VARCHAR,...' -> [(column, type)], w/ ':' in names replaced by '_' """
+  _, cols = line.strip().split('>', 1)
+  
+  out = []
+  for col in cols.split(','):
+    tokens = col.strip().split()
+    name   = tokens[0].replace(':', '_')
+    typ    = _GDF_TYPES.get(tokens[1].lower(), 'string') if len(tokens) > 1 else 'string'
+    out.append((name, typ))
+  
+  return out
+
+
+def _read_gdf_line(f, prefix=b''):
+  buf = prefix
+  while b'\n' not in buf:
+    block = f.read(_GDF_BLOCK)
+    if not block:
+      break
+    buf += block
+  
+  line, _, rest = buf.partition(b'\n')
+  return line.decode(), rest
+
+
+def _gdf_chunks(section, schema, chunksize):
+  names = [name for name, _ in schema]
+  dtype = {name : _PD_DTYPES[typ] for name, typ in schema}
+  
+  try:
+    reader = pd.read_csv(
+      io.BufferedReader(section, buffer_size=_GDF_BLOCK),
+      header=None,
+      names=names,
+      dtype=dtype,
+      quotechar="'",
+      skipinitialspace=True,
+      chunksize=chunksize,
+    )
+  except pd.errors.EmptyDataError:
+    yield pd.DataFrame({name : pd.Series([], dtype=dtype[name]) for name in names})
+    return
+  
+  for chunk in reader:
+    yield chunk
+
+
+def iter_gdf(path, chunksize=1000000):
+  """
+    stream a GDF file as ('node' | 'edge', DataFrame) chunks, w/ dtypes from the GDF column types.
+    the file is read in blocks, so the full text is never held in memory.
+  """
+  with open(path, 'rb') as f:
+    line, rest = _read_gdf_line(f)
+    assert line.lower().startswith('nodedef>'), f'iter_gdf: {path} does not start w/ nodedef>'
+    node_schema = _parse_gdf_header(line)
+    
+    # leading newline, so an `edgedef>` header right after `nodedef>` (no nodes) still ends the section
+    section = _GdfSection(f, prefix=b'\n' + rest)
+    for chunk in _gdf_chunks(section, node_schema, chunksize):
+      yield 'node', chunk
+    
+    if section.rest is None:
+      return
+    
+    line, rest  = _read_gdf_line(f, section.rest)
+    edge_schema = _parse_gdf_header(line)
+    
+    section = _GdfSection(f, prefix=rest, stop=None)
+    for chunk in _gdf_chunks(section, edge_schema, chunksize):
+      yield 'edge', chunk
+
+
+def load_gdf(path, chunksize=1000000):
+  """ load a GDF file as (nodes, edges) DataFrames """
+  chunks = {'node' : [], 'edge' : []}
+  for kind, chunk in iter_gdf(path, chunksize=chunksize):
+    chunks[kind].append(chunk)
+  
+  df_node = pd.concat(chunks['node'], ignore_index=True) if chunks['node'] else pd.DataFrame()
+  df_edge = pd.concat(chunks['edge'], ignore_index=True) if chunks['edge'] else pd.DataFrame()
+  return df_node, df_edge
+
+
+def gdf2feather(path, node_path, edge_path, chunksize=1000000, drop=()):
+  """
+    convert a GDF file to two feather files, one record batch per chunk, w/o materializing either table.
+    `drop` columns are skipped.
+  """
+  import pyarrow as pa
+  
+  arrow_types = {'object' : pa.string(), 'float64' : pa.float64(), 'Int64' : pa.int64(), 'boolean' : pa.bool_()}
+  
+  writers = {}
+  schemas = {}
+  paths   = {'node' : node_path, 'edge' : edge_path}
+  try:
+    for kind, chunk in iter_gdf(path, chunksize=chunksize):
+      chunk = chunk.drop(columns=[c for c in drop if c in chunk.columns])
+      if kind not in writers:
+        # fixed schema from the GDF types, so all-null chunks don't change column types
+        schemas[kind] = pa.schema([(c, arrow_types[str(t)]) for c, t in chunk.dtypes.items()])
+        writers[kind] = pa.ipc.new_file(paths[kind], schemas[kind])
+      
+      batch = pa.RecordBatch.from_pandas(chunk, schema=schemas[kind], preserve_index=False)
+      writers[kind].write_batch(batch)
+  finally:
+    for writer in writers.values():
+      writer.close()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+"""
+  mgmmf/jobs.py
+  
+  Non-blocking `run_mgmmf`.  `_mgmmf_cpp` releases the GIL, so jobs run in a background
+  thread while the caller (eg, an asyncio event loop) keeps going.
+"""
+
+import asyncio
+import numpy as np
+from time import time, sleep
+from concurrent.futures import ThreadPoolExecutor
+
+from mgmmf.mgmmf import _mgmmf_args, _mgmmf_core, _run_stats, _emit_stats, Matches
+
+_executor = None
+
+def _default_executor():
+  # Jobs already use every OpenMP thread, so by default they run one at a time
+  global _executor
+  if _executor is None:
+    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mgmmf')
+  
+  return _executor
+
+
+class MGMMFJob:
+  """
+    Handle for a background `run_mgmmf` job.  Returned by `submit`.
+    
+      job.result()  -> (ind, elapsed), like `run_mgmmf`.  After `cancel`, `ind` only has the completed restarts.
+                       Submitted w/ `unique=True`, `ind` is a `Matches` over the completed restarts, and
+                       `stream` / `astream` aren't available.
+      job.cancel()  -> skip restarts that haven't started yet
+      job.stats     -> solver stats (see `run_mgmmf`) once the job is done, if submitted w/ `stats=True`
+                       or while a stats hook is set.  Otherwise None.
+      job.stream()  -> iterate over (run_id, ind[run_id]) as restarts finish
+      await job     -> same as job.result(), w/o blocking the event loop
+  """
+  def __init__(self, args, executor=None):
+    self.n_runs  = args['n_runs']
+    self.unique  = args['unique']
+    self.ind     = args['ind'].reshape(self.n_runs, -1)
+    self.elapsed = None
+    self.stats   = None
+    
+    self._done   = np.zeros(self.n_runs, dtype=np.int8)
+    self._cancel = np.zeros(1, dtype=np.int8)
+    
+    args = dict(args, done=self._done, cancel=self._cancel)
+    
+    executor    = executor if executor is not None else _default_executor()
+    self.future = executor.submit(self._run, args)
+  
+  def _run(self, args):
+    t = time()
+    out = _mgmmf_core(args)(**args)
+    self.elapsed = time() - t
+    
+    if 'stats_iter' in args:
+      self.stats = _run_stats(args, self.elapsed)
+      _emit_stats(self.stats)
+    
+    if self.unique:
+      return Matches(*out), self.elapsed
+    
+    return self.ind[self.completed], self.elapsed
+  
+  @property
+  def completed(self):
+    """ boolean mask of restarts that have finished """
+    return self._done.astype(bool)
+  
+  def cancel(self):
+    # Only set the flag: a job that hasn't started yet still runs, skips every restart, and returns
+    # an empty `ind` -- cancelling the future would make `result` raise instead
+    self._cancel[0] = 1
+    return not self.future.done()
+  
+  def cancelled(self):
+    return bool(self._cancel[0])
+  
+  def done(self):
+    return self.future.done()
+  
+  def result(self, timeout=None):
+    return self.future.result(timeout=timeout)
+  
+  def _new_completed(self, seen):
+    assert not self.unique, 'MGMMFJob: per-restart assignments aren\'t kept w/ `unique=True`'
+    new = np.flatnonzero(self.completed & ~seen)
+    seen[new] = True
+    return [(run_id, self.ind[run_id].copy()) for run_id in new]
+  
+  def stream(self, poll_interval=0.05):
+    seen = np.zeros(self.n_runs, dtype=bool)
+    while not self.future.done():
+      yield from self._new_completed(seen)
+      sleep(poll_interval)
+    
+    self.future.result() # raise errors, if any
+    yield from self._new_completed(seen)
+  
+  async def astream(self, poll_interval=0.05):
+    seen = np.zeros(self.n_runs, dtype=bool)
+    while not self.future.done():
+      for x in self._new_completed(seen):
+        yield x
+      
+      await asyncio.sleep(poll_interval)
+    
+    self.future.result()
+    for x in self._new_completed(seen):
+      yield x
+  
+  def __await__(self):
+    return asyncio.wrap_future(self.future).__await__()
+
+
+def submit(t_adjs, w_adjs, nodesim, executor=None, **kwargs):
+  """ start `run_mgmmf(t_adjs, w_adjs, nodesim, **kwargs)` in the background, and return an `MGMMFJob` """
+  args = _mgmmf_args(t_adjs, w_adjs, nodesim, **kwargs)
+  return MGMMFJob(args, executor=executor)
+
+
+async def run_mgmmf_async(t_adjs, w_adjs, nodesim, executor=None, **kwargs):
+  """ `run_mgmmf`, w/o blocking the event loop """
+  return await submit(t_adjs, w_adjs, nodesim, executor=executor, **kwargs)
+
+
+class MGMMFStream:
+  """
+    Iterate over restarts of a background job as they finish, keeping the set of unique matches.
+    Remaining restarts are cancelled once
+      - `patience` consecutive restarts add no new unique match, or
+      - `max_unique` unique matches have been found
+    
+      for run_id, ind, is_new in stream: ...
+      stream.matches()     -> (n_unique, nt) array of unique matches, in the order they were found
+      stream.hits()        -> number of restarts that found each match
+      stream.stop_reason   -> 'patience', 'max_unique', or 'exhausted'
+  """
+  def __init__(self, job, patience=None, max_unique=None, poll_interval=0.05):
+    self.job           = job
+    self.patience      = patience
+    self.max_unique    = max_unique
+    self.poll_interval = poll_interval
+    
+    self.stop_reason   = None
+    self.n_seen        = 0
+    self._unique       = {}
+    self._stale        = 0
+  
+  def _add(self, ind):
+    key    = ind.tobytes()
+    is_new = key not in self._unique
+    if is_new:
+      self._unique[key] = [ind, 0]
+      self._stale       = 0
+    else:
+      self._stale += 1
+    
+    self._unique[key][1] += 1
+    self.n_seen          += 1
+    return is_new
+  
+  def _should_stop(self):
+    if self.patience is not None and self._stale >= self.patience:
+      self.stop_reason = 'patience'
+    elif self.max_unique is not None and len(self._unique) >= self.max_unique:
+      self.stop_reason = 'max_unique'
+    
+    return self.stop_reason is not None
+  
+  def _finish(self):
+    if self.stop_reason is None:
+      self.stop_reason = 'exhausted'
+    
+    self.job.cancel()
+    self.job.result() # wait for in-flight restarts to wind down
+  
+  def __iter__(self):
+    try:
+      for run_id, ind in self.job.stream(poll_interval=self.poll_interval):
+        is_new = self._add(ind)
+        yield run_id, ind, is_new
+        if self._should_stop():
+          break
+    finally:
+      self._finish()
+  
+  async def __aiter__(self):
+    try:
+      async for run_id, ind in self.job.astream(poll_interval=self.poll_interval):
+        is_new = self._add(ind)
+        yield run_id, ind, is_new
+        if self._should_stop():
+          break
+    finally:
+      self.job.cancel()
+      if self.stop_reason is None:
+        self.stop_reason = 'exhausted'
+      
+      await self.job
+  
+  def matches(self):
+    return np.array([ind for ind, _ in self._unique.values()]).reshape(-1, self.job.ind.shape[1])
+  
+  def hits(self):
+    return np.array([hits for _, hits in self._unique.values()])
+
+
+def stream_mgmmf(t_adjs, w_adjs, nodesim, patience=None, max_unique=None, poll_interval=0.05, executor=None, **kwargs):
+  """ start `run_mgmmf(t_adjs, w_adjs, nodesim, **kwargs)` in the background, and return an `MGMMFStream` over its restarts """
+  job = submit(t_adjs, w_adjs, nodesim, executor=executor, **kwargs)
+  return MGMMFStream(job, patience=patience, max_unique=max_unique, poll_interval=poll_interval)
@@ -1,13 +1,79 @@
 #!/usr/bin/env python
 
+import os
+import sys
+import json
+import importlib
 import numpy as np
+from collections import namedtuple
 import pandas as pd
 from time import time
 from scipy import sparse as sp
 
 from mgmmf._mgmmf_cpp import _mgmmf_cpp
+from mgmmf.io_helpers import save_csr, load_csr
 
-def _prep_adjs(X, dim):
+_INT32_MAX = np.iinfo(np.int32).max
+
+def _mgmmf_core(args):
+  """ C++ entry point matching the index width / value type of `args` (see `_mgmmf_args`) """
+  index64 = args['ind'].dtype == np.int64
+  float32 = args['sim_data'].dtype == np.float32
+  
+  if not index64 and not float32:
+    return _mgmmf_cpp
+  
+  name   = '_mgmmf_cpp' + ('64' if index64 else '') + ('_f32' if float32 else '')
+  module = importlib.import_module(f'mgmmf.{name}')
+  return module._mgmmf_cpp
+
+
+# --
+# Instrumentation
+
+STATS_PHASES = ('init', 'grad', 'lap', 'update', 'step', 'round', 'score') # `stats_phase_t` in src/mgmmf.h
+EXIT_REASONS = ('converged', 'max_iter', 'pruned', 'skipped')             # `exit_reason_t`, + restarts that never ran
+
+_stats_hook = None
+
+# Output of `run_mgmmf(..., unique=True)`: unique assignments, sorted by best objective
+Matches = namedtuple('Matches', ['ind', 'hits', 'score'])
+
+def set_stats_hook(hook):
+  """
+    call `hook(stats)` after every `run_mgmmf` / background job, w/ the dict described in `run_mgmmf`.
+    while a hook is set, stats are collected for every call.  `None` removes it.  Returns the previous hook.
+  """
+  global _stats_hook
+  prev, _stats_hook = _stats_hook, hook
+  return prev
+
+
+def _run_stats(args, elapsed):
+  exit_code = args['stats_exit']
+  return {
+    "n_runs"      : args['n_runs'],
+    "elapsed"     : elapsed,
+    "n_iter"      : args['stats_iter'],
+    "exit"        : exit_code,
+    "exit_reason" : np.array(EXIT_REASONS)[exit_code], # -1 -> 'skipped'
+    "objective"   : args['score'],
+    "phase_us"    : dict(zip(STATS_PHASES, args['stats_phase_us'].tolist())),
+  }
+
+
+def _emit_stats(stats):
+  hook = _stats_hook
+  if hook is None:
+    return
+  
+  try:
+    hook(stats)
+  except Exception as e:
+    print(f'!! mgmmf: stats hook failed: {e!r}', file=sys.stderr)
+
+
+def _prep_adjs(X, dim, dtype=np.float64):
   X   = {k:v             for k,(_,v) in enumerate(X.items())}
   Xt  = {k:v.T.tocsr()   for k,(_,v) in enumerate(X.items())}
 
@@ -19,13 +85,56 @@ def _prep_adjs(X, dim):
     X  = sp.hstack(list(X.values())).tocsr()
     Xt = sp.hstack(list(Xt.values())).tocsr()
 
-  X.data  = X.data.astype(np.float64)
-  Xt.data = Xt.data.astype(np.float64)
+  X.data  = X.data.astype(dtype, copy=False)
+  Xt.data = Xt.data.astype(dtype, copy=False)
+  
+  # kernels assume sorted column indices
+  X.sort_indices()
+  Xt.sort_indices()
   
   return X, Xt
 
 
-def run_mgmmf(
+class PreparedWorld:
+  """
+    World multiplex graph, stacked (B) and transposed (Bt) once, so it can be reused across many
+    `run_mgmmf` calls w/o repeating the O(|E_world|) prep.  Pass in place of `w_adjs`.
+  """
+  def __init__(self, w_adjs, dtype=np.float64):
+    self.nc = len(w_adjs)
+    self.nw = w_adjs[0].shape[0]
+    
+    # store as `dtype` to avoid a per-call conversion w/ `run_mgmmf(..., dtype='float32')`
+    self.B, self.Bt = _prep_adjs(w_adjs, dim=0, dtype=dtype)
+    
+    assert self.nw * self.nc == self.B.shape[0]
+    assert self.nw           == self.B.shape[1]
+  
+  def __len__(self):
+    return self.nc
+  
+  def save(self, path):
+    os.makedirs(path, exist_ok=True)
+    save_csr(os.path.join(path, 'B.csr'),  self.B)
+    save_csr(os.path.join(path, 'Bt.csr'), self.Bt)
+    with open(os.path.join(path, 'world.json'), 'w') as f:
+      json.dump({"nw" : self.nw, "nc" : self.nc}, f)
+  
+  @classmethod
+  def load(cls, path, mmap=True):
+    """ load a world written by `save`.  w/ `mmap=True`, B / Bt are memory-mapped and never copied. """
+    with open(os.path.join(path, 'world.json')) as f:
+      info = json.load(f)
+    
+    world    = cls.__new__(cls)
+    world.nw = info['nw']
+    world.nc = info['nc']
+    world.B  = load_csr(os.path.join(path, 'B.csr'),  mmap=mmap)
+    world.Bt = load_csr(os.path.join(path, 'Bt.csr'), mmap=mmap)
+    return world
+
+
+def _mgmmf_args(
   t_adjs,
   w_adjs,
   nodesim,
@@ -35,17 +144,36 @@ def run_mgmmf(
   scale_init=False,
   scale_sim=False,
   scale_grad=False,
+  scale_epoch=None,
   init_doublestochastic=True,
+  sparse=False,
+  parallel='auto',
+  lap='padded',
+  dtype='float64',
+  stats=False,
+  unique=False,
+  prune_margin=None,
+  prune_target=None,
+  prune_after=8,
 ):
+  """ prepare keyword arguments for `_mgmmf_cpp` (see `run_mgmmf` for parameters) """
+  
+  world = w_adjs if isinstance(w_adjs, PreparedWorld) else PreparedWorld(w_adjs)
   
   nt = t_adjs[0].shape[0]
-  nw = w_adjs[0].shape[0]
+  nw = world.nw
   
-  assert len(t_adjs) == len(w_adjs)
+  assert len(t_adjs) == world.nc
   nc = len(t_adjs)
   
-  A, At = _prep_adjs(t_adjs, dim=1)
-  B, Bt = _prep_adjs(w_adjs, dim=0)
+  assert parallel in ['auto', 'runs', 'kernel']
+  assert lap in ['padded', 'sap']
+  
+  assert dtype in ['float64', 'float32', np.float64, np.float32]
+  val_dtype = np.dtype(dtype).type
+  
+  A, At = _prep_adjs(t_adjs, dim=1, dtype=val_dtype)
+  B, Bt = world.B, world.Bt
   
   print(nt, nw, nc)
   
@@ -56,18 +184,70 @@ def run_mgmmf(
   assert nt      == nodesim.shape[0]
   assert nw      == nodesim.shape[1]
 
-  nodesim    = np.ascontiguousarray(nodesim.astype(np.float64))
-  nodesim_sp = sp.csr_matrix(nodesim)
+  if sparse:
+    # own copy -- `eliminate_zeros` / `sort_indices` and `scale_init` would otherwise modify the caller's matrix
+    nodesim_sp = sp.csr_matrix(nodesim, dtype=val_dtype, copy=True)
+    nodesim_sp.eliminate_zeros()
+    nodesim_sp.sort_indices()
+    nodesim    = None
+  else:
+    if sp.issparse(nodesim):
+      nodesim = nodesim.toarray()
+    
+    # `scale_sim` modifies `nodesim` in place, so it needs its own copy
+    nodesim    = np.ascontiguousarray(nodesim.astype(val_dtype, copy=scale_sim))
+    nodesim_sp = sp.csr_matrix(nodesim)
 
-  n_single_cand = ((nodesim != 0).sum(axis=0) == 1).sum()
+  # 64-bit indices if any CSR offset / dense offset would overflow int32, or if the world already
+  # has int64 indices (eg, large scipy matrices, memory-mapped worlds), so it's used w/o a copy.
+  index64 = (
+    max(A.nnz, B.nnz, nodesim_sp.nnz, nt * nw, nw * nc, nt * nc) > _INT32_MAX or
+    (B.indptr.dtype == np.int64 and B.indices.dtype == np.int64)
+  )
+  idx_dtype = np.int64 if index64 else np.int32
+  
+  def _idx(x):
+    return x.astype(idx_dtype, copy=False)
+  
+  def _val(x):
+    return x.astype(val_dtype, copy=False)
+  
+  if prune_margin is not None:
+    assert 0 <= prune_margin < 1, 'run_mgmmf: `prune_margin` should be in [0, 1)'
+  
+  if prune_target == 'exact':
+    # lower bound on the objective of any exact match: every template edge lands on a world edge of
+    # weight >= min(B), and every template node on a world node it can be assigned to (any node when
+    # dense, a candidate when sparse) w/ similarity >= that row's minimum.  Restarts whose LAP solution
+    # is an exact match are never pruned, but restarts still heading towards one can be
+    edge_score = A.data.sum() * (B.data.min() if B.nnz > 0 else 0)
+    if sparse:
+      has_cand  = np.diff(nodesim_sp.indptr) > 0
+      sim_score = np.minimum.reduceat(nodesim_sp.data, nodesim_sp.indptr[:-1][has_cand]).sum() if has_cand.any() else 0
+    else:
+      sim_score = nodesim.min(axis=1).sum()
+    
+    prune_target = float(edge_score + sim_score)
+  
+  n_single_cand = (nodesim_sp.getnnz(axis=0) == 1).sum()
   if n_single_cand > 0:
     print('!! run_mgmmf: Only one candidate for some world nodes.  Forcing `init_doublestochastic=False` ...')
     init_doublestochastic = False
 
-  ind    = np.zeros(n_runs * nt, dtype=np.int32)
+  # w/ `unique`, assignments are deduplicated in the core and never written to `ind`
+  ind    = np.zeros(0 if unique else n_runs * nt, dtype=idx_dtype)
   
-  t = time()
-  _mgmmf_cpp(
+  if stats or _stats_hook is not None:
+    stats_args = dict(
+      stats_iter     = np.zeros(n_runs, dtype=idx_dtype),
+      stats_exit     = np.full(n_runs, -1, dtype=np.int8),
+      stats_phase_us = np.zeros(len(STATS_PHASES), dtype=np.int64),
+      score          = np.full(n_runs, np.nan),
+    )
+  else:
+    stats_args = {}
+  
+  return dict(
     ind         = ind,
     
     nc          = nc,
@@ -78,27 +258,27 @@ def run_mgmmf(
     B_nnz       = B.nnz,
     sim_nnz     = nodesim_sp.nnz,
 
-    A_indptr    = A.indptr,
-    A_indices   = A.indices,
+    A_indptr    = _idx(A.indptr),
+    A_indices   = _idx(A.indices),
     A_data      = A.data,
 
-    At_indptr   = At.indptr,
-    At_indices  = At.indices,
+    At_indptr   = _idx(At.indptr),
+    At_indices  = _idx(At.indices),
     At_data     = At.data,
 
-    B_indptr    = B.indptr,
-    B_indices   = B.indices,
-    B_data      = B.data,
+    B_indptr    = _idx(B.indptr),
+    B_indices   = _idx(B.indices),
+    B_data      = _val(B.data),
 
-    Bt_indptr   = Bt.indptr,
-    Bt_indices  = Bt.indices,
-    Bt_data     = Bt.data,
+    Bt_indptr   = _idx(Bt.indptr),
+    Bt_indices  = _idx(Bt.indices),
+    Bt_data     = _val(Bt.data),
 
-    sim_indptr  = nodesim_sp.indptr,
-    sim_indices = nodesim_sp.indices,
+    sim_indptr  = _idx(nodesim_sp.indptr),
+    sim_indices = _idx(nodesim_sp.indices),
     sim_data    = nodesim_sp.data,
 
-    sim_dense   = nodesim.ravel(),
+    sim_dense   = nodesim.ravel() if nodesim is not None else None,
 
     P_ex_indptr  = None,
     P_ex_indices = None,
@@ -111,12 +291,120 @@ def run_mgmmf(
     scale_init=scale_init,
     scale_sim=scale_sim,
     scale_grad=scale_grad,
+    scale_epoch=scale_epoch if scale_epoch is not None else 0,
     
     init_doublestochastic=init_doublestochastic,
 
     n_runs = n_runs,
+    
+    sparse = sparse,
+    
+    parallel = parallel,
+    lap      = lap,
+    
+    unique   = unique,
+    
+    prune_margin = prune_margin,
+    prune_target = prune_target,
+    prune_after  = prune_after,
+    
+    **stats_args,
+  )
+
+
+def run_mgmmf(
+  t_adjs,
+  w_adjs,
+  nodesim,
+  n_runs=1,
+  seed=123,
+  scale_eps=1,
+  scale_init=False,
+  scale_sim=False,
+  scale_grad=False,
+  scale_epoch=None,
+  init_doublestochastic=True,
+  sparse=False,
+  parallel='auto',
+  lap='padded',
+  dtype='float64',
+  stats=False,
+  unique=False,
+  prune_margin=None,
+  prune_target=None,
+  prune_after=8,
+):
+  """
+    w_adjs: dict of world adjacency matrices, or a `PreparedWorld` (reused across calls)
+    scale_epoch: w/ diversity scaling (`scale_eps != 1` and one of `scale_init` / `scale_sim` / `scale_grad`),
+      restarts run in parallel epochs of this size.  Restarts in an epoch see the same scaling state,
+      which is updated between epochs.  Defaults to the number of threads; 1 reproduces serial behavior.
+    sparse: candidate-restricted mode.  Gradients / Z products are only kept on the sparsity
+      pattern of `nodesim` (which may be a scipy.sparse matrix), so memory and per-iteration work
+      scale w/ the number of candidates instead of `nt * nw`.  Template nodes are only assigned
+      to their candidates.
+    parallel: 'runs' runs one restart per thread.  'kernel' runs restarts one at a time and
+      parallelizes the kernels inside each restart (lower latency when `n_runs` is small).
+      'auto' picks 'kernel' when `n_runs` is smaller than the number of threads.
+    lap: 'padded' solves each LAP w/ dense lapjv on the (n + u) x (n + u) padded top-k problem.
+      'sap' uses shortest augmenting paths on the n x u candidate graph (much faster for large templates).
+    dtype: 'float32' halves the memory / bandwidth of the work buffers and world graph (traces are still
+      accumulated in double).  Build the `PreparedWorld` w/ `dtype=np.float32` to avoid converting it per call.
+    unique: deduplicate assignments in the core, and return a `Matches(ind, hits, score)` in place of `ind`:
+      the unique assignments, the number of restarts that found each, and the best objective of each, sorted
+      by best objective.  Memory is O(n_unique * nt) instead of O(n_runs * nt).  Objectives use the
+      similarities each restart saw, so w/ `scale_sim` they include the diversity scaling.
+    prune_margin: abandon restarts that fall behind.  After `prune_after` iterations, a restart stops once
+      its optimistic objective -- the linearized objective maximized by the LAP step (objective + Frank-Wolfe
+      gap), or the LAP solution's own objective if higher -- is below `(1 - prune_margin) * reference`.  The
+      reference is `prune_target` if given, else the best final objective of any restart so far (shared
+      between threads).  Pruned restarts keep their last LAP solution, and are left out of `unique` results.
+      This is a heuristic, not a bound: the relaxation is nonconvex, and restarts can climb a long way after
+      looking hopeless, so pruning early (small `prune_after`) loses restarts that would have found good
+      matches.  Larger margins / `prune_after` prune less.
+    prune_target: objective to aim for.  'exact' uses a lower bound on the objective of any exact match (minimum
+      world edge weight per template edge + minimum assignable similarity per template node).  A restart whose
+      LAP solution is an exact match is never pruned, but one still on its way to an exact match can be.
+    stats: also return a dict of solver counters, as `(ind, elapsed, stats)`:
+      n_iter[run]      : Frank-Wolfe iterations
+      exit[run]        : index into `EXIT_REASONS` (-1 if the restart was skipped); `exit_reason` has the names
+      objective[run]   : objective of the final assignment
+      phase_us[phase]  : microseconds per phase (`STATS_PHASES`), summed over restarts and threads
+    Stats are also passed to the hook set w/ `set_stats_hook`.
+  """
+  
+  args = _mgmmf_args(
+    t_adjs,
+    w_adjs,
+    nodesim,
+    n_runs=n_runs,
+    seed=seed,
+    scale_eps=scale_eps,
+    scale_init=scale_init,
+    scale_sim=scale_sim,
+    scale_grad=scale_grad,
+    scale_epoch=scale_epoch,
+    init_doublestochastic=init_doublestochastic,
+    sparse=sparse,
+    parallel=parallel,
+    lap=lap,
+    dtype=dtype,
+    stats=stats,
+    unique=unique,
+    prune_margin=prune_margin,
+    prune_target=prune_target,
+    prune_after=prune_after,
   )
+  
+  t = time()
+  out = _mgmmf_core(args)(**args)
   elapsed = time() - t
   
-  return ind.reshape(n_runs, -1), elapsed
-  
\ No newline at end of file
+  ind = Matches(*out) if unique else args['ind'].reshape(n_runs, -1)
+  if 'stats_iter' not in args:
+    return ind, elapsed
+  
+  run_stats = _run_stats(args, elapsed)
+  _emit_stats(run_stats)
+  
+  return (ind, elapsed, run_stats) if stats else (ind, elapsed)
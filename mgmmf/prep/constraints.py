@@ -2,55 +2,226 @@ import sys
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
-from haversine import haversine
-from scipy.spatial.distance import cdist
-
-def _geo_constraint(c, t_node, w_node):
-  # Candidates for node1
-  node1  = t_node[t_node.name == c['node1']].iloc[0].to_dict()
-  cand1  = w_node[w_node.rdf_type == node1['rdf_type']]
-  cand1  = cand1[cand1.latitude.notnull()]
-  if node1['linkTarget'] is not None:
-    cand1 = cand1[cand1.linkTarget == node1['linkTarget']] # !! hard linkTarget constraint
-  
-  # Candidates for node2
-  node2  = t_node[t_node.name == c['node2']].iloc[0].to_dict()
-  cand2  = w_node[w_node.rdf_type == node2['rdf_type']]
-  cand2  = cand2[cand2.latitude.notnull()]
-  if node2['linkTarget'] is not None:
-    cand2 = cand2[cand2.linkTarget == node2['linkTarget']] # !! hard linkTarget constraint
-    
-  # Compute distance
-  vals1 = cand1[['latitude', 'longitude']].values.astype(np.float64)
-  vals2 = cand2[['latitude', 'longitude']].values.astype(np.float64)
-  
-  dist = cdist(vals1, vals2, metric=lambda a,b: haversine(a, b, unit='m'))
-  dist = (dist >= c['minValue']) & (dist <= c['maxValue'])
-  i, j = np.where(dist)
+from scipy.spatial import cKDTree
+
+# --
+# Geo helpers
+
+EARTH_RADIUS_M = 6371008.8 # mean earth radius, as in `haversine`
+
+def _latlon2xyz(latlon):
+  """ (lat, lon) in degrees -> points on the unit sphere """
+  lat = np.radians(latlon[:, 0])
+  lon = np.radians(latlon[:, 1])
+  return np.column_stack([
+    np.cos(lat) * np.cos(lon),
+    np.cos(lat) * np.sin(lon),
+    np.sin(lat),
+  ])
+
+
+def haversine_m(latlon1, latlon2):
+  """ vectorized haversine distance (meters) between paired rows of two (n, 2) arrays of (lat, lon) degrees """
+  lat1, lon1 = np.radians(latlon1[:, 0]), np.radians(latlon1[:, 1])
+  lat2, lon2 = np.radians(latlon2[:, 0]), np.radians(latlon2[:, 1])
+  
+  d = (
+    np.sin((lat2 - lat1) / 2) ** 2 + 
+    np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+  )
+  return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(d, 0, 1)))
+
+
+def geo_pairs(latlon1, latlon2, min_value, max_value, tree2=None, chunk_size=10000):
+  """
+    stream (i, j) index pairs w/ `min_value <= haversine(latlon1[i], latlon2[j]) <= max_value` (meters).
+    
+    range query on a KD-tree over points on the unit sphere (chord length is monotone in great-circle
+    distance), then exact haversine on the returned pairs.  memory scales w/ the number of pairs in range.
+  """
+  if tree2 is None:
+    tree2 = cKDTree(_latlon2xyz(latlon2))
+  
+  theta = max_value / EARTH_RADIUS_M
+  chord = 2 * np.sin(min(theta, np.pi) / 2)
+  chord = chord * (1 + 1e-9) + 1e-12 # don't lose pairs right at `max_value` to rounding
+  
+  for offset in range(0, latlon1.shape[0], chunk_size):
+    chunk = latlon1[offset:offset + chunk_size]
+    hits  = tree2.query_ball_point(_latlon2xyz(chunk), r=chord)
+    
+    i = np.repeat(np.arange(chunk.shape[0]), [len(h) for h in hits])
+    j = np.fromiter((jj for h in hits for jj in h), dtype=np.int64, count=i.shape[0])
+    
+    dist = haversine_m(chunk[i], latlon2[j])
+    sel  = (dist >= min_value) & (dist <= max_value)
+    
+    yield i[sel] + offset, j[sel]
+
+
+def time_pairs(t1, t2, min_value, max_value, chunk_size=1000000):
+  """
+    stream (i, j) index pairs w/ `min_value <= t2[j] - t1[i] <= max_value` (`max_value=None` is unbounded).
+    
+    `t2` is sorted once, and each `t1[i]` is mapped to a contiguous window of the sorted array by binary
+    search (a vectorized two-pointer sweep).  pairs are emitted in chunks of ~`chunk_size`.
+  """
+  order = np.argsort(t2, kind='stable')
+  t2s   = t2[order]
+  
+  lo = np.searchsorted(t2s, t1 + min_value, side='left')
+  if max_value is None:
+    hi = np.full(t1.shape[0], t2s.shape[0])
+  else:
+    hi = np.searchsorted(t2s, t1 + max_value, side='right')
+  
+  cnt = np.maximum(hi - lo, 0)
+  cum = np.cumsum(cnt)
+  
+  start = 0
+  while start < t1.shape[0]:
+    # as many sources as fit in `chunk_size` pairs (at least one)
+    base = cum[start - 1] if start > 0 else 0
+    end  = max(start + 1, int(np.searchsorted(cum, base + chunk_size, side='right')))
+    
+    c = cnt[start:end]
+    i = np.repeat(np.arange(start, end), c)
+    k = np.arange(c.sum()) - np.repeat(np.cumsum(c) - c, c) # offset within each window
+    j = order[np.repeat(lo[start:end], c) + k]
+    
+    yield i, j
+    start = end
+
+
+class _NodeCandidates:
+  """ world nodes, indexed by rdf_type and (rdf_type, linkTarget) """
+  def __init__(self, w_node):
+    self.names   = w_node.name.values
+    self.by_type = w_node.groupby('rdf_type', sort=False).indices
+    self.by_link = w_node.groupby(['rdf_type', 'linkTarget'], sort=False).indices
+  
+  def key(self, node):
+    if not pd.isnull(node['linkTarget']): # None, or NaN in string columns
+      return (node['rdf_type'], node['linkTarget']) # !! hard linkTarget constraint
+    else:
+      return node['rdf_type']
+  
+  def get(self, node, valid=None):
+    """ row indices of candidates for template `node`, restricted to rows where `valid` is True """
+    key    = self.key(node)
+    lookup = self.by_link if isinstance(key, tuple) else self.by_type
+    idx    = lookup.get(key, np.zeros(0, dtype=np.int64))
+    if valid is not None:
+      idx = idx[valid[idx]]
+    
+    return idx
+
+
+class _GeoCandidates(_NodeCandidates):
+  """ geotagged candidates, w/ a cached KD-tree per group """
+  def __init__(self, w_node):
+    super().__init__(w_node)
+    self.valid  = w_node.latitude.notnull().values
+    self.latlon = w_node[['latitude', 'longitude']].values.astype(np.float64)
+    self._trees = {}
+  
+  def get(self, node):
+    """ row indices of geotagged candidates for template `node` """
+    return super().get(node, self.valid)
+  
+  def tree(self, node):
+    """ KD-tree over the candidates of `node`, built on first use """
+    key = self.key(node)
+    if key not in self._trees:
+      idx = self.get(node)
+      self._trees[key] = cKDTree(_latlon2xyz(self.latlon[idx])) if len(idx) > 0 else None
+    
+    return self._trees[key]
+
+# --
+# Constraints
+
+def _geo_constraint(c, t_lookup, w_geo):
+  # Candidates for node1 / node2
+  idx1 = w_geo.get(t_lookup[c['node1']])
+  idx2 = w_geo.get(t_lookup[c['node2']])
+  
+  # Pairs within [minValue, maxValue] meters (only node2's side is queried, so only it needs a tree)
+  i, j = [], []
+  if len(idx1) > 0 and len(idx2) > 0:
+    tree2 = w_geo.tree(t_lookup[c['node2']])
+    for ii, jj in geo_pairs(w_geo.latlon[idx1], w_geo.latlon[idx2], c['minValue'], c['maxValue'], tree2=tree2):
+      i.append(ii)
+      j.append(jj)
+  
+  i = np.hstack(i) if len(i) > 0 else np.zeros(0, dtype=np.int64)
+  j = np.hstack(j) if len(j) > 0 else np.zeros(0, dtype=np.int64)
   
   # Return new edges
   return pd.DataFrame({
-    "node1"        : cand1.iloc[i].name.values,
-    "node2"        : cand2.iloc[j].name.values,
+    "node1"        : w_geo.names[idx1[i]],
+    "node2"        : w_geo.names[idx2[j]],
     "rdf_type"     : c['rdf_type'],
     "argument"     : c['argument'],
     "channel"      : c['channel'],
   })
 
-def add_geo_constraints(t_node, t_edge, w_node, w_edge, t_cnst):
-  t_cnst = t_cnst[t_cnst.constraint == 'geoDistance'].copy()
+def _is_time_field(w_node, field):
+  """ `field` is a datetime, or a numeric (epoch seconds) column of `w_node` """
+  if field not in w_node.columns or field in ('latitude', 'longitude'):
+    return False
   
-  new_edges = []
-  for _, c in tqdm(t_cnst.iterrows(), total=t_cnst.shape[0]):
-    c       = c.to_dict()
-    c_edges = _geo_constraint(c, t_node, w_node)
-    new_edges.append(c_edges)
+  x = w_node[field]
+  return pd.api.types.is_datetime64_any_dtype(x) or pd.api.types.is_numeric_dtype(x)
+
+
+def _time_values(w_node, field, units):
+  """ numeric time values for `w_node[field]`, plus a scale to convert `units` into the same scale """
+  x = w_node[field]
+  if pd.api.types.is_datetime64_any_dtype(x):
+    vals  = x.values.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    vals[x.isnull().values] = np.nan
+    scale = pd.Timedelta(1, unit=units).value
+  else:
+    # numeric fields are epoch seconds
+    vals  = pd.to_numeric(x, errors='coerce').values.astype(np.float64)
+    scale = pd.Timedelta(1, unit=units) / pd.Timedelta(1, unit='s')
+  
+  return vals, scale
+
+
+def _time_constraint(c, t_lookup, w_time, vals, scale):
+  valid = ~np.isnan(vals)
+  idx1  = w_time.get(t_lookup[c['node1']], valid)
+  idx2  = w_time.get(t_lookup[c['node2']], valid)
+  
+  min_value = c['minValue'] * scale
+  max_value = c['maxValue'] * scale if c['maxValue'] is not None and not pd.isnull(c['maxValue']) else None
+  
+  i, j = [], []
+  if len(idx1) > 0 and len(idx2) > 0:
+    for ii, jj in time_pairs(vals[idx1], vals[idx2], min_value, max_value):
+      i.append(ii)
+      j.append(jj)
   
+  i = np.hstack(i) if len(i) > 0 else np.zeros(0, dtype=np.int64)
+  j = np.hstack(j) if len(j) > 0 else np.zeros(0, dtype=np.int64)
+  
+  return pd.DataFrame({
+    "node1"        : w_time.names[idx1[i]],
+    "node2"        : w_time.names[idx2[j]],
+    "rdf_type"     : c['rdf_type'],
+    "argument"     : c['argument'],
+    "channel"      : c['channel'],
+  })
+
+
+def _add_constraint_edges(t_edge, w_edge, t_cnst, new_edges, name):
   if len(new_edges) > 0:
     new_edges = pd.concat(new_edges, ignore_index=True)
     w_edge    = pd.concat([w_edge, new_edges], ignore_index=True)
     
-    print(f'add_geo_constraints: adding {new_edges.shape[0]} new edges', file=sys.stderr)
+    print(f'{name}: adding {new_edges.shape[0]} new edges', file=sys.stderr)
     
     t_edge    = pd.concat([t_edge, t_cnst], ignore_index=True)
     
@@ -59,3 +230,56 @@ def add_geo_constraints(t_node, t_edge, w_node, w_edge, t_cnst):
     t_edge = t_edge.reset_index(drop=True)
   
   return t_edge, w_edge
+
+
+def add_time_constraints(t_node, t_edge, w_node, w_edge, t_cnst):
+  """
+    world edges for `timeConstraints`: (node1, node2) pairs w/ `minValue <= w_node[constraint](node2) - 
+    w_node[constraint](node1) <= maxValue` (in `units`; `maxValue=None` is unbounded), added on the
+    constraint's channel.  datetime fields and numeric (epoch seconds) fields are both supported.
+  """
+  is_time = t_cnst.constraint.apply(lambda field: _is_time_field(w_node, field)).astype(bool)
+  skipped = t_cnst[~is_time & (t_cnst.constraint != 'geoDistance')]
+  if skipped.shape[0] > 0:
+    print(f'add_time_constraints: skipping {skipped.shape[0]} constraints on non-time fields {sorted(set(skipped.constraint))}', file=sys.stderr)
+  
+  t_cnst = t_cnst[is_time].copy()
+  
+  t_lookup = {}
+  w_time   = None
+  if t_cnst.shape[0] > 0:
+    t_lookup = {row['name'] : row for row in t_node.drop_duplicates('name').to_dict('records')}
+    w_time   = _NodeCandidates(w_node)
+  
+  w_vals    = {}
+  new_edges = []
+  for _, c in tqdm(t_cnst.iterrows(), total=t_cnst.shape[0]):
+    c   = c.to_dict()
+    key = (c['constraint'], c['units'])
+    if key not in w_vals:
+      w_vals[key] = _time_values(w_node, *key)
+    
+    vals, scale = w_vals[key]
+    c_edges     = _time_constraint(c, t_lookup, w_time, vals, scale)
+    new_edges.append(c_edges)
+  
+  return _add_constraint_edges(t_edge, w_edge, t_cnst, new_edges, 'add_time_constraints')
+
+
+def add_geo_constraints(t_node, t_edge, w_node, w_edge, t_cnst):
+  t_cnst = t_cnst[t_cnst.constraint == 'geoDistance'].copy()
+  
+  # index template / world nodes once, instead of masking per constraint
+  t_lookup = {}
+  w_geo    = None
+  if t_cnst.shape[0] > 0:
+    t_lookup = {row['name'] : row for row in t_node.drop_duplicates('name').to_dict('records')}
+    w_geo    = _GeoCandidates(w_node)
+  
+  new_edges = []
+  for _, c in tqdm(t_cnst.iterrows(), total=t_cnst.shape[0]):
+    c       = c.to_dict()
+    c_edges = _geo_constraint(c, t_lookup, w_geo)
+    new_edges.append(c_edges)
+  
+  return _add_constraint_edges(t_edge, w_edge, t_cnst, new_edges, 'add_geo_constraints')
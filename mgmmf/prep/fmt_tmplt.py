@@ -100,7 +100,7 @@ def fmt_tmplt(x):
     assert 'minValue' in xx
     
     if 'maxValue'   not in xx: xx['maxValue']   = None
-    if 'constraint' not in xx: xx['constraint'] = 'startTime' # !! always correct?
+    if 'constraint' not in xx: xx['constraint'] = 'geoDistance'
   
   return x
 
@@ -9,7 +9,8 @@
 import sys
 import argparse
 import numpy as np
-from mgmmf.io_helpers import load_gdf
+import pandas as pd
+from mgmmf.io_helpers import load_gdf, gdf2feather
 
 # --
 # Params
@@ -30,25 +31,30 @@ def parse_args():
 args = parse_args()
 print(f'fmt_world.py: formatting {args.inpath}', file=sys.stderr)
 
-df_node, df_edge = load_gdf(args.inpath)
-
-if 'id' in df_edge.columns:
-  del df_edge['id']
-
 if not args.remap_strings:
-  df_node.to_feather(args.inpath.replace('.gdf', '.nodes.feather'))
-  df_edge.to_feather(args.inpath.replace('.gdf', '.edges.feather'))
+  gdf2feather(
+    args.inpath,
+    args.inpath.replace('.gdf', '.nodes.feather'),
+    args.inpath.replace('.gdf', '.edges.feather'),
+    drop=['id'],
+  )
   
 else:
-  unode  = df_node.name.unique()
-  lookup = dict(zip(unode, np.arange(len(unode))))
-
+  df_node, df_edge = load_gdf(args.inpath)
+  
+  if 'id' in df_edge.columns:
+    del df_edge['id']
+  
+  codes, unode = pd.factorize(df_node.name)
+  unode        = pd.Index(unode)
+  
   df_node['oname'] = df_node.name
-  df_node['name']  = df_node.name.apply(lambda x: lookup[x])
-  df_edge['node1'] = df_edge.node1.apply(lambda x: lookup[x])
-  df_edge['node2'] = df_edge.node2.apply(lambda x: lookup[x])
+  df_node['name']  = codes
+  df_edge['node1'] = unode.get_indexer(df_edge.node1)
+  df_edge['node2'] = unode.get_indexer(df_edge.node2)
   
   assert (df_node.name == np.arange(df_node.shape[0])).all()
+  assert (df_edge.node1 >= 0).all() and (df_edge.node2 >= 0).all(), 'fmt_world.py: edges reference missing nodes'
   
   df_node.to_feather(args.inpath.replace('.gdf', '.nodes.feather'))
   df_edge.to_feather(args.inpath.replace('.gdf', '.edges.feather'))
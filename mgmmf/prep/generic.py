@@ -10,15 +10,21 @@ import json
 import argparse
 import numpy as np
 import pandas as pd
-from joblib import dump
 
-from mgmmf.prep.helpers import missing_node_edge_filter
-from mgmmf.prep.generic_helpers import generic_sim, make_multiplex
+from mgmmf.io_helpers import save_prep
+from mgmmf.prep.helpers import missing_node_edge_filter, arc_consistency_filter
+from mgmmf.prep.generic_helpers import generic_sim, generic_sim_sparse, make_multiplex
 
 # --
 # CLI
 
-def prep_generic(w_node, w_edge, tmplt):
+def prep_generic(w_node, w_edge, tmplt, prune=False):
+    """
+        prune: (opt-in) drop candidates that fail the arc-consistency filter (see
+          `helpers.arc_consistency_filter`).  Assumes template edges are hard constraints.  Surviving
+          world nodes are `w_node[meta['w_keep']]`, and the world graph / `nodesim` only cover those.
+    """
+    
     # --
     # Clean messy data
 
@@ -27,7 +33,7 @@ def prep_generic(w_node, w_edge, tmplt):
 
     print('prep.generic: compute node/edge similarities...', file=sys.stderr)
     nodesim = generic_sim(tmplt['nodedef'], w_node)
-    edgesim = generic_sim(tmplt['edgedef'], w_edge)
+    edgesim = generic_sim_sparse(tmplt['edgedef'], w_edge)
 
     # --
     # !! OPTIONAL: 
@@ -42,12 +48,17 @@ def prep_generic(w_node, w_edge, tmplt):
     # !! OPTIONAL: 
     # Apply hard pruning, iterative filtering, degree filters, etc for performance here
 
-    # --
-    # Save
-
     meta = {
         "t_node" : [xx['template_id'] for xx in tmplt['nodedef']],
     }
+    
+    if prune:
+        keep, nodesim  = arc_consistency_filter(t_adjs, w_adjs, nodesim)
+        w_adjs         = {c : a[keep][:, keep] for c, a in w_adjs.items()}
+        meta['w_keep'] = keep
+
+    # --
+    # Save
 
     w_node = w_node.reset_index(drop=True)
     w_edge = w_edge.reset_index(drop=True)
@@ -61,6 +72,7 @@ if __name__ == "__main__":
         parser.add_argument('--world',  type=str, required=True)
         parser.add_argument('--tmplt',  type=str, required=True)
         parser.add_argument('--outdir', type=str, required=True)
+        parser.add_argument('--prune',  action='store_true', help='arc-consistency pruning (exact edge semantics)')
         args = parser.parse_args()
             
         args.outdir = os.path.join(
@@ -86,16 +98,15 @@ if __name__ == "__main__":
     w_node = pd.read_feather(args.world + '.nodes.feather')
     w_edge = pd.read_feather(args.world + '.edges.feather')
 
-    t_adjs, w_adjs, nodesim, meta = prep_generic(w_node, w_edge, tmplt)
+    t_adjs, w_adjs, nodesim, meta = prep_generic(w_node, w_edge, tmplt, prune=args.prune)
+    if args.prune:
+        w_node = w_node[meta['w_keep']]
+        w_edge = missing_node_edge_filter(w_node, w_edge)
 
     os.makedirs(args.outdir, exist_ok=True)
     print(f'mgmmf.prep.generic: writing to {args.outdir}', file=sys.stderr)
 
-    _ = dump(t_adjs, os.path.join(args.outdir, 't_adjs.pkl'))
-    _ = dump(w_adjs, os.path.join(args.outdir, 'w_adjs.pkl'))
-    _ = dump(meta, os.path.join(args.outdir, 'meta.pkl'))
+    save_prep(args.outdir, t_adjs, w_adjs, nodesim, meta)
 
     _ = w_node.to_feather(os.path.join(args.outdir, 'w_node.feather'))
-    _ = w_edge.to_feather(os.path.join(args.outdir, 'w_edge.feather'))
-
-    np.save(os.path.join(args.outdir, 'nodesim.npy'), nodesim)
\ No newline at end of file
+    _ = w_edge.to_feather(os.path.join(args.outdir, 'w_edge.feather'))
\ No newline at end of file
@@ -8,8 +8,17 @@ import numpy as np
 import pandas as pd
 from tqdm import tqdm
 from copy import deepcopy
+from hashlib import blake2b
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from scipy import sparse as sp
 
+_INT32_MAX = np.iinfo(np.int32).max
+
+def _index_dtype(*sizes):
+  """ int32 CSR indices, unless some offset / index would overflow them (as in `mgmmf._mgmmf_args`) """
+  return np.int64 if max(sizes, default=0) > _INT32_MAX else np.int32
+
 # --
 # "Similarity" functions
 
@@ -45,68 +54,283 @@ class BinarySimilarity:
     return sim_fn(x[field_name], **func)  
 
 
-def generic_sim(t, w_df, mode=BinarySimilarity):
-  tn  = len(t)
-  wn  = w_df.shape[0]
+def _sim_key(sim):
+  """ hashable (field, type, args) key for a similarity spec -- list-valued args are order-independent """
+  func = sim['function']
+  args = []
+  for k, v in sorted(func.items()):
+    if k == 'type':
+      continue
+    
+    if isinstance(v, (list, tuple, set)):
+      v = tuple(sorted(set(v), key=repr))
+    
+    args.append((k, v))
+  
+  return sim['field_name'].replace(':', '_'), func['type'], tuple(args)
+
+
+class SimilarityEngine:
+  """
+    Columnar evaluation of `BinarySimilarity` predicates against a world table (pandas DataFrame
+    or pyarrow Table, eg from `pyarrow.feather.read_table`).
+    
+    - each distinct (field, function) is evaluated once and cached as a boolean mask
+    - `exact` is evaluated on dictionary codes: each field is factorized once, `values` are looked
+      up in the (small) dictionary, and the mask is a gather over the codes
+    - `rows` restricts evaluation to a subset of rows, for short-circuiting
+    - `n_jobs > 1` evaluates distinct predicates on a thread pool (numpy / arrow kernels release the GIL)
+  """
+  def __init__(self, w_df, mode=BinarySimilarity, n_jobs=1):
+    self.w_df   = w_df
+    self.mode   = mode
+    self.n_jobs = n_jobs
+    self.n_rows = w_df.num_rows if _is_arrow(w_df) else w_df.shape[0]
+    
+    self._codes = {}
+    self._masks = {}
+  
+  def _column(self, field, rows=None):
+    if _is_arrow(self.w_df):
+      col = self.w_df.column(field)
+      return col if rows is None else col.take(rows)
+    else:
+      col = self.w_df[field]
+      return col if rows is None else col.iloc[rows]
+  
+  def _factorize(self, field):
+    if field not in self._codes:
+      col = self._column(field)
+      if _is_arrow(self.w_df):
+        col = col.dictionary_encode().combine_chunks()
+        codes, uniques = col.indices.fill_null(-1).to_numpy(), col.dictionary.to_pandas()
+      else:
+        codes, uniques = pd.factorize(col)
+        uniques = pd.Series(uniques)
+      
+      self._codes[field] = (np.asarray(codes, dtype=np.int64), uniques)
+    
+    return self._codes[field]
+  
+  def _eval(self, sim, rows=None):
+    field, sim_type, args = _sim_key(sim)
+    
+    if self.mode is not BinarySimilarity:
+      x = self._column(field, rows)
+      x = x.to_pandas() if _is_arrow(self.w_df) else x
+      return np.asarray(self.mode.apply(pd.DataFrame({field : x}), sim)) != 0
+    
+    if sim_type == 'exact':
+      codes, uniques = self._factorize(field)
+      values = sim['function']['values']
+      lookup = np.append(uniques.isin(values).values, pd.isnull(values).any()) # last entry: nulls
+      return lookup[codes if rows is None else codes[rows]]
+    
+    elif sim_type == 'range':
+      func = sim['function']
+      x    = self._column(field, rows)
+      if _is_arrow(self.w_df):
+        import pyarrow.compute as pc
+        out = pc.and_kleene(
+          pc.greater_equal(x, func['min_value']),
+          pc.less_equal(x, func['max_value']),
+        )
+        return out.fill_null(True).to_numpy(zero_copy_only=False)
+      else:
+        return BinarySimilarity.range(x, func['min_value'], func['max_value']).values != 0
+    
+    else:
+      raise ValueError(f'SimilarityEngine: unknown similarity type {sim_type}')
+  
+  def mask(self, sim, rows=None):
+    """ boolean mask of rows (all rows, or `rows`) that satisfy `sim`.  full-table masks are cached. """
+    key = _sim_key(sim)
+    if key in self._masks:
+      m = self._masks[key]
+      return m if rows is None else m[rows]
+    
+    if rows is not None:
+      return self._eval(sim, rows)
+    
+    m = self._eval(sim)
+    self._masks[key] = m
+    return m
+  
+  def prefetch(self, sims):
+    """ evaluate + cache full-table masks for `sims` (w/ `n_jobs` threads) """
+    todo = {}
+    for sim in sims:
+      key = _sim_key(sim)
+      if key not in self._masks:
+        todo[key] = sim
+    
+    # factorize serially, so threads don't race on the code cache
+    for field, sim_type, _ in todo.keys():
+      if sim_type == 'exact' and self.mode is BinarySimilarity:
+        _ = self._factorize(field)
+    
+    if self.n_jobs > 1 and len(todo) > 1:
+      with ThreadPoolExecutor(self.n_jobs) as ex:
+        masks = list(ex.map(self._eval, todo.values()))
+    else:
+      masks = [self._eval(sim) for sim in todo.values()]
+    
+    self._masks.update(zip(todo.keys(), masks))
+
+
+def _is_arrow(x):
+  return type(x).__module__.startswith('pyarrow')
+
+
+def generic_sim(t, w_df, mode=BinarySimilarity, n_jobs=1):
+  """ dense (len(t), w_df.shape[0]) similarity matrix.  `w_df` may be a DataFrame or a pyarrow Table. """
+  engine = SimilarityEngine(w_df, mode=mode, n_jobs=n_jobs)
+  engine.prefetch([sim for tt in t for sim in tt['similarities']])
   
-  out = np.ones((tn, wn))
+  out = np.ones((len(t), engine.n_rows))
   for idx, tt in enumerate(t):
     for sim in tt['similarities']:
-      s         = BinarySimilarity.apply(w_df, sim)    
-      out[idx] *= s # boolean AND on similarities - could do something different
+      out[idx] *= engine.mask(sim) # boolean AND on similarities - could do something different
   
   return out
 
+
+def generic_sim_sparse(t, w_df, mode=BinarySimilarity, n_jobs=1):
+  """
+    like `generic_sim`, but returns a (len(t), w_df.shape[0]) CSR matrix holding only the nonzero
+    similarities.  predicates shared by several template entries are evaluated once over the full
+    table; the rest are only evaluated on the rows that passed the previous ones, and a template
+    entry stops as soon as no rows are left, so memory scales w/ the number of matches.
+  """
+  engine = SimilarityEngine(w_df, mode=mode, n_jobs=n_jobs)
+  
+  counts = Counter(_sim_key(sim) for tt in t for sim in tt['similarities'])
+  engine.prefetch([sim for tt in t for sim in tt['similarities'] if counts[_sim_key(sim)] > 1])
+  
+  tn  = len(t)
+  wn  = engine.n_rows
+  
+  indices = []
+  for tt in t:
+    idx = None
+    for sim in tt['similarities']:
+      if idx is not None and idx.shape[0] == 0:
+        break
+      
+      m   = engine.mask(sim, idx)
+      idx = np.flatnonzero(m) if idx is None else idx[m]
+    
+    indices.append(np.arange(wn) if idx is None else idx)
+  
+  indptr = np.zeros(tn + 1, dtype=np.int64)
+  np.cumsum([len(idx) for idx in indices], out=indptr[1:])
+  
+  idx_dtype = _index_dtype(wn, indptr[-1])
+  indices   = np.hstack(indices).astype(idx_dtype) if tn > 0 else np.zeros(0, dtype=idx_dtype)
+  data      = np.ones(indices.shape[0])
+  return sp.csr_matrix((data, indices, indptr), shape=(tn, wn))
+
 # --
 # Adjacency matrix functions
 
-def __make_lookup(x):
-  return dict(zip(x, range(len(x))))
+def _sim_row(edgesim, i):
+  """ (indices, values) of the nonzero similarities in row `i` of a dense or CSR `edgesim` """
+  if sp.issparse(edgesim):
+    lo, hi = edgesim.indptr[i], edgesim.indptr[i + 1]
+    idx    = edgesim.indices[lo:hi]
+    val    = edgesim.data[lo:hi]
+    keep   = val > 0
+    return idx[keep], val[keep]
+  else:
+    e   = edgesim[i]
+    idx = np.flatnonzero(e > 0)
+    return idx, e[idx]
+
+
+def _edge_channels(edgesim):
+  """
+    group rows of `edgesim` (template edges) into channels -- "equivalency classes" of edge similarities.
+    rows are keyed by a digest of their nonzero indices / values, so no per-edge Python objects are created.
+    channels are numbered in order of first appearance.
+  """
+  if sp.issparse(edgesim):
+    edgesim = edgesim.tocsr()
+    edgesim.sort_indices()
+  
+  n_rows       = edgesim.shape[0]
+  edge2channel = np.zeros(n_rows, dtype=np.int64)
+  channel_rows = []
+  digests      = {}
+  for i in range(n_rows):
+    idx, val = _sim_row(edgesim, i)
+    
+    h = blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(idx, dtype=np.int64).view(np.uint8))
+    h.update(np.ascontiguousarray(val, dtype=np.float64).view(np.uint8))
+    key = h.digest()
+    if key not in digests:
+      digests[key] = len(channel_rows)
+      channel_rows.append(i)
+    
+    edge2channel[i] = digests[key]
+  
+  return edge2channel, np.array(channel_rows, dtype=np.int64)
+
+
+def _coo_to_csr(rows, cols, vals, n):
+  """ n x n CSR from COO in one sort; duplicate entries are summed, like `sp.csr_matrix((v, (r, c)))` """
+  key   = rows.astype(np.int64) * n + cols
+  order = np.argsort(key, kind='stable')
+  key   = key[order]
+  vals  = vals[order]
+  
+  if key.shape[0] > 0:
+    first = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    vals  = np.add.reduceat(vals, first)
+    key   = key[first]
+  
+  idx_dtype = _index_dtype(n, key.shape[0])
+  indices   = (key % n).astype(idx_dtype)
+  indptr    = np.zeros(n + 1, dtype=idx_dtype)
+  np.cumsum(np.bincount(key // n, minlength=n), out=indptr[1:])
+  
+  return sp.csr_matrix((vals, indices, indptr), shape=(n, n))
 
 
 def make_multiplex(tmplt, w_node, w_edge, edgesim):
+  """ `edgesim` may be dense (from `generic_sim`) or CSR (from `generic_sim_sparse`) """
   assert 'node1' in w_edge.columns
   assert 'node2' in w_edge.columns
   
   tn_node = len(tmplt['nodedef'])
   wn_node = w_node.shape[0]
   
-  t_node = np.array([xx['template_id'] for xx in tmplt['nodedef']])
-  t_src  = np.array([xx['node1'] for xx in tmplt['edgedef']])
-  t_dst  = np.array([xx['node2'] for xx in tmplt['edgedef']])
+  t_node = pd.Index([xx['template_id'] for xx in tmplt['nodedef']])
+  assert t_node.is_unique, 'make_multiplex: duplicate template node ids'
+  t_src  = t_node.get_indexer([xx['node1'] for xx in tmplt['edgedef']])
+  t_dst  = t_node.get_indexer([xx['node2'] for xx in tmplt['edgedef']])
+  assert (t_src >= 0).all() and (t_dst >= 0).all(), 'make_multiplex: edgedef references unknown template node'
+  
+  # integer-coded world endpoints (one hash-table pass over all edges)
+  w_name = pd.Index(w_node.name.values)
+  assert w_name.is_unique, f'make_multiplex: duplicate world node names (eg {w_name[w_name.duplicated()][:5].tolist()})'
+  w_src  = w_name.get_indexer(w_edge.node1.values)
+  w_dst  = w_name.get_indexer(w_edge.node2.values)
+  assert (w_src >= 0).all() and (w_dst >= 0).all(), 'make_multiplex: run `missing_node_edge_filter` first'
   
-  tnode_lookup = __make_lookup(t_node)
-  wnode_lookup = __make_lookup(w_node.name.values)
+  edge2channel, channel_rows = _edge_channels(edgesim)
   
   t_adjs = {}
   w_adjs = {}
   
-  # compute channels as "equivalency classes" of edge similarities
-  edge2channel = [hash(tuple(e)) for e in edgesim]
-  
-  # template adjacency
-  for c_id, c in enumerate(np.unique(edge2channel)):
-    tsel  = edge2channel == c
-    
+  for c_id, i in enumerate(channel_rows):
+    # template adjacency
+    tsel  = edge2channel == c_id
     tv    = np.ones(tsel.sum()) # TODO: could use importance here
-    tr    = [tnode_lookup[xx] for xx in t_src[tsel]]
-    tc    = [tnode_lookup[xx] for xx in t_dst[tsel]]
-    
-    t_adj = sp.csr_matrix((tv, (tr, tc)), shape=(tn_node, tn_node))
-    t_adjs[c_id] = t_adj
-  
-  # world adjacency
-  for c_id, c in enumerate(np.unique(edge2channel)):
-    tsel  = edge2channel == c
-    i     = np.where(tsel)[0][0] # row of edgesim w/ hash == c 
-    e     = edgesim[i]
-    esel  = e > 0
-    
-    wv    = e[esel]
-    wr    = w_edge[esel].node1.apply(lambda x: wnode_lookup[x])
-    wc    = w_edge[esel].node2.apply(lambda x: wnode_lookup[x])
+    t_adjs[c_id] = _coo_to_csr(t_src[tsel], t_dst[tsel], tv, tn_node)
     
-    w_adj = sp.csr_matrix((wv, (wr, wc)), shape=(wn_node, wn_node))
-    w_adjs[c_id] = w_adj
+    # world adjacency
+    esel, ev = _sim_row(edgesim, i)
+    w_adjs[c_id] = _coo_to_csr(w_src[esel], w_dst[esel], ev, wn_node)
   
-  return t_adjs, w_adjs
\ No newline at end of file
+  return t_adjs, w_adjs
@@ -7,7 +7,7 @@ import sys
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
-from numba import njit
+from numba import njit, prange
 from numba.types import bool_
 from scipy import sparse as sp
 
@@ -122,7 +122,7 @@ def compute_degree(df_node, df_edge, mode):
     raise Exception(f'!! unsupported mode {mode}')
 
 
-@njit(cache=True)
+@njit(cache=True, parallel=True)
 def degree_filter(t, w, slack=0):
   """ filter world nodes that have incompatible degrees w/ template """
   nt = t.shape[0]
@@ -131,15 +131,277 @@ def degree_filter(t, w, slack=0):
   
   out = np.ones((nt, nw), dtype=bool_)
   
-  for i in range(nt):
-    for j in range(nw):
+  for j in prange(nw):
+    for i in range(nt):
       for k in range(nc):
         if t[i, k] > w[j, k] + slack:
           out[i, j] = False
+          break
+  
+  return out
+
+
+@njit(cache=True, parallel=True)
+def _degree_filter_pairs(t, w, rows, cols, slack):
+  nc  = t.shape[1]
+  out = np.ones(rows.shape[0], dtype=bool_)
+  
+  for p in prange(rows.shape[0]):
+    i = rows[p]
+    j = cols[p]
+    for k in range(nc):
+      if t[i, k] > w[j, k] + slack:
+        out[p] = False
+        break
   
   return out
 
 
+def degree_filter_sparse(t, w, cand, slack=0):
+  """
+    like `degree_filter`, but only tests the (template, world) pairs in the sparsity pattern of `cand`
+    (eg `nodesim`).  returns the surviving pairs as a boolean CSR matrix w/ the shape of `cand`.
+  """
+  cand = sp.csr_matrix(cand != 0) # own pattern, w/o explicit zeros -- the caller's matrix is left alone
+  
+  rows = np.repeat(np.arange(cand.shape[0]), np.diff(cand.indptr))
+  keep = _degree_filter_pairs(t, w, rows, cand.indices, slack)
+  
+  indptr = np.zeros(cand.shape[0] + 1, dtype=np.int64)
+  np.cumsum(np.bincount(rows[keep], minlength=cand.shape[0]), out=indptr[1:])
+  
+  return sp.csr_matrix(
+    (np.ones(keep.sum(), dtype=bool), cand.indices[keep], indptr),
+    shape=cand.shape
+  )
+
+
+@njit(cache=True)
+def _has_candidate(j, t_deg, w_deg, cand_indptr, cand_indices, slack):
+  nc2 = w_deg.shape[1]
+  
+  if w_deg[j].sum() == 0:
+    return False
+  
+  for p in range(cand_indptr[j], cand_indptr[j + 1]):
+    i  = cand_indices[p]
+    ok = True
+    for k in range(nc2):
+      if t_deg[i, k] > w_deg[j, k] + slack:
+        ok = False
+        break
+    
+    if ok:
+      return True
+  
+  return False
+
+
+@njit(cache=True)
+def _degree_prune(t_deg, w_deg, cand_indptr, cand_indices, B_indptr, B_indices, Bt_indptr, Bt_indices, nc, slack):
+  """
+    work-queue fixed point of the degree filter.  a world node is dropped when no candidate template node
+    fits inside its degrees; that only changes the degrees of its neighbors, so only they are re-checked.
+    `w_deg` is updated in place.
+  """
+  nw = w_deg.shape[0]
+  
+  alive  = np.ones(nw, dtype=bool_)
+  queued = np.ones(nw, dtype=bool_)
+  stack  = np.arange(nw)
+  top    = nw
+  
+  while top > 0:
+    top -= 1
+    j = stack[top]
+    queued[j] = False
+    
+    if not alive[j]:
+      continue
+    
+    if _has_candidate(j, t_deg, w_deg, cand_indptr, cand_indices, slack):
+      continue
+    
+    alive[j] = False
+    for c in range(nc):
+      r = c * nw + j
+      
+      # out-neighbors lose an in-edge
+      for p in range(B_indptr[r], B_indptr[r + 1]):
+        k = B_indices[p]
+        if alive[k]:
+          w_deg[k, c] -= 1
+          if not queued[k]:
+            queued[k]  = True
+            stack[top] = k
+            top       += 1
+      
+      # in-neighbors lose an out-edge
+      for p in range(Bt_indptr[r], Bt_indptr[r + 1]):
+        k = Bt_indices[p]
+        if alive[k]:
+          w_deg[k, nc + c] -= 1
+          if not queued[k]:
+            queued[k]  = True
+            stack[top] = k
+            top       += 1
+  
+  return alive
+
+
+def channel_degrees(adjs):
+  """ (n_nodes, 2 * n_channels) array of [in-degree by channel, out-degree by channel] """
+  adjs = [(a != 0) for a in adjs.values()]
+  return np.column_stack(
+    [a.getnnz(axis=0) for a in adjs] + 
+    [a.getnnz(axis=1) for a in adjs]
+  ).astype(np.int64)
+
+
+def iterated_degree_filter(t_adjs, w_adjs, nodesim, slack=0):
+  """
+    iterated degree filter, run to a fixed point.  world nodes w/ no template node whose (per-channel
+    in/out) degrees fit inside their own are dropped, which lowers their neighbors' degrees, and so on.
+    pruning is incremental, so the cost scales w/ the number of removed edges rather than passes x world size.
+    
+    returns
+      keep    : boolean mask of surviving world nodes
+      nodesim : `nodesim[:, keep]`, masked by the degree filter on the surviving graph
+  """
+  nc = len(w_adjs)
+  nw = nodesim.shape[1]
+  
+  t_deg = channel_degrees(t_adjs)
+  w_deg = channel_degrees(w_adjs)
+  
+  B  = sp.vstack([(a != 0)             for a in w_adjs.values()]).tocsr()
+  Bt = sp.vstack([(a != 0).T.tocsr()   for a in w_adjs.values()]).tocsr()
+  
+  cand = sp.csr_matrix(nodesim.T != 0)
+  
+  keep = _degree_prune(
+    t_deg, w_deg,
+    cand.indptr, cand.indices,
+    B.indptr, B.indices,
+    Bt.indptr, Bt.indices,
+    nc, slack
+  )
+  
+  print(f"iterated_degree_filter  : {keep.sum()} / {nw} nodes left", file=sys.stderr)
+  
+  nodesim = nodesim[:, keep]
+  mask    = degree_filter_sparse(t_deg, w_deg[keep], nodesim, slack)
+  
+  r, c    = mask.nonzero()
+  out     = np.zeros_like(nodesim)
+  out[r, c] = nodesim[r, c]
+  return keep, out
+
+
+@njit(cache=True)
+def _arc_supported(i, j, cand, TA_indptr, TA_indices, W_indptr, W_indices, nc, nt, nw):
+  """ every template neighbor of `i` (in the direction of TA / W) has a candidate among `j`'s world neighbors """
+  for c in range(nc):
+    rt = c * nt + i
+    rw = c * nw + j
+    for p in range(TA_indptr[rt], TA_indptr[rt + 1]):
+      i2    = TA_indices[p]
+      found = False
+      for q in range(W_indptr[rw], W_indptr[rw + 1]):
+        if cand[W_indices[q], i2]:
+          found = True
+          break
+      
+      if not found:
+        return False
+  
+  return True
+
+
+@njit(cache=True)
+def _arc_prune(cand, TA_indptr, TA_indices, TAt_indptr, TAt_indices, B_indptr, B_indices, Bt_indptr, Bt_indices, nc):
+  """
+    work-queue arc consistency on the (world node, template node) candidate matrix `cand` (updated in place).
+    when a world node loses a candidate, its world neighbors are re-checked.
+  """
+  nw, nt = cand.shape
+  
+  queued = np.ones(nw, dtype=bool_)
+  stack  = np.arange(nw)
+  top    = nw
+  
+  while top > 0:
+    top -= 1
+    j = stack[top]
+    queued[j] = False
+    
+    removed = False
+    for i in range(nt):
+      if not cand[j, i]:
+        continue
+      
+      if (
+        not _arc_supported(i, j, cand, TA_indptr, TA_indices, B_indptr, B_indices, nc, nt, nw) or
+        not _arc_supported(i, j, cand, TAt_indptr, TAt_indices, Bt_indptr, Bt_indices, nc, nt, nw)
+      ):
+        cand[j, i] = False
+        removed    = True
+    
+    if not removed:
+      continue
+    
+    for c in range(nc):
+      r = c * nw + j
+      for p in range(B_indptr[r], B_indptr[r + 1]):
+        k = B_indices[p]
+        if not queued[k]:
+          queued[k]  = True
+          stack[top] = k
+          top       += 1
+      
+      for p in range(Bt_indptr[r], Bt_indptr[r + 1]):
+        k = Bt_indices[p]
+        if not queued[k]:
+          queued[k]  = True
+          stack[top] = k
+          top       += 1
+
+
+def arc_consistency_filter(t_adjs, w_adjs, nodesim):
+  """
+    neighborhood / arc-consistency filter, run to a fixed point.  world node `j` stays a candidate for
+    template node `i` only if, on every channel, each out- (in-) neighbor of `i` has a candidate among
+    the out- (in-) neighbors of `j`.  only valid for exact (hard-constraint) edge semantics.
+    
+    returns
+      keep    : boolean mask of world nodes that are still a candidate for some template node
+      nodesim : `nodesim[:, keep]`, w/ pruned candidates set to zero
+  """
+  nc = len(w_adjs)
+  nw = nodesim.shape[1]
+  
+  TA  = sp.vstack([(a != 0)           for a in t_adjs.values()]).tocsr()
+  TAt = sp.vstack([(a != 0).T.tocsr() for a in t_adjs.values()]).tocsr()
+  B   = sp.vstack([(a != 0)           for a in w_adjs.values()]).tocsr()
+  Bt  = sp.vstack([(a != 0).T.tocsr() for a in w_adjs.values()]).tocsr()
+  
+  cand = np.ascontiguousarray(nodesim.T != 0)
+  n_before = cand.sum()
+  
+  _arc_prune(
+    cand,
+    TA.indptr, TA.indices, TAt.indptr, TAt.indices,
+    B.indptr, B.indices, Bt.indptr, Bt.indices,
+    nc
+  )
+  
+  keep = cand.any(axis=1)
+  print(f"arc_consistency_filter  : {cand.sum()} / {n_before} candidates, {keep.sum()} / {nw} nodes left", file=sys.stderr)
+  
+  nodesim = nodesim[:, keep] * cand[keep].T
+  return keep, nodesim
+
+
 def edgelist2adjs(df_node, df_edge, importance_weight=False):
   """ convert pandas edgelist to scipy.sparse.csr matrices"""
   
@@ -2,6 +2,9 @@
 
 using namespace std;
 
+// Accumulator for traces / objective terms -- double in both the float64 and float32 builds
+typedef double acc_t;
+
 // --
 // Data Structures
 
@@ -48,6 +51,18 @@ struct csr_t {
       memcpy(indices, src->indices, nnz        * sizeof(int_t));
       memcpy(data,    src->data,    nnz        * sizeof(cost_t));
   }
+  
+  void alloc_like(csr_t* src) {
+      // share sparsity pattern of `src`, own (zeroed) values
+      nnz     = src->nnz;
+      nrow    = src->nrow;
+      ncol    = src->ncol;
+      
+      indptr  = src->indptr;
+      indices = src->indices;
+      data    = (cost_t*)malloc(nnz * sizeof(cost_t));
+      for(int_t i = 0; i < nnz; i++) data[i] = 0;
+  }
 };
 
 template <typename T>
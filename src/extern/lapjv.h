@@ -66,9 +66,21 @@ From: https://github.com/gatagat/lap
 #endif
 
 
+#ifdef MGMMF_INDEX64
+// 64-bit build: CSR offsets / indices and dense offsets (nrow * ncol) may exceed 2^31
+#include <stdint.h>
+typedef int64_t int_t;
+typedef uint64_t uint_t;
+#else
 typedef signed int int_t;
 typedef unsigned int uint_t;
+#endif
+#ifdef MGMMF_FLOAT32
+// single-precision build: float32 storage for matrices / work buffers
+typedef float cost_t;
+#else
 typedef double cost_t;
+#endif
 typedef char boolean;
 typedef enum fp_t { FP_1 = 1, FP_2 = 2, FP_DYNAMIC = 3 } fp_t;
 
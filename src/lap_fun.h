@@ -46,37 +46,123 @@ void row_argsort_heap(size_t* sel, cost_t* x, uint_t& u, const uint_t n, const u
     u = std::distance(sel, it);
 }
 
+// --
+// Workspace
+//  - scratch buffers for `rect_lap` / `sparse_rect_lap`, reused across iterations (and restarts)
+//  - buffers only ever grow, so after the first call a LAP does no allocation
+
+template <typename T>
+T* ws_reserve(T*& buf, size_t& cap, size_t need) {
+  if(need > cap) {
+    free(buf);
+    buf = (T*)malloc(need * sizeof(T));
+    cap = need;
+  }
+  return buf;
+}
+
+struct lap_workspace_t {
+  size_t*  sel      = nullptr; size_t sel_cap      = 0;
+  size_t*  sel_perm = nullptr; size_t sel_perm_cap = 0;
+  uint_t*  perm     = nullptr; size_t perm_cap     = 0;
+  uint_t*  iperm    = nullptr; size_t iperm_cap    = 0;
+  cost_t*  cost_sub = nullptr; size_t cost_sub_cap = 0;
+  cost_t*  cost_pad = nullptr; size_t cost_pad_cap = 0;
+  int_t*   x        = nullptr; size_t x_cap        = 0;
+  int_t*   y        = nullptr; size_t y_cap        = 0;
+  
+  // shortest augmenting path solver
+  size_t*  e_col    = nullptr; size_t e_col_cap    = 0;
+  uint_t*  e_cnt    = nullptr; size_t e_cnt_cap    = 0;
+  cost_t*  v        = nullptr; size_t v_cap        = 0;
+  cost_t*  dist     = nullptr; size_t dist_cap     = 0;
+  cost_t*  row_cost = nullptr; size_t row_cost_cap = 0;
+  int_t*   pred     = nullptr; size_t pred_cap     = 0;
+  int_t*   col_row  = nullptr; size_t col_row_cap  = 0;
+  int_t*   row_col  = nullptr; size_t row_col_cap  = 0;
+  char*    done     = nullptr; size_t done_cap     = 0;
+  vector<int_t> touched;
+  vector<pair<cost_t, int_t>> heap;
+  
+  void release() {
+    free(sel);      sel      = nullptr; sel_cap      = 0;
+    free(sel_perm); sel_perm = nullptr; sel_perm_cap = 0;
+    free(perm);     perm     = nullptr; perm_cap     = 0;
+    free(iperm);    iperm    = nullptr; iperm_cap    = 0;
+    free(cost_sub); cost_sub = nullptr; cost_sub_cap = 0;
+    free(cost_pad); cost_pad = nullptr; cost_pad_cap = 0;
+    free(x);        x        = nullptr; x_cap        = 0;
+    free(y);        y        = nullptr; y_cap        = 0;
+    
+    free(e_col);    e_col    = nullptr; e_col_cap    = 0;
+    free(e_cnt);    e_cnt    = nullptr; e_cnt_cap    = 0;
+    free(v);        v        = nullptr; v_cap        = 0;
+    free(dist);     dist     = nullptr; dist_cap     = 0;
+    free(row_cost); row_cost = nullptr; row_cost_cap = 0;
+    free(pred);     pred     = nullptr; pred_cap     = 0;
+    free(col_row);  col_row  = nullptr; col_row_cap  = 0;
+    free(row_col);  row_col  = nullptr; row_col_cap  = 0;
+    free(done);     done     = nullptr; done_cap     = 0;
+    vector<int_t>().swap(touched);
+    vector<pair<cost_t, int_t>>().swap(heap);
+  }
+};
+
+enum lap_solver_t {
+  LAP_PADDED = 0, // dense lapjv on the (n + u) x (n + u) padded problem
+  LAP_SAP    = 1, // shortest augmenting paths on the n x u candidate graph
+};
+
+// --
+// Top-k selection
+
+template <typename F>
+uint_t row_topk(size_t* out, const uint_t n, const uint_t m, F val) {
+    // Indices of the (up to) n largest of val(0), ..., val(m - 1), in a single scan.
+    // `out` (length n) is used as a bounded min-heap, so no scratch space is needed.
+    auto cmp = [&val](size_t left, size_t right) -> bool {
+      return val(left) > val(right);
+    };
+    
+    uint_t k = min(n, m);
+    for(uint_t j = 0; j < k; j++) out[j] = j;
+    std::make_heap(out, out + k, cmp);
+    
+    for(uint_t j = k; j < m; j++) {
+      if(val(j) > val(out[0])) {
+        std::pop_heap(out, out + k, cmp);
+        out[k - 1] = j;
+        std::push_heap(out, out + k, cmp);
+      }
+    }
+    
+    return k;
+}
+
 void row_argsort(size_t* sel, cost_t* x, uint_t& u, const uint_t n, const uint_t m) {
     
+    #pragma omp parallel for schedule(dynamic) if(!omp_in_parallel())
     for(uint_t i = 0; i < n; i++) {
-      
+      cost_t* _x = x + i * m;
+#ifdef LAP__FULLSORT
       size_t* tmp = (size_t*)malloc(m * sizeof(size_t));
-      
       for(uint_t j = 0; j < m; j++) tmp[j] = j;
       
-      cost_t* _x = x + i * m;
-#ifdef LAP__FULLSORT
       std::stable_sort(
         tmp,
         tmp + m,
         [&_x](int left, int right) -> bool {
             return _x[left] > _x[right];
         });
+      
+      for(uint_t j = 0; j < n; j++) {
+        sel[i * n + j] = tmp[j];
+      }
+      
+      free(tmp);
 #else
-      std::nth_element(
-        tmp,
-        tmp + n,
-        tmp + m,
-        [&_x](int left, int right) -> bool {
-            return _x[left] > _x[right];
-        });
+      row_topk(sel + i * n, n, m, [&_x](size_t j) -> cost_t { return _x[j]; });
 #endif
-
-        for(uint_t j = 0; j < n; j++) {
-          sel[i * n + j] = tmp[j];
-        }
-        
-        free(tmp);
     }
     
     std::sort(sel, sel + n * n);
@@ -85,10 +171,181 @@ void row_argsort(size_t* sel, cost_t* x, uint_t& u, const uint_t n, const uint_t
 }
 
 
-void rect_lap(const uint_t n, const uint_t m, cost_t* cost, cost_t* pcost, int_t* ind, int_t* w_p) {
+void sub_lap(const uint_t n, const uint_t u, cost_t* cost_sub, size_t* sel, int_t* ind, lap_workspace_t* ws) {
+    // Maximize over the n x u sub-problem on columns `sel`, via a padded (n + u) x (n + u) min-cost LAP
+    
+    cost_t cost_sub_max = -1;
+    for(uint_t i = 0; i < n * u; i++) {
+      if(cost_sub[i] > cost_sub_max) {
+        cost_sub_max = cost_sub[i];
+      }
+    }
+    
+    cost_t cost_sub_max2 = -1;
+    for(uint_t i = 0; i < n * u; i++) {
+      cost_sub[i] = (1 + cost_sub_max) - cost_sub[i];
+      if(cost_sub[i] > cost_sub_max2) {
+        cost_sub_max2 = cost_sub[i];
+      }
+    }
+    
+    uint_t k         = n + u;
+    cost_t* cost_pad = ws_reserve(ws->cost_pad, ws->cost_pad_cap, (size_t)k * k);
+    for(uint_t r = 0; r < k; r++) {
+      for(uint_t c = 0; c < k; c++) {
+        if((r < u) && (c < n)) {
+          cost_pad[r * k + c] = cost_sub[c * u + r];
+        } else if(r >= u && c >= n) {
+          cost_pad[r * k + c] = 0;
+        } else {
+          cost_pad[r * k + c] = 1 + cost_sub_max2;
+        }
+      }
+    }
+
+    int_t* x = ws_reserve(ws->x, ws->x_cap, k);
+    int_t* y = ws_reserve(ws->y, ws->y_cap, k);
+    lapjv_internal(k, cost_pad, x, y);
+
+    for(uint_t i = 0; i < n; i++)
+      ind[i] = sel[y[i]];
+}
+
+
+bool sap_sub_lap(const uint_t n, const uint_t u, cost_t* cost_sub, size_t* sel, int_t* ind, lap_workspace_t* ws) {
+    // Maximize over the n x u sub-problem on columns `sel` (u >= n), via shortest augmenting paths
+    // on the sparse graph of each row's top-n columns.  Some optimal assignment only uses those
+    // edges, so this gives the same objective as `sub_lap` w/o building the (n + u)^2 padded matrix.
+    //
+    // Column duals `v` are explicit; row duals are implicit (reduced cost of the matched edge is 0).
+    //
+    // Returns false (and leaves `ind` alone) if some row has no augmenting path -- only possible w/
+    // non-finite costs (eg, NaN, where every distance comparison fails).
+    
+    const cost_t inf = std::numeric_limits<cost_t>::max();
+    
+    size_t* e_col    = ws_reserve(ws->e_col,    ws->e_col_cap,    (size_t)n * n);
+    uint_t* e_cnt    = ws_reserve(ws->e_cnt,    ws->e_cnt_cap,    n);
+    cost_t* v        = ws_reserve(ws->v,        ws->v_cap,        u);
+    cost_t* dist     = ws_reserve(ws->dist,     ws->dist_cap,     u);
+    cost_t* row_cost = ws_reserve(ws->row_cost, ws->row_cost_cap, n);
+    int_t*  pred     = ws_reserve(ws->pred,     ws->pred_cap,     u);
+    int_t*  col_row  = ws_reserve(ws->col_row,  ws->col_row_cap,  u);
+    int_t*  row_col  = ws_reserve(ws->row_col,  ws->row_col_cap,  n);
+    char*   done     = ws_reserve(ws->done,     ws->done_cap,     u);
+    
+    for(uint_t i = 0; i < n; i++) {
+      cost_t* _x = cost_sub + i * u;
+      e_cnt[i] = row_topk(e_col + i * n, n, u, [&_x](size_t j) -> cost_t { return _x[j]; }); // min(n, u) edges
+    }
+    
+    for(uint_t j = 0; j < u; j++) {
+      v[j]       = 0;
+      dist[j]    = inf;
+      col_row[j] = -1;
+      done[j]    = 0;
+    }
+    for(uint_t i = 0; i < n; i++) row_col[i] = -1;
+    
+    auto cost = [&](int_t i, int_t j) -> cost_t { return -cost_sub[i * u + j]; };
+    auto cmp  = std::greater<pair<cost_t, int_t>>();
+    
+    vector<int_t>& touched           = ws->touched;
+    vector<pair<cost_t, int_t>>& hq  = ws->heap;
+    
+    for(uint_t s = 0; s < n; s++) {
+      touched.clear();
+      hq.clear();
+      
+      auto relax = [&](int_t i, cost_t d0, cost_t ui) {
+        for(uint_t e = 0; e < e_cnt[i]; e++) {
+          int_t k = e_col[i * n + e];
+          if(done[k]) continue;
+          cost_t d = d0 + cost(i, k) - ui - v[k];
+          if(d < dist[k]) {
+            if(dist[k] == inf) touched.push_back(k);
+            dist[k] = d;
+            pred[k] = i;
+            hq.push_back(make_pair(d, k));
+            std::push_heap(hq.begin(), hq.end(), cmp);
+          }
+        }
+      };
+      
+      relax(s, 0, 0);
+      
+      int_t  sink = -1;
+      cost_t D    = 0;
+      while(!hq.empty()) {
+        std::pop_heap(hq.begin(), hq.end(), cmp);
+        cost_t d = hq.back().first;
+        int_t  j = hq.back().second;
+        hq.pop_back();
+        if(done[j] || d > dist[j]) continue;
+        
+        done[j] = 1;
+        if(col_row[j] == -1) {
+          sink = j;
+          D    = d;
+          break;
+        }
+        
+        int_t i = col_row[j];
+        relax(i, d, row_cost[i] - v[j]);
+      }
+      
+      if(sink == -1) {
+        for(int_t j : touched) {
+          dist[j] = inf;
+          done[j] = 0;
+        }
+        return false;
+      }
+      
+      // update duals of scanned columns
+      for(int_t j : touched) {
+        if(done[j]) v[j] += dist[j] - D;
+      }
+      
+      // augment
+      int_t j = sink;
+      while(true) {
+        int_t i  = pred[j];
+        int_t jn = row_col[i];
+        row_col[i]  = j;
+        col_row[j]  = i;
+        row_cost[i] = cost(i, j);
+        if(i == (int_t)s) break;
+        j = jn;
+      }
+      
+      for(int_t j : touched) {
+        dist[j] = inf;
+        done[j] = 0;
+      }
+    }
+    
+    for(uint_t i = 0; i < n; i++)
+      ind[i] = sel[row_col[i]];
+    
+    return true;
+}
+
+
+void solve_sub_lap(lap_solver_t solver, const uint_t n, const uint_t u, cost_t* cost_sub, size_t* sel, int_t* ind, lap_workspace_t* ws) {
+    if(solver == LAP_SAP) {
+      if(!sap_sub_lap(n, u, cost_sub, sel, ind, ws))
+        sub_lap(n, u, cost_sub, sel, ind, ws); // no augmenting path: fall back to the padded solver
+    } else {
+      sub_lap(n, u, cost_sub, sel, ind, ws);
+    }
+}
+
+
+void rect_lap(const uint_t n, const uint_t m, cost_t* cost, cost_t* pcost, int_t* ind, int_t* w_p, lap_workspace_t* ws, lap_solver_t solver = LAP_PADDED) {
     uint_t u;
     
-    size_t* sel = (size_t*)malloc(n * n * sizeof(size_t));
+    size_t* sel = ws_reserve(ws->sel, ws->sel_cap, (size_t)n * n);
     
     // <<
 #ifdef LAP__HEAPSORT
@@ -109,51 +366,78 @@ void rect_lap(const uint_t n, const uint_t m, cost_t* cost, cost_t* pcost, int_t
 #endif
     
     std::random_shuffle(sel, sel + u); // increase randomness
-    cost_t* cost_sub = (cost_t*)malloc(n * u * sizeof(cost_t));
+    cost_t* cost_sub = ws_reserve(ws->cost_sub, ws->cost_sub_cap, (size_t)n * u);
     
-    cost_t cost_sub_max = -1;
     for(uint_t i = 0; i < n; i++) {
       for(uint_t j = 0; j < u; j++) {
-        cost_t val = cost[i * m + sel[j]];
-        cost_sub[i * u + j] = val;
-        if(val > cost_sub_max) {
-          cost_sub_max = val;
-        }
+        cost_sub[i * u + j] = cost[i * m + sel[j]];
       }
     }
     
-    cost_t cost_sub_max2 = -1;
-    for(uint_t i = 0; i < n * u; i++) {
-      cost_sub[i] = (1 + cost_sub_max) - cost_sub[i];
-      if(cost_sub[i] > cost_sub_max2) {
-        cost_sub_max2 = cost_sub[i];
+    solve_sub_lap(solver, n, u, cost_sub, sel, ind, ws);
+}
+
+
+void sparse_row_argsort(size_t* sel, csr_t* cost, uint_t& u) {
+    // top-n entries of each row of `cost`, restricted to its sparsity pattern
+    const uint_t n = cost->nrow;
+    
+    u = 0;
+    for(uint_t i = 0; i < n; i++) {
+      int_t   start = cost->indptr[i];
+      cost_t* _x    = cost->data + start;
+      
+      uint_t k = row_topk(sel + u, n, cost->indptr[i + 1] - start, [&_x](size_t j) -> cost_t { return _x[j]; });
+      for(uint_t j = 0; j < k; j++) {
+        sel[u + j] = cost->indices[start + sel[u + j]];
       }
+      u += k;
     }
     
-    uint_t k         = n + u;
-    cost_t* cost_pad = (cost_t*)malloc(k * k * sizeof(cost_t));
-    for(uint_t r = 0; r < k; r++) {
-      for(uint_t c = 0; c < k; c++) {
-        if((r < u) && (c < n)) {
-          cost_pad[r * k + c] = cost_sub[c * u + r];
-        } else if(r >= u && c >= n) {
-          cost_pad[r * k + c] = 0;
-        } else {
-          cost_pad[r * k + c] = 1 + cost_sub_max2;
-        }
-      }
+    std::sort(sel, sel + u);
+    auto it = std::unique(sel, sel + u);
+    u = std::distance(sel, it);
+    
+    // Too few candidate columns for a full matching -- pad w/ arbitrary non-candidates
+    uint_t u_cand = u;
+    size_t col    = 0;
+    uint_t p      = 0;
+    while(u < n && col < (size_t)cost->ncol) {
+      while(p < u_cand && sel[p] < col) p++;
+      if(p == u_cand || sel[p] != col) sel[u++] = col;
+      col++;
     }
+    std::sort(sel, sel + u);
+}
 
-    int_t* x = (int_t*)malloc(k * sizeof(int_t));
-    int_t* y = (int_t*)malloc(k * sizeof(int_t));
-    lapjv_internal(k, cost_pad, x, y);
 
-    for(uint_t i = 0; i < n; i++)
-      ind[i] = sel[y[i]];
+void sparse_rect_lap(csr_t* cost, int_t* ind, lap_workspace_t* ws, lap_solver_t solver = LAP_PADDED) {
+    // `rect_lap`, where entries off of the sparsity pattern of `cost` are never selected as candidates
+    const uint_t n = cost->nrow;
+    uint_t u;
     
-    free(sel);
-    free(cost_sub);
-    free(cost_pad);
-    free(x);
-    free(y);
-}
\ No newline at end of file
+    size_t* sel = ws_reserve(ws->sel, ws->sel_cap, (size_t)n * n);
+    sparse_row_argsort(sel, cost, u);
+    
+    uint_t* perm  = ws_reserve(ws->perm,  ws->perm_cap,  u);
+    uint_t* iperm = ws_reserve(ws->iperm, ws->iperm_cap, u);
+    for(uint_t j = 0; j < u; j++) perm[j] = j;
+    std::random_shuffle(perm, perm + u); // increase randomness
+    for(uint_t j = 0; j < u; j++) iperm[perm[j]] = j;
+    
+    cost_t* cost_sub = ws_reserve(ws->cost_sub, ws->cost_sub_cap, (size_t)n * u);
+    for(uint_t i = 0; i < n * u; i++) cost_sub[i] = 0;
+    
+    for(uint_t i = 0; i < n; i++) {
+      for(int_t offset = cost->indptr[i]; offset < cost->indptr[i + 1]; offset++) {
+        size_t* it = std::lower_bound(sel, sel + u, (size_t)cost->indices[offset]);
+        if(it == sel + u || *it != (size_t)cost->indices[offset]) continue;
+        cost_sub[i * u + iperm[it - sel]] = cost->data[offset];
+      }
+    }
+    
+    size_t* sel_perm = ws_reserve(ws->sel_perm, ws->sel_perm_cap, u);
+    for(uint_t j = 0; j < u; j++) sel_perm[j] = sel[perm[j]];
+    
+    solve_sub_lap(solver, n, u, cost_sub, sel_perm, ind, ws);
+}
@@ -0,0 +1,79 @@
+#pragma once
+
+#include <mutex>
+#include <vector>
+#include <unordered_map>
+
+// --
+// Concurrent set of assignments
+//  - restarts insert their final assignment + objective; duplicates are merged into
+//    (number of hits, best objective, first run that found it)
+//  - sharded by hash w/ one mutex per shard, so concurrent inserts rarely contend
+
+struct match_t {
+  int_t hits      = 0;
+  acc_t best      = 0;
+  int_t first_run = 0;
+};
+
+struct match_hash_t {
+  size_t operator()(const vector<int_t>& key) const {
+    // FNV-1a over the assignment, w/ a final avalanche so low + high bits are both usable
+    uint64_t h = 14695981039346656037ULL;
+    for(int_t x : key) {
+      h ^= (uint64_t)x;
+      h *= 1099511628211ULL;
+    }
+    h ^= h >> 33;
+    h *= 0xff51afd7ed558ccdULL;
+    h ^= h >> 33;
+    return (size_t)h;
+  }
+};
+
+struct match_set_t {
+  static const int N_SHARDS = 64;
+
+  struct alignas(64) shard_t {
+    std::mutex                                           lock;
+    unordered_map<vector<int_t>, match_t, match_hash_t>  matches;
+  };
+
+  shard_t shards[N_SHARDS];
+
+  void insert(const int_t* ind, int_t nt, acc_t score, int_t run_id) {
+    vector<int_t> key(ind, ind + nt);
+    shard_t& shard = shards[(match_hash_t()(key) >> 58) % N_SHARDS]; // high bits pick the shard, low bits the bucket
+
+    std::lock_guard<std::mutex> guard(shard.lock);
+    auto it = shard.matches.find(key);
+    if(it == shard.matches.end()) {
+      match_t m;
+      m.hits      = 1;
+      m.best      = score;
+      m.first_run = run_id;
+      shard.matches.emplace(std::move(key), m);
+    } else {
+      match_t& m = it->second;
+      m.hits++;
+      if(score > m.best) m.best = score;
+      if(run_id < m.first_run) m.first_run = run_id;
+    }
+  }
+
+  // Matches sorted by best objective (desc), then hits (desc), then first run -- so the order
+  // doesn't depend on thread scheduling.  Not thread-safe: call once all inserts are done.
+  vector<pair<const vector<int_t>*, const match_t*>> sorted() {
+    vector<pair<const vector<int_t>*, const match_t*>> out;
+    for(auto& shard : shards) {
+      for(auto& kv : shard.matches) out.push_back(make_pair(&kv.first, &kv.second));
+    }
+
+    std::sort(out.begin(), out.end(), [](const pair<const vector<int_t>*, const match_t*>& a, const pair<const vector<int_t>*, const match_t*>& b) {
+      if(a.second->best != b.second->best) return a.second->best > b.second->best;
+      if(a.second->hits != b.second->hits) return a.second->hits > b.second->hits;
+      return a.second->first_run < b.second->first_run;
+    });
+    return out;
+  }
+};
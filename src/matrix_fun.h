@@ -1,5 +1,29 @@
 #pragma once
 
+#define KERNEL__MIN_BLOCK 4096  // minimum width of a column block in kernel-parallel mode
+
+// --
+// Kernel-level parallelism
+//  - when called from inside a parallel region (run-level parallelism), kernels run serially
+//  - otherwise, rows of `out` are split into column blocks, and (row, block) tiles are
+//    processed in parallel.  Tiles write to disjoint parts of `out`, so no accumulators are shared.
+
+int_t kernel_blocks(int_t nrow, int_t ncol) {
+  if(omp_in_parallel()) return 1;
+  
+  int_t nthreads = omp_get_max_threads();
+  int_t nblocks  = (4 * nthreads + nrow - 1) / nrow;
+  return max((int_t)1, min(nblocks, (int_t)(ncol / KERNEL__MIN_BLOCK)));
+}
+
+inline void block_range(csr_t* Y, int_t r, int_t h0, int_t h1, int_t& lo, int_t& hi) {
+  // offsets of the entries of row `r` of `Y` w/ column in [h0, h1).  Assumes sorted indices.
+  lo = Y->indptr[r];
+  hi = Y->indptr[r + 1];
+  if(h0 > 0)       lo = std::lower_bound(Y->indices + lo, Y->indices + hi, h0) - Y->indices;
+  if(h1 < Y->ncol) hi = std::lower_bound(Y->indices + lo, Y->indices + hi, h1) - Y->indices;
+}
+
 void stacked_multiply(
   arr2d_t<cost_t>* out,
   int_t n,
@@ -7,62 +31,278 @@ void stacked_multiply(
   csr_t* P,
   csr_t* Y
 ) {
+  int_t nblocks = kernel_blocks(X->nrow, out->ncol);
+  int_t bsize   = (out->ncol + nblocks - 1) / nblocks;
+  
+  #pragma omp parallel for collapse(2) schedule(dynamic) if(!omp_in_parallel())
   for(int_t i = 0; i < X->nrow; i++) {
-    
-    for(int_t j = 0; j < out->ncol; j++) {
-      out->data[i * out->ncol + j] = 0;
+    for(int_t b = 0; b < nblocks; b++) {
+      int_t h0 = b * bsize;
+      int_t h1 = min(out->ncol, h0 + bsize);
+      
+      for(int_t j = h0; j < h1; j++) {
+        out->data[i * out->ncol + j] = 0;
+      }
+      
+      for(int_t jA = X->indptr[i]; jA < X->indptr[i + 1]; jA++) {
+        int_t j      = X->indices[jA] % (X->ncol / n);
+        int_t m      = X->indices[jA] / (X->ncol / n);
+        cost_t j_val = X->data[jA];
+        
+        for(int_t kB = P->indptr[j]; kB < P->indptr[j + 1]; kB++) {
+          int_t k      = P->indices[kB];
+          cost_t k_val = P->data[kB];
+          
+          int_t lo, hi;
+          block_range(Y, m * Y->ncol + k, h0, h1, lo, hi);
+          for(int_t hP = lo; hP < hi; hP++) {
+            int_t h      = Y->indices[hP];
+            cost_t h_val = Y->data[hP];
+            out->data[i * out->ncol + h] += j_val * k_val * h_val;
+          }
+        }
+      }
     }
-    
-    for(int_t jA = X->indptr[i]; jA < X->indptr[i + 1]; jA++) {
-      int_t j      = X->indices[jA] % (X->ncol / n);
-      int_t m      = X->indices[jA] / (X->ncol / n);
-      cost_t j_val = X->data[jA];
+  }
+}
+
+void stacked_multiply(
+  arr2d_t<cost_t>* out,
+  int_t n,
+  csr_t* X,
+  int_t* P,
+  csr_t* Y
+) {
+  int_t nblocks = kernel_blocks(X->nrow, out->ncol);
+  int_t bsize   = (out->ncol + nblocks - 1) / nblocks;
+  
+  #pragma omp parallel for collapse(2) schedule(dynamic) if(!omp_in_parallel())
+  for(int_t i = 0; i < X->nrow; i++) {
+    for(int_t b = 0; b < nblocks; b++) {
+      int_t h0 = b * bsize;
+      int_t h1 = min(out->ncol, h0 + bsize);
       
-      for(int_t kB = P->indptr[j]; kB < P->indptr[j + 1]; kB++) {
-        int_t k      = P->indices[kB];
-        cost_t k_val = P->data[kB];
+      for(int_t j = h0; j < h1; j++) {
+        out->data[i * out->ncol + j] = 0;
+      }
+
+      for(int_t jA = X->indptr[i]; jA < X->indptr[i + 1]; jA++) {
+        int_t j      = X->indices[jA] % (X->ncol / n);
+        int_t m      = X->indices[jA] / (X->ncol / n);
+        cost_t j_val = X->data[jA];
+        int_t k      = P[j];
         
-        for(int_t hP = Y->indptr[m * Y->ncol + k]; hP < Y->indptr[m * Y->ncol + k + 1]; hP++) {
+        int_t lo, hi;
+        block_range(Y, m * Y->ncol + k, h0, h1, lo, hi);
+        for(int_t hP = lo; hP < hi; hP++) {
           int_t h      = Y->indices[hP];
           cost_t h_val = Y->data[hP];
-          out->data[i * out->ncol + h] += j_val * k_val * h_val;
+          out->data[i * out->ncol + h] += j_val * h_val;
         }
       }
     }
   }
 }
 
+// --
+// Candidate-restricted versions
+//  - `out` shares the sparsity pattern of the similarity matrix, and only entries on that
+//    pattern are accumulated
+//  - `pos` is scratch space of length `out->ncol` per thread, filled w/ -1 on entry and on exit
+
 void stacked_multiply(
-  arr2d_t<cost_t>* out,
+  csr_t* out,
+  int_t n,
+  csr_t* X,
+  csr_t* P,
+  csr_t* Y,
+  int_t* pos
+) {
+  int_t nblocks = kernel_blocks(X->nrow, out->ncol);
+  int_t bsize   = (out->ncol + nblocks - 1) / nblocks;
+  
+  #pragma omp parallel for collapse(2) schedule(dynamic) if(!omp_in_parallel())
+  for(int_t i = 0; i < X->nrow; i++) {
+    for(int_t b = 0; b < nblocks; b++) {
+      int_t h0 = b * bsize;
+      int_t h1 = min(out->ncol, h0 + bsize);
+      
+      int_t* _pos = pos + (omp_in_parallel() ? omp_get_thread_num() * out->ncol : 0);
+      
+      int_t o_lo, o_hi;
+      block_range(out, i, h0, h1, o_lo, o_hi);
+      if(o_lo == o_hi) continue;
+      
+      for(int_t offset = o_lo; offset < o_hi; offset++) {
+        out->data[offset]          = 0;
+        _pos[out->indices[offset]] = offset;
+      }
+      
+      for(int_t jA = X->indptr[i]; jA < X->indptr[i + 1]; jA++) {
+        int_t j      = X->indices[jA] % (X->ncol / n);
+        int_t m      = X->indices[jA] / (X->ncol / n);
+        cost_t j_val = X->data[jA];
+        
+        for(int_t kB = P->indptr[j]; kB < P->indptr[j + 1]; kB++) {
+          int_t k      = P->indices[kB];
+          cost_t k_val = P->data[kB];
+          
+          int_t lo, hi;
+          block_range(Y, m * Y->ncol + k, h0, h1, lo, hi);
+          for(int_t hP = lo; hP < hi; hP++) {
+            int_t o = _pos[Y->indices[hP]];
+            if(o >= 0) out->data[o] += j_val * k_val * Y->data[hP];
+          }
+        }
+      }
+      
+      for(int_t offset = o_lo; offset < o_hi; offset++) {
+        _pos[out->indices[offset]] = -1;
+      }
+    }
+  }
+}
+
+void stacked_multiply(
+  csr_t* out,
   int_t n,
   csr_t* X,
   int_t* P,
-  csr_t* Y
+  csr_t* Y,
+  int_t* pos
 ) {
+  int_t nblocks = kernel_blocks(X->nrow, out->ncol);
+  int_t bsize   = (out->ncol + nblocks - 1) / nblocks;
+  
+  #pragma omp parallel for collapse(2) schedule(dynamic) if(!omp_in_parallel())
   for(int_t i = 0; i < X->nrow; i++) {
+    for(int_t b = 0; b < nblocks; b++) {
+      int_t h0 = b * bsize;
+      int_t h1 = min(out->ncol, h0 + bsize);
+      
+      int_t* _pos = pos + (omp_in_parallel() ? omp_get_thread_num() * out->ncol : 0);
+      
+      int_t o_lo, o_hi;
+      block_range(out, i, h0, h1, o_lo, o_hi);
+      if(o_lo == o_hi) continue;
+      
+      for(int_t offset = o_lo; offset < o_hi; offset++) {
+        out->data[offset]          = 0;
+        _pos[out->indices[offset]] = offset;
+      }
+      
+      for(int_t jA = X->indptr[i]; jA < X->indptr[i + 1]; jA++) {
+        int_t j      = X->indices[jA] % (X->ncol / n);
+        int_t m      = X->indices[jA] / (X->ncol / n);
+        cost_t j_val = X->data[jA];
+        int_t k      = P[j];
+        
+        int_t lo, hi;
+        block_range(Y, m * Y->ncol + k, h0, h1, lo, hi);
+        for(int_t hP = lo; hP < hi; hP++) {
+          int_t o = _pos[Y->indices[hP]];
+          if(o >= 0) out->data[o] += j_val * Y->data[hP];
+        }
+      }
+      
+      for(int_t offset = o_lo; offset < o_hi; offset++) {
+        _pos[out->indices[offset]] = -1;
+      }
+    }
+  }
+}
+
+// --
+// Incremental updates
+//  - `out` holds the product for the assignment `P_old`, and is updated in place to the product
+//    for `P_new`.  Only entries of `X` whose column's assignment changed are touched, so the cost
+//    is O(changed rows * degree) instead of O(nrow * ncol).
 
-    for(int_t j = 0; j < out->ncol; j++) {
-      out->data[i * out->ncol + j] = 0;
+void stacked_update(
+  arr2d_t<cost_t>* out,
+  int_t n,
+  csr_t* X,
+  int_t* P_old,
+  int_t* P_new,
+  csr_t* Y
+) {
+  #pragma omp parallel for schedule(dynamic) if(!omp_in_parallel())
+  for(int_t i = 0; i < X->nrow; i++) {
+    for(int_t jA = X->indptr[i]; jA < X->indptr[i + 1]; jA++) {
+      int_t j      = X->indices[jA] % (X->ncol / n);
+      int_t m      = X->indices[jA] / (X->ncol / n);
+      cost_t j_val = X->data[jA];
+      int_t k0     = P_old[j];
+      int_t k1     = P_new[j];
+      if(k0 == k1) continue;
+      
+      for(int_t hP = Y->indptr[m * Y->ncol + k0]; hP < Y->indptr[m * Y->ncol + k0 + 1]; hP++) {
+        out->data[i * out->ncol + Y->indices[hP]] -= j_val * Y->data[hP];
+      }
+      for(int_t hP = Y->indptr[m * Y->ncol + k1]; hP < Y->indptr[m * Y->ncol + k1 + 1]; hP++) {
+        out->data[i * out->ncol + Y->indices[hP]] += j_val * Y->data[hP];
+      }
     }
+  }
+}
 
+void stacked_update(
+  csr_t* out,
+  int_t n,
+  csr_t* X,
+  int_t* P_old,
+  int_t* P_new,
+  csr_t* Y,
+  int_t* pos
+) {
+  #pragma omp parallel for schedule(dynamic) if(!omp_in_parallel())
+  for(int_t i = 0; i < X->nrow; i++) {
+    int_t* _pos  = pos + (omp_in_parallel() ? omp_get_thread_num() * out->ncol : 0);
+    bool   ready = false;
+    
     for(int_t jA = X->indptr[i]; jA < X->indptr[i + 1]; jA++) {
       int_t j      = X->indices[jA] % (X->ncol / n);
       int_t m      = X->indices[jA] / (X->ncol / n);
       cost_t j_val = X->data[jA];
-      int_t k      = P[j];
-      for(int_t hP = Y->indptr[m * Y->ncol + k]; hP < Y->indptr[m * Y->ncol + k + 1]; hP++) {
-        int_t h      = Y->indices[hP];
-        cost_t h_val = Y->data[hP];
-        out->data[i * out->ncol + h] += j_val * h_val;
+      int_t k0     = P_old[j];
+      int_t k1     = P_new[j];
+      if(k0 == k1) continue;
+      
+      if(!ready) {
+        for(int_t offset = out->indptr[i]; offset < out->indptr[i + 1]; offset++)
+          _pos[out->indices[offset]] = offset;
+        ready = true;
       }
+      
+      for(int_t hP = Y->indptr[m * Y->ncol + k0]; hP < Y->indptr[m * Y->ncol + k0 + 1]; hP++) {
+        int_t o = _pos[Y->indices[hP]];
+        if(o >= 0) out->data[o] -= j_val * Y->data[hP];
+      }
+      for(int_t hP = Y->indptr[m * Y->ncol + k1]; hP < Y->indptr[m * Y->ncol + k1 + 1]; hP++) {
+        int_t o = _pos[Y->indices[hP]];
+        if(o >= 0) out->data[o] += j_val * Y->data[hP];
+      }
+    }
+    
+    if(ready) {
+      for(int_t offset = out->indptr[i]; offset < out->indptr[i + 1]; offset++)
+        _pos[out->indices[offset]] = -1;
     }
   }
 }
 
+int_t pattern_find(csr_t* x, int_t i, int_t j) {
+  // offset of entry (i, j) in `x`, or -1 if it's not on the pattern.  Assumes sorted indices.
+  int_t* lo = x->indices + x->indptr[i];
+  int_t* hi = x->indices + x->indptr[i + 1];
+  int_t* it = std::lower_bound(lo, hi, j);
+  return (it != hi && *it == j) ? (int_t)(it - x->indices) : -1;
+}
+
 void compute_traces(
-  cost_t& a,
-  cost_t& b,
-  cost_t& c,
+  acc_t& a,
+  acc_t& b,
+  acc_t& c,
   arr2d_t<cost_t> *x, 
   arr2d_t<cost_t> *y, 
   arr2d_t<cost_t> *z, 
@@ -75,17 +315,17 @@ void compute_traces(
   for(int_t i = 0; i < A->nrow; i++) {
     for(int_t offset = A->indptr[i] ; offset < A->indptr[i + 1]; offset++) {
       int_t j = A->indices[offset];
-      a += x->data[i * x->ncol + j] * A->data[offset];
-      b += y->data[i * y->ncol + j] * A->data[offset];
-      c += z->data[i * z->ncol + j] * A->data[offset];
+      a += (acc_t)x->data[i * x->ncol + j] * A->data[offset];
+      b += (acc_t)y->data[i * y->ncol + j] * A->data[offset];
+      c += (acc_t)z->data[i * z->ncol + j] * A->data[offset];
     }
   }
 }
 
 void compute_traces(
-  cost_t& a,
-  cost_t& b,
-  cost_t& c,
+  acc_t& a,
+  acc_t& b,
+  acc_t& c,
   arr2d_t<cost_t> *x, 
   arr2d_t<cost_t> *y, 
   arr2d_t<cost_t> *z, 
@@ -96,9 +336,83 @@ void compute_traces(
   b = 0;
   c = 0;
   for(int_t i = 0; i < n; i++) {
-    a += x->data[i * x->ncol + A[i]];
-    b += y->data[i * y->ncol + A[i]];
-    c += z->data[i * z->ncol + A[i]];
+    a += (acc_t)x->data[i * x->ncol + A[i]];
+    b += (acc_t)y->data[i * y->ncol + A[i]];
+    c += (acc_t)z->data[i * z->ncol + A[i]];
+  }
+}
+
+void compute_traces(
+  acc_t& a,
+  acc_t& b,
+  acc_t& c,
+  csr_t *x, 
+  csr_t *y, 
+  csr_t *z, 
+  csr_t *A
+) {
+  // x, y, z share a pattern; A's pattern is a subset of it.  Both have sorted indices.
+  a = 0;
+  b = 0;
+  c = 0;
+
+  for(int_t i = 0; i < A->nrow; i++) {
+    int_t px = x->indptr[i];
+    for(int_t offset = A->indptr[i] ; offset < A->indptr[i + 1]; offset++) {
+      int_t j = A->indices[offset];
+      while(px < x->indptr[i + 1] && x->indices[px] < j) px++;
+      if(px == x->indptr[i + 1] || x->indices[px] != j) continue;
+      
+      a += (acc_t)x->data[px] * A->data[offset];
+      b += (acc_t)y->data[px] * A->data[offset];
+      c += (acc_t)z->data[px] * A->data[offset];
+    }
+  }
+}
+
+void compute_traces(
+  acc_t& a,
+  acc_t& b,
+  acc_t& c,
+  csr_t *x, 
+  csr_t *y, 
+  csr_t *z, 
+  int_t* A,
+  int_t n
+) {
+  a = 0;
+  b = 0;
+  c = 0;
+  for(int_t i = 0; i < n; i++) {
+    int_t offset = pattern_find(x, i, A[i]);
+    if(offset < 0) continue;
+    
+    a += (acc_t)x->data[offset];
+    b += (acc_t)y->data[offset];
+    c += (acc_t)z->data[offset];
+  }
+}
+
+void compute_trace(acc_t& a, arr2d_t<cost_t> *x, csr_t *A) {
+  a = 0;
+  for(int_t i = 0; i < A->nrow; i++) {
+    for(int_t offset = A->indptr[i] ; offset < A->indptr[i + 1]; offset++) {
+      a += (acc_t)x->data[i * x->ncol + A->indices[offset]] * A->data[offset];
+    }
+  }
+}
+
+void compute_trace(acc_t& a, csr_t *x, csr_t *A) {
+  // x's pattern is a superset of A's.  Both have sorted indices.
+  a = 0;
+  for(int_t i = 0; i < A->nrow; i++) {
+    int_t px = x->indptr[i];
+    for(int_t offset = A->indptr[i] ; offset < A->indptr[i + 1]; offset++) {
+      int_t j = A->indices[offset];
+      while(px < x->indptr[i + 1] && x->indices[px] < j) px++;
+      if(px == x->indptr[i + 1] || x->indices[px] != j) continue;
+      a += (acc_t)x->data[px] * A->data[offset];
+    }
   }
 }
 
@@ -107,7 +421,18 @@ void dense_convex_combination(
   arr2d_t<cost_t> *a,
   arr2d_t<cost_t> *b
 ) {
-  // #pragma GCC ivdep
+  #pragma omp parallel for simd if(parallel: !omp_in_parallel())
+  for(int_t i = 0; i < a->nnz; i++) {
+    b->data[i] = alpha * b->data[i] + (1 - alpha) * a->data[i];
+  }
+}
+
+void pattern_convex_combination(
+  cost_t alpha,
+  csr_t *a,
+  csr_t *b
+) {
+  #pragma omp parallel for simd if(parallel: !omp_in_parallel())
   for(int_t i = 0; i < a->nnz; i++) {
     b->data[i] = alpha * b->data[i] + (1 - alpha) * a->data[i];
   }
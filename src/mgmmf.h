@@ -24,6 +24,7 @@
 #include <math.h>
 #include <random>
 #include <cmath>
+#include <atomic>
 
 // external
 #include "extern/lapjv.h"
@@ -34,8 +35,73 @@
 #include "matrix_fun.h"
 #include "lap_fun.h"
 #include "init_fun.h"
+#include "match_set.h"
 
-void mgmmf(
+// --
+// Instrumentation
+//  - pass a `run_stats_t` to `mgmmf` / `mgmmf_sparse` to collect per-restart counters and
+//    cumulative per-phase times.  `nullptr` (the default) skips all timing.
+//  - pass `score` to get the objective of the final assignment (`PHASE_SCORE`).  Skipped if null.
+//  - the wrapper keeps one per thread; `phase_ns` accumulates across restarts and is merged at the end
+
+enum stats_phase_t {
+  PHASE_INIT,   // initialization of P, and the initial Z0 / Z1 products
+  PHASE_GRAD,   // gradient
+  PHASE_LAP,    // LAP in each iteration
+  PHASE_UPDATE, // Z0p / Z1p products + traces
+  PHASE_STEP,   // line search + convex combination / copy
+  PHASE_ROUND,  // final LAP on P
+  PHASE_SCORE,  // objective of the final assignment
+  N_PHASES
+};
+
+enum exit_reason_t {
+  EXIT_CONVERGED = 0, // line search found no improving step
+  EXIT_MAX_ITER  = 1, // ran `max_iter` iterations
+  EXIT_PRUNED    = 2, // abandoned by `prune_t`
+};
+
+struct alignas(64) run_stats_t { // own cache line(s), so per-thread instances don't share
+  int_t     n_iter      = 0;
+  int8_t    exit_reason = EXIT_MAX_ITER;
+  long long phase_ns[N_PHASES] = {0};
+};
+
+// --
+// Pruning
+//  - restarts share `incumbent`, the best final objective found so far.  After `min_iter`
+//    iterations, a restart is abandoned (EXIT_PRUNED) once its optimistic bound -- the linearized
+//    objective at P maximized by the LAP step (f(P) + Frank-Wolfe gap), or the LAP solution's own
+//    objective if higher -- is below (1 - margin) * reference.  The reference is `target` if set
+//    (eg, the objective of an exact match), else the incumbent.
+//  - assumes nonnegative objectives.  The relaxation is nonconvex, so the linearization is only an
+//    upper bound on the next step, not on everything the restart can reach -- `margin` and `min_iter`
+//    trade lost restarts off against wasted iterations.
+//  - a pruned restart keeps its last LAP solution instead of rounding P
+
+struct prune_t {
+  std::atomic<acc_t> incumbent{-std::numeric_limits<acc_t>::infinity()};
+  bool               has_target = false;
+  acc_t              target     = 0;
+  acc_t              margin     = 0;
+  int_t              min_iter   = 1;
+  
+  acc_t threshold() const {
+    acc_t ref = has_target ? target : incumbent.load(std::memory_order_relaxed);
+    return (1 - margin) * ref;
+  }
+  
+  bool hopeless(int_t n_iter, acc_t obj) const {
+    return n_iter >= min_iter && obj < threshold();
+  }
+  
+  void offer(acc_t obj) {
+    acc_t cur = incumbent.load(std::memory_order_relaxed);
+    while(obj > cur && !incumbent.compare_exchange_weak(cur, obj, std::memory_order_relaxed)) {}
+  }
+};
+
+exit_reason_t mgmmf(
   int_t*           ind,     // output
   int_t            nc,      // number of channels
   int_t            nt,      // number of tmplt nodes
@@ -50,20 +116,33 @@ void mgmmf(
   int_t*           w_p_ex    = nullptr,
   uint32_t         seed      = 123,
   
-  arr2d_t<int_t>*  solution_counter = nullptr,
+  arr2d_t<int_t>*  solution_counter = nullptr, // read-only here -- see `update_diversity`
   cost_t           scale_eps        = 1.0,
-  bool             scale_init       = false,
-  bool             scale_sim        = false,
   bool             scale_grad       = false,
   
   int_t            max_iter  = 20,
   
   int_t            init_iter             = 20,  // Number of iterations for double-stochastic initialization
-  bool             init_doublestochastic = true // Use double-stochastic initialization (vs just row normalization)
+  bool             init_doublestochastic = true, // Use double-stochastic initialization (vs just row normalization)
+  
+  lap_workspace_t* lap_ws = nullptr, // LAP scratch space, reused across restarts.  Allocated per-restart if null.
+  lap_solver_t     lap_solver = LAP_PADDED,
+  
+  run_stats_t*     stats      = nullptr, // per-restart counters / phase times (optional)
+  acc_t*           score      = nullptr, // output: objective of the final assignment (optional)
+  const prune_t*   prune      = nullptr  // abandon hopeless restarts (optional)
 ) {
-    cost_t c, d0, u, d1, e, v;
-    cost_t d, z0, z1, f1;
-    cost_t alpha, falpha;
+    acc_t c, d0, u, d1, e, v;
+    
+    lap_workspace_t _lap_ws;
+    bool own_lap_ws = (lap_ws == nullptr);
+    if(own_lap_ws) lap_ws = &_lap_ws;
+    acc_t d, z0, z1, f1;
+    
+    phase_timer_t timer(stats != nullptr ? stats->phase_ns : nullptr);
+    int_t         n_iter      = 0;
+    exit_reason_t exit_reason = EXIT_MAX_ITER;
+    acc_t alpha, falpha;
 
     arr2d_t<cost_t> _grad(sim->nrow, sim->ncol);
     arr2d_t<cost_t> _Z0(sim->nrow, sim->ncol);
@@ -83,13 +162,13 @@ void mgmmf(
     int_t* w_p = (int_t*)malloc(nw * sizeof(int_t));
 #if defined(GRAD__PERMUTE) || defined(LAP__HEAPSORT)
     if(w_p_ex == nullptr) {
-      for(int i = 0 ; i < nw ; i++)
+      for(int_t i = 0 ; i < nw ; i++)
         w_p[i] = i;
       
       srand(seed);
       random_shuffle(w_p, w_p + nw);
     } else {
-      for(int i = 0 ; i < nw ; i++)
+      for(int_t i = 0 ; i < nw ; i++)
         w_p[i] = w_p_ex[i];
     }
 #endif
@@ -115,8 +194,17 @@ void mgmmf(
     stacked_multiply(Z0, nc, At, P, B);
     stacked_multiply(Z1, nc, A, P, Bt);
     
+    // c = <Z0, P> and u = <sim, P> are carried across iterations in closed form
+    compute_traces(c, d0, u, Z0, Z0, sim, P);
+    timer.lap(PHASE_INIT);
+    
+    // Z0p / Z1p always hold the products for `ind_prev`, and are updated incrementally
+    int_t* ind_prev = (int_t*)malloc(nt * sizeof(int_t));
+    bool   Zp_valid = false;
+    
     mu_timer_t tt;
     for(int_t it = 0; it < max_iter; it++) {
+      n_iter++;
       
       // Compute grad
 #ifdef GRAD__PERMUTE
@@ -131,7 +219,7 @@ void mgmmf(
         }
       }
 #else
-      #pragma GCC ivdep
+      #pragma omp parallel for simd if(parallel: !omp_in_parallel())
       for(int_t i = 0; i < sim->nnz; i++) {
         grad->data[i] = Z0->data[i] + Z1->data[i] + sim->data[i];
         if(scale_grad) {
@@ -139,32 +227,49 @@ void mgmmf(
         }
       }
 #endif
+      timer.lap(PHASE_GRAD);
 
       // Solve LAP
-      rect_lap(grad->nrow, grad->ncol, grad->data, grad->data, ind, w_p);
+      rect_lap(grad->nrow, grad->ncol, grad->data, grad->data, ind, w_p, lap_ws, lap_solver);
 
 #ifdef GRAD__PERMUTE
       for(int_t i = 0; i < nt; i++)
         ind[i] = w_p[ind[i]];
 #endif
+      timer.lap(PHASE_LAP);
 
-      stacked_multiply(Z0p, nc, At, ind, B);
-      stacked_multiply(Z1p, nc, A, ind, Bt);
+      if(Zp_valid) {
+        stacked_update(Z0p, nc, At, ind_prev, ind, B);
+        stacked_update(Z1p, nc, A, ind_prev, ind, Bt);
+      } else {
+        stacked_multiply(Z0p, nc, At, ind, B);
+        stacked_multiply(Z1p, nc, A, ind, Bt);
+        Zp_valid = true;
+      }
+      memcpy(ind_prev, ind, nt * sizeof(int_t));
       
-      compute_traces(c, d0, u, Z0, Z0p, sim, P);
+      compute_trace(d0, Z0p, P);
       compute_traces(d1, e, v, Z0, Z0p, sim, ind, nt);
+      timer.lap(PHASE_UPDATE);
 
       d  = d0 + d1;
       z0 = c - d + e;
       z1 = d - 2 * e + u - v;
       f1 = c - e + u - v;
       
+      // optimistic bound for this restart: the linearization of the objective at P, maximized by
+      // the LAP (= f(P) + Frank-Wolfe gap), or the LAP solution itself if that's better
+      if(prune != nullptr && prune->hopeless(n_iter, max(d + v - c, e + v))) {
+        exit_reason = EXIT_PRUNED;
+        break;
+      }
+      
       if((z0 == 0) && (z1 == 0)) {
         alpha = 0;
         falpha = z0 * std::pow(alpha, 2) + z1 * alpha;
       } else if(z0 == 0) {
-        alpha  = std::numeric_limits<cost_t>::max();
-        falpha = std::numeric_limits<cost_t>::max();
+        alpha  = std::numeric_limits<acc_t>::max();
+        falpha = std::numeric_limits<acc_t>::max();
       } else {
         alpha  = - z1 / (2 * z0);
         falpha = z0 * std::pow(alpha, 2) + z1 * alpha;
@@ -174,6 +279,9 @@ void mgmmf(
         sparse_convex_combination(alpha, ind, P);
         dense_convex_combination(alpha, Z0p, Z0);
         dense_convex_combination(alpha, Z1p, Z1);
+        
+        c = alpha * alpha * c + alpha * (1 - alpha) * d + (1 - alpha) * (1 - alpha) * e;
+        u = alpha * u + (1 - alpha) * v;
       } else if (f1 < 0) {
         free(P->indptr);
         free(P->indices);
@@ -185,30 +293,296 @@ void mgmmf(
         
         P->nnz = nt;
         
-        for(int i = 0; i < nt + 1; i++) P->indptr[i]  = i;
-        for(int i = 0; i < nt    ; i++) P->indices[i] = ind[i];
-        for(int i = 0; i < nt    ; i++) P->data[i]    = 1;
+        for(int_t i = 0; i < nt + 1; i++) P->indptr[i]  = i;
+        for(int_t i = 0; i < nt    ; i++) P->indices[i] = ind[i];
+        for(int_t i = 0; i < nt    ; i++) P->data[i]    = 1;
+        
+        // copy (rather than swap) so Z0p / Z1p stay valid for the next incremental update
+        memcpy(Z0->data, Z0p->data, Z0->nnz * sizeof(cost_t));
+        memcpy(Z1->data, Z1p->data, Z1->nnz * sizeof(cost_t));
         
-        std::swap(Z0, Z0p);
-        std::swap(Z1, Z1p);
+        c = e;
+        u = v;
       } else {
+        exit_reason = EXIT_CONVERGED;
         break;
       }
+      timer.lap(PHASE_STEP);
     }
+    timer.lap(PHASE_STEP); // the step that exited the loop, if any
     
-    arr2d_t<cost_t> P_dense(P->nrow, P->ncol);
-    for(int_t i = 0; i < P->nrow; i++) {
-      for(int_t offset = P->indptr[i] ; offset < P->indptr[i + 1]; offset++) {
-        int_t j = P->indices[offset];
-        P_dense.data[i * P->ncol + j] = P->data[offset];
+    if(exit_reason == EXIT_PRUNED) {
+      // keep the last LAP solution -- `e + v` is already its objective
+      if(score != nullptr) *score = e + v;
+    } else {
+      arr2d_t<cost_t> P_dense(P->nrow, P->ncol);
+      for(int_t i = 0; i < P->nrow; i++) {
+        for(int_t offset = P->indptr[i] ; offset < P->indptr[i + 1]; offset++) {
+          int_t j = P->indices[offset];
+          P_dense.data[i * P->ncol + j] = P->data[offset];
+        }
+      }
+      rect_lap(P_dense.nrow, P_dense.ncol, P_dense.data, P_dense.data, ind, nullptr, lap_ws, lap_solver);
+      free(P_dense.data);
+      timer.lap(PHASE_ROUND);
+      
+      if(score != nullptr) {
+        // objective of the final assignment: <A ind B', ind> + <sim, ind>
+        if(Zp_valid) stacked_update(Z0p, nc, At, ind_prev, ind, B);
+        else         stacked_multiply(Z0p, nc, At, ind, B);
+        compute_traces(d1, e, v, Z0p, Z0p, sim, ind, nt);
+        *score = e + v;
+        timer.lap(PHASE_SCORE);
       }
     }
-    rect_lap(P_dense.nrow, P_dense.ncol, P_dense.data, P_dense.data, ind, nullptr);
+    
+    if(stats != nullptr) {
+      stats->n_iter      = n_iter;
+      stats->exit_reason = exit_reason;
+    }
     
     // --
     // Free memory
     
-    free(P_dense.data);
+    free(P->indptr);
+    free(P->indices);
+    free(P->data);
+    
+    free(grad->data);
+    free(Z0->data);
+    free(Z1->data);
+    free(Z0p->data);
+    free(Z1p->data);
+    free(ind_prev);
+    if(own_lap_ws) lap_ws->release();
+
+#ifdef GRAD__PERMUTE
+    free(w_p);
+#endif
+    
+    return exit_reason;
+}
+
+exit_reason_t mgmmf_sparse(
+  int_t*           ind,     // output
+  int_t            nc,      // number of channels
+  int_t            nt,      // number of tmplt nodes
+  int_t            nw,      // number of world nodes
+  csr_t*           A,       // stacked adj of tmplt
+  csr_t*           At,      // (stacked adj of tmplt).T
+  csr_t*           B,       // stacked adj of world
+  csr_t*           Bt,      // (stacked adj of world).T
+  csr_t*           sim_sp,  // similarity matrix (sparse representation) -- defines the candidates
+  csr_t*           sim,     // similarity matrix values used in objective (same pattern as `sim_sp`)
+  csr_t*           P_ex      = nullptr,
+  uint32_t         seed      = 123,
+  
+  csr_t*           solution_counter = nullptr, // same pattern as `sim_sp`.  read-only here -- see `update_diversity`
+  cost_t           scale_eps        = 1.0,
+  bool             scale_grad       = false,
+  
+  int_t            max_iter  = 20,
+  
+  int_t            init_iter             = 20,
+  bool             init_doublestochastic = true,
+  
+  lap_workspace_t* lap_ws = nullptr,
+  lap_solver_t     lap_solver = LAP_PADDED,
+  
+  run_stats_t*     stats      = nullptr,
+  acc_t*           score      = nullptr,
+  const prune_t*   prune      = nullptr
+) {
+    // Candidate-restricted version of `mgmmf`
+    //  - gradient and Z buffers only hold entries on the sparsity pattern of `sim_sp`
+    //  - tmplt nodes are only ever assigned to their candidates (when enough candidates exist)
+    //  - memory is O(nnz(sim_sp) + nw) per restart instead of O(nt * nw)
+    //  - GRAD__PERMUTE and LAP__HEAPSORT are not supported
+    
+    acc_t c, d0, u, d1, e, v;
+    
+    lap_workspace_t _lap_ws;
+    bool own_lap_ws = (lap_ws == nullptr);
+    if(own_lap_ws) lap_ws = &_lap_ws;
+    acc_t d, z0, z1, f1;
+    
+    phase_timer_t timer(stats != nullptr ? stats->phase_ns : nullptr);
+    int_t         n_iter      = 0;
+    exit_reason_t exit_reason = EXIT_MAX_ITER;
+    acc_t alpha, falpha;
+
+    csr_t _grad, _Z0, _Z1, _Z0p, _Z1p;
+    _grad.alloc_like(sim_sp);
+    _Z0.alloc_like(sim_sp);
+    _Z1.alloc_like(sim_sp);
+    _Z0p.alloc_like(sim_sp);
+    _Z1p.alloc_like(sim_sp);
+    
+    csr_t* grad = &_grad;
+    csr_t* Z0   = &_Z0;
+    csr_t* Z1   = &_Z1;
+    csr_t* Z0p  = &_Z0p;
+    csr_t* Z1p  = &_Z1p;
+    
+    // one scratch row per kernel thread
+    int_t n_pos = omp_in_parallel() ? 1 : omp_get_max_threads();
+    int_t* pos  = (int_t*)malloc(n_pos * nw * sizeof(int_t));
+    for(int_t i = 0; i < n_pos * nw; i++) pos[i] = -1;
+
+    // --
+    // Initialize P
+    
+    csr_t _P;
+    csr_t* P = &_P;    
+    if(P_ex != nullptr) {
+      P->copy(P_ex);
+    } else {
+      if(init_doublestochastic) {
+        do_init_doublestochastic(sim_sp, P, seed, init_iter);
+      } else {
+        do_init_rownorm(sim_sp, P, seed);
+      }
+    }
+    
+    // --
+    // Run
+    
+    stacked_multiply(Z0, nc, At, P, B, pos);
+    stacked_multiply(Z1, nc, A, P, Bt, pos);
+    
+    // c = <Z0, P> and u = <sim, P> are carried across iterations in closed form
+    compute_traces(c, d0, u, Z0, Z0, sim, P);
+    timer.lap(PHASE_INIT);
+    
+    // Z0p / Z1p always hold the products for `ind_prev`, and are updated incrementally
+    int_t* ind_prev = (int_t*)malloc(nt * sizeof(int_t));
+    bool   Zp_valid = false;
+    
+    for(int_t it = 0; it < max_iter; it++) {
+      n_iter++;
+      
+      // Compute grad
+      #pragma omp parallel for simd if(parallel: !omp_in_parallel())
+      for(int_t i = 0; i < grad->nnz; i++) {
+        grad->data[i] = Z0->data[i] + Z1->data[i] + sim->data[i];
+        if(scale_grad) {
+          grad->data[i] *= pow(scale_eps, solution_counter->data[i]); // scale gradient
+        }
+      }
+      timer.lap(PHASE_GRAD);
+
+      // Solve LAP
+      sparse_rect_lap(grad, ind, lap_ws, lap_solver);
+      timer.lap(PHASE_LAP);
+
+      if(Zp_valid) {
+        stacked_update(Z0p, nc, At, ind_prev, ind, B, pos);
+        stacked_update(Z1p, nc, A, ind_prev, ind, Bt, pos);
+      } else {
+        stacked_multiply(Z0p, nc, At, ind, B, pos);
+        stacked_multiply(Z1p, nc, A, ind, Bt, pos);
+        Zp_valid = true;
+      }
+      memcpy(ind_prev, ind, nt * sizeof(int_t));
+      
+      compute_trace(d0, Z0p, P);
+      compute_traces(d1, e, v, Z0, Z0p, sim, ind, nt);
+      timer.lap(PHASE_UPDATE);
+
+      d  = d0 + d1;
+      z0 = c - d + e;
+      z1 = d - 2 * e + u - v;
+      f1 = c - e + u - v;
+      
+      // optimistic bound for this restart: the linearization of the objective at P, maximized by
+      // the LAP (= f(P) + Frank-Wolfe gap), or the LAP solution itself if that's better
+      if(prune != nullptr && prune->hopeless(n_iter, max(d + v - c, e + v))) {
+        exit_reason = EXIT_PRUNED;
+        break;
+      }
+      
+      if((z0 == 0) && (z1 == 0)) {
+        alpha = 0;
+        falpha = z0 * std::pow(alpha, 2) + z1 * alpha;
+      } else if(z0 == 0) {
+        alpha  = std::numeric_limits<acc_t>::max();
+        falpha = std::numeric_limits<acc_t>::max();
+      } else {
+        alpha  = - z1 / (2 * z0);
+        falpha = z0 * std::pow(alpha, 2) + z1 * alpha;
+      }
+      
+      if((alpha < 1) && (alpha > 0) && (falpha > 0) && (falpha > f1)) {
+        sparse_convex_combination(alpha, ind, P);
+        pattern_convex_combination(alpha, Z0p, Z0);
+        pattern_convex_combination(alpha, Z1p, Z1);
+        
+        c = alpha * alpha * c + alpha * (1 - alpha) * d + (1 - alpha) * (1 - alpha) * e;
+        u = alpha * u + (1 - alpha) * v;
+      } else if (f1 < 0) {
+        free(P->indptr);
+        free(P->indices);
+        free(P->data);
+        
+        P->indptr  = (int_t*)malloc((nt + 1) * sizeof(int_t));
+        P->indices = (int_t*)malloc(nt * sizeof(int_t));
+        P->data    = (cost_t*)malloc(nt * sizeof(cost_t));
+        
+        P->nnz = nt;
+        
+        for(int_t i = 0; i < nt + 1; i++) P->indptr[i]  = i;
+        for(int_t i = 0; i < nt    ; i++) P->indices[i] = ind[i];
+        for(int_t i = 0; i < nt    ; i++) P->data[i]    = 1;
+        
+        // copy (rather than swap) so Z0p / Z1p stay valid for the next incremental update
+        memcpy(Z0->data, Z0p->data, Z0->nnz * sizeof(cost_t));
+        memcpy(Z1->data, Z1p->data, Z1->nnz * sizeof(cost_t));
+        
+        c = e;
+        u = v;
+      } else {
+        exit_reason = EXIT_CONVERGED;
+        break;
+      }
+      timer.lap(PHASE_STEP);
+    }
+    timer.lap(PHASE_STEP); // the step that exited the loop, if any
+    
+    if(exit_reason == EXIT_PRUNED) {
+      // keep the last LAP solution -- `e + v` is already its objective
+      if(score != nullptr) *score = e + v;
+    } else {
+      // Project P onto the candidate pattern + round
+      csr_t _P_cand;
+      csr_t* P_cand = &_P_cand;
+      P_cand->alloc_like(sim_sp);
+      for(int_t i = 0; i < P->nrow; i++) {
+        for(int_t offset = P->indptr[i] ; offset < P->indptr[i + 1]; offset++) {
+          int_t p_offset = pattern_find(P_cand, i, P->indices[offset]);
+          if(p_offset >= 0) P_cand->data[p_offset] = P->data[offset];
+        }
+      }
+      sparse_rect_lap(P_cand, ind, lap_ws, lap_solver);
+      free(P_cand->data);
+      timer.lap(PHASE_ROUND);
+      
+      if(score != nullptr) {
+        // objective of the final assignment, restricted to the candidate pattern
+        if(Zp_valid) stacked_update(Z0p, nc, At, ind_prev, ind, B, pos);
+        else         stacked_multiply(Z0p, nc, At, ind, B, pos);
+        compute_traces(d1, e, v, Z0p, Z0p, sim, ind, nt);
+        *score = e + v;
+        timer.lap(PHASE_SCORE);
+      }
+    }
+    
+    if(stats != nullptr) {
+      stats->n_iter      = n_iter;
+      stats->exit_reason = exit_reason;
+    }
+    
+    // --
+    // Free memory
     
     free(P->indptr);
     free(P->indices);
@@ -219,7 +593,29 @@ void mgmmf(
     free(Z1->data);
     free(Z0p->data);
     free(Z1p->data);
+    free(ind_prev);
+    if(own_lap_ws) lap_ws->release();
+    free(pos);
+    
+    return exit_reason;
+}
+
 
+// --
+// Diversity
+//  - `mgmmf` / `mgmmf_sparse` only read `solution_counter`, `sim` and `sim_sp`, so restarts can run
+//    concurrently.  The wrapper applies these updates serially, between epochs of restarts.
+
+void update_diversity(
+  int_t*           ind,
+  int_t            nt,
+  csr_t*           sim_sp,
+  arr2d_t<cost_t>* sim,
+  arr2d_t<int_t>*  solution_counter,
+  cost_t           scale_eps,
+  bool             scale_init,
+  bool             scale_sim
+) {
     for(int_t i = 0; i < nt; i++) {
       solution_counter->data[i * solution_counter->ncol + ind[i]]++;
       
@@ -238,8 +634,30 @@ void mgmmf(
         }
       }
     }
+}
 
-#ifdef GRAD__PERMUTE
-    free(w_p);
-#endif
-}
\ No newline at end of file
+void update_diversity(
+  int_t*           ind,
+  int_t            nt,
+  csr_t*           sim_sp,
+  csr_t*           sim,
+  csr_t*           solution_counter,
+  cost_t           scale_eps,
+  bool             scale_init,
+  bool             scale_sim
+) {
+    for(int_t i = 0; i < nt; i++) {
+      int_t offset = pattern_find(sim_sp, i, ind[i]);
+      if(offset < 0) continue; // not enough candidates to match this node
+      
+      solution_counter->data[offset]++;
+      
+      if(scale_sim) {
+        sim->data[offset] *= scale_eps;
+      }
+
+      if(scale_init) {
+        sim_sp->data[offset] *= scale_eps;
+      }
+    }
+}
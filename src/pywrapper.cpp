@@ -4,6 +4,7 @@
 namespace py = pybind11;
 
 #include <iostream>
+#include <atomic>
 #include <omp.h>
 
 #include "mgmmf.h"
@@ -32,7 +33,7 @@ void py2arr2d(arr2d_t<T>* out, int_t nrow, int_t ncol, py::array_t<T>& dense) {
     out->data = static_cast<cost_t*>(dense.request().ptr);
 }
 
-void _wrapped_mgmmf(
+py::object _wrapped_mgmmf(
   py::array_t<int_t> ind_arr, 
   
   int_t nc, int_t nt, int_t nw,
@@ -60,7 +61,7 @@ void _wrapped_mgmmf(
   py::array_t<int_t> sim_indices,
   py::array_t<cost_t> sim_data,
   
-  py::array_t<cost_t> sim_dense,
+  std::optional<py::array_t<cost_t>> sim_dense,
   
   std::optional<py::array_t<int_t>> P_ex_indptr,
   std::optional<py::array_t<int_t>> P_ex_indices,
@@ -79,14 +80,30 @@ void _wrapped_mgmmf(
   int_t init_iter,
   bool init_doublestochastic,
   
-  int_t n_runs
-) {
-    if(scale_eps != 1 && (scale_init || scale_sim || scale_grad)) {
-      std::cout << "diversity -> 1 thread" << std::endl;
-      omp_set_dynamic(0);
-      omp_set_num_threads(1);
-    }
+  int_t n_runs,
+  
+  bool sparse,
+  
+  std::string parallel,
+  
+  std::string lap,
+  
+  int_t scale_epoch,
+  
+  std::optional<py::array_t<int8_t>> done_arr,
+  std::optional<py::array_t<int8_t>> cancel_arr,
+  
+  std::optional<py::array_t<int_t>>     stats_iter_arr,
+  std::optional<py::array_t<int8_t>>    stats_exit_arr,
+  std::optional<py::array_t<int64_t>>   stats_phase_us_arr,
   
+  std::optional<py::array_t<double>>    score_arr,
+  bool                                  unique,
+  
+  std::optional<double>                 prune_margin,
+  std::optional<double>                 prune_target,
+  int_t                                 prune_after
+) {
     csr_t _A, _At, _B, _Bt, _sim_sp, _P;
     
     csr_t* A      = &_A;
@@ -103,10 +120,6 @@ void _wrapped_mgmmf(
     
     py2csr(sim_sp, nt, nw, sim_nnz, sim_indptr, sim_indices, sim_data);
 
-    arr2d_t<cost_t> _sim;
-    arr2d_t<cost_t>* sim = &_sim;
-    py2arr2d(sim, nt, nw, sim_dense);
-    
     csr_t* P;
     if(P_ex_indptr.has_value()) {
       P = &_P;
@@ -123,44 +136,331 @@ void _wrapped_mgmmf(
     }
     
     int_t* ind = static_cast<int_t*>(ind_arr.request().ptr);
-
-    arr2d_t<int_t> _solution_counter(nt, nw);    
+    
+    // Dense mode keeps nt x nw similarity / counter arrays.
+    // Sparse (candidate-restricted) mode keeps them on the pattern of `sim_sp`.
+    arr2d_t<cost_t> _sim;
+    arr2d_t<cost_t>* sim = &_sim;
+    arr2d_t<int_t>  _solution_counter;
     arr2d_t<int_t>* solution_counter = &_solution_counter;
     
+    csr_t _sim_cand, _solution_counter_cand;
+    csr_t* sim_cand              = &_sim_cand;
+    csr_t* solution_counter_cand = &_solution_counter_cand;
+    
+    if(sparse) {
+      sim_cand->alloc_like(sim_sp);
+      memcpy(sim_cand->data, sim_sp->data, sim_sp->nnz * sizeof(cost_t));
+      solution_counter_cand->alloc_like(sim_sp);
+    } else {
+      py2arr2d(sim, nt, nw, sim_dense.value());
+      _solution_counter = arr2d_t<int_t>(nt, nw);
+    }
+    
+    // Progress / cancellation flags, shared w/ Python while the GIL is released:
+    //  - done[run_id] is set to 1 once restart `run_id` has written its assignment
+    //  - restarts that haven't started yet are skipped once cancel[0] is nonzero
+    volatile int8_t* done   = done_arr.has_value()   ? static_cast<int8_t*>(done_arr.value().request().ptr)   : nullptr;
+    volatile int8_t* cancel = cancel_arr.has_value() ? static_cast<int8_t*>(cancel_arr.value().request().ptr) : nullptr;
+    
+    // Instrumentation (all or nothing):
+    //  - stats_iter / stats_exit[run_id] are written once restart `run_id` finishes
+    //  - stats_phase_us[N_PHASES] gets the per-phase times, summed over restarts and threads
+    bool       collect_stats  = stats_iter_arr.has_value();
+    int_t*     stats_iter     = collect_stats ? static_cast<int_t*>(stats_iter_arr.value().request().ptr)         : nullptr;
+    int8_t*    stats_exit     = collect_stats ? static_cast<int8_t*>(stats_exit_arr.value().request().ptr)        : nullptr;
+    int64_t*   stats_phase_us = collect_stats ? static_cast<int64_t*>(stats_phase_us_arr.value().request().ptr) : nullptr;
+    
+    // score[run_id] is the objective of restart `run_id`'s final assignment
+    double*    score          = score_arr.has_value() ? static_cast<double*>(score_arr.value().request().ptr) : nullptr;
+    
+    // Pruning (see `prune_t`): restarts share the best objective found so far
+    prune_t  _prune;
+    prune_t* prune = nullptr;
+    if(prune_margin.has_value()) {
+      prune             = &_prune;
+      prune->margin     = prune_margin.value();
+      prune->min_iter   = prune_after;
+      prune->has_target = prune_target.has_value();
+      prune->target     = prune_target.value_or(0);
+    }
+    
+    bool       compute_score  = (score != nullptr) || unique || (prune != nullptr);
+    
+    std::optional<py::gil_scoped_release> release(std::in_place);
+    
+    lap_solver_t lap_solver = (lap == "sap") ? LAP_SAP : LAP_PADDED;
+    
+    // one LAP workspace per thread, reused across restarts
+    std::vector<lap_workspace_t> lap_ws(omp_get_max_threads());
+    
+    // one set of counters per thread, merged at the end
+    std::vector<run_stats_t> thread_stats(collect_stats ? omp_get_max_threads() : 0);
+    
+    // Diversity: restarts within an epoch see the same counters / similarities, which are
+    // updated (in run order) at the end of the epoch.  w/o diversity, there's a single epoch.
+    bool kernel_parallel = (parallel == "kernel") || (parallel == "auto" && n_runs < omp_get_max_threads());
+    bool diversity       = scale_eps != 1 && (scale_init || scale_sim || scale_grad);
+    if(scale_epoch <= 0) scale_epoch = kernel_parallel ? 1 : omp_get_max_threads();
+    if(!diversity)       scale_epoch = n_runs;
+    
+    // w/ `unique`, assignments go to a concurrent set instead of `ind`, so only scratch space
+    // for the restarts in flight is needed: one slot per restart in the epoch (for the diversity
+    // updates at the end of the epoch), or one per thread w/o diversity
+    match_set_t   matches;
+    vector<int_t> scratch;
+    if(unique) scratch.resize((diversity ? min(n_runs, scale_epoch) : omp_get_max_threads()) * nt);
+    
+    auto run_ind = [&](int_t run_id, int_t epoch_start) {
+      if(!unique)   return ind + run_id * nt;
+      if(diversity) return scratch.data() + (run_id - epoch_start) * nt;
+      return scratch.data() + omp_get_thread_num() * nt;
+    };
+    
+    auto run = [&](int_t* run_ind, int_t run_id, uint32_t run_seed) {
+      lap_workspace_t* ws      = &lap_ws[omp_get_thread_num()];
+      run_stats_t*     st      = collect_stats ? &thread_stats[omp_get_thread_num()] : nullptr;
+      acc_t            run_score;
+      acc_t*           sc      = compute_score ? &run_score : nullptr;
+      exit_reason_t    reason;
+      if(sparse) {
+        reason = mgmmf_sparse(
+          run_ind,
+          nc, nt, nw,
+          A, At, B, Bt, sim_sp, sim_cand, P,
+          run_seed,
+          solution_counter_cand, scale_eps, scale_grad, 
+          max_iter, init_iter, init_doublestochastic, ws, lap_solver, st, sc, prune
+        );
+      } else {
+        reason = mgmmf(
+          run_ind,
+          nc, nt, nw,
+          A, At, B, Bt, sim_sp, sim, P, w_p,
+          run_seed,
+          solution_counter, scale_eps, scale_grad, 
+          max_iter, init_iter, init_doublestochastic, ws, lap_solver, st, sc, prune
+        );
+      }
+      
+      if(st != nullptr) {
+        stats_iter[run_id] = st->n_iter;
+        stats_exit[run_id] = st->exit_reason;
+      }
+      if(score != nullptr) score[run_id] = (double)run_score;
+      if(prune != nullptr) prune->offer(run_score);
+      
+      // pruned restarts are left out of `matches`
+      if(unique && reason != EXIT_PRUNED) matches.insert(run_ind, nt, run_score, run_id);
+    };
+    
+    auto update = [&](int_t* run_ind) {
+      if(sparse) {
+        update_diversity(run_ind, nt, sim_sp, sim_cand, solution_counter_cand, scale_eps, scale_init, scale_sim);
+      } else {
+        update_diversity(run_ind, nt, sim_sp, sim, solution_counter, scale_eps, scale_init, scale_sim);
+      }
+    };
+    
+    // Run-level parallelism: one restart per thread, kernels run serially
+    // Kernel-level parallelism: restarts run one at a time, kernels run in parallel
+    //  - kernels only open a parallel region when not already inside one (`if(!omp_in_parallel())`),
+    //    so the process-wide nesting setting is left alone
+    
     if(n_runs > 1) {
       // progress bar
       int log_interval = n_runs > 100 ? (int)((float)n_runs / 100) : 1;
-      for(int_t run_id = 0; run_id < max(0, n_runs - 2 * log_interval) ; run_id++) {
+      for(int_t run_id = 0; run_id < max((int_t)0, n_runs - 2 * log_interval) ; run_id++) {
         if(run_id % log_interval == 0) cerr << "-";
       }
       cerr << ">|" << endl;
       
-      #pragma omp parallel for schedule(dynamic)
-      for(int_t run_id = 0; run_id < n_runs ; run_id++) {
-        mgmmf(
-          ind + run_id * nt, 
-          nc, nt, nw,
-          A, At, B, Bt, sim_sp, sim, P, w_p,
-          seed * run_id,
-          solution_counter, scale_eps, scale_init, scale_sim, scale_grad, 
-          max_iter, init_iter, init_doublestochastic
-        );
-        if(run_id % log_interval == 0) cerr << "|";
+      for(int_t epoch_start = 0; epoch_start < n_runs; epoch_start += scale_epoch) {
+        int_t epoch_end = min(n_runs, epoch_start + scale_epoch);
+        
+        #pragma omp parallel for schedule(dynamic) if(!kernel_parallel)
+        for(int_t run_id = epoch_start; run_id < epoch_end ; run_id++) {
+          if(cancel != nullptr && cancel[0]) continue;
+          
+          run(run_ind(run_id, epoch_start), run_id, seed * run_id);
+          if(done != nullptr) {
+            std::atomic_thread_fence(std::memory_order_release);
+            done[run_id] = 1;
+          }
+          if(run_id % log_interval == 0) cerr << "|";
+        }
+        
+        if(cancel != nullptr && cancel[0]) break;
+        
+        if(!diversity) continue; // no-op updates, and w/ `unique` the assignments are only in `matches`
+        
+        for(int_t run_id = epoch_start; run_id < epoch_end ; run_id++) {
+          update(run_ind(run_id, epoch_start));
+        }
       }
       cerr << endl;
+    } else if(cancel == nullptr || !cancel[0]) {
+      run(run_ind(0, 0), 0, seed);
+      update(run_ind(0, 0));
+      if(done != nullptr) done[0] = 1;
+    }
+    
+    for(auto& ws : lap_ws) ws.release();
+    
+    for(auto& st : thread_stats) {
+      for(int p = 0; p < N_PHASES; p++) stats_phase_us[p] += st.phase_ns[p] / 1000;
+    }
+    
+    if(sparse) {
+      free(sim_cand->data);
+      free(solution_counter_cand->data);
     } else {
-        mgmmf(
-          ind,
-          nc, nt, nw,
-          A, At, B, Bt, sim_sp, sim, P, w_p,
-          seed,
-          solution_counter, scale_eps, scale_init, scale_sim, scale_grad,
-          max_iter, init_iter, init_doublestochastic
-        );
+      free(solution_counter->data);
+    }
+    
+    // reacquire the GIL before touching Python objects
+    release.reset();
+    
+    if(!unique) return py::none();
+    
+    // unique assignments, sorted by best objective
+    auto sorted = matches.sorted();
+    int_t n_unique = sorted.size();
+    
+    py::array_t<int_t>  u_ind({n_unique, nt});
+    py::array_t<int_t>  u_hits(n_unique);
+    py::array_t<double> u_score(n_unique);
+    
+    int_t*  u_ind_ptr   = static_cast<int_t*>(u_ind.request().ptr);
+    int_t*  u_hits_ptr  = static_cast<int_t*>(u_hits.request().ptr);
+    double* u_score_ptr = static_cast<double*>(u_score.request().ptr);
+    for(int_t i = 0; i < n_unique; i++) {
+      memcpy(u_ind_ptr + i * nt, sorted[i].first->data(), nt * sizeof(int_t));
+      u_hits_ptr[i]  = sorted[i].second->hits;
+      u_score_ptr[i] = (double)sorted[i].second->best;
+    }
+    
+    return py::make_tuple(u_ind, u_hits, u_score);
+}
+
+// LAP workspace owned by Python, so tests / benchmarks can reuse one across calls
+struct py_lap_workspace_t {
+    lap_workspace_t ws;
+    
+    py_lap_workspace_t() {}
+    py_lap_workspace_t(const py_lap_workspace_t&) = delete;
+    ~py_lap_workspace_t() { ws.release(); }
+};
+
+void _wrapped_rect_lap(py::array_t<int_t> ind_arr, py::array_t<cost_t> cost_arr, int_t nt, int_t nw, std::string lap, py_lap_workspace_t* py_ws) {
+    lap_solver_t lap_solver = (lap == "sap") ? LAP_SAP : LAP_PADDED;
+    
+    int_t*  ind  = static_cast<int_t*>(ind_arr.request().ptr);
+    cost_t* cost = static_cast<cost_t*>(cost_arr.request().ptr);
+    
+    py::gil_scoped_release release;
+    
+    lap_workspace_t ws;
+    rect_lap(nt, nw, cost, cost, ind, nullptr, py_ws != nullptr ? &py_ws->ws : &ws, lap_solver);
+    ws.release();
+}
+
+void _wrapped_sparse_rect_lap(
+  py::array_t<int_t> ind_arr,
+  py::array_t<int_t> indptr, py::array_t<int_t> indices, py::array_t<cost_t> data,
+  int_t nt, int_t nw, std::string lap, py_lap_workspace_t* py_ws
+) {
+    lap_solver_t lap_solver = (lap == "sap") ? LAP_SAP : LAP_PADDED;
+    
+    int_t* ind = static_cast<int_t*>(ind_arr.request().ptr);
+    csr_t  cost;
+    py2csr(&cost, nt, nw, indices.size(), indptr, indices, data);
+    
+    py::gil_scoped_release release;
+    
+    lap_workspace_t ws;
+    sparse_rect_lap(&cost, ind, py_ws != nullptr ? &py_ws->ws : &ws, lap_solver);
+    ws.release();
+}
+
+// --
+// Kernels, exposed for tests
+//  - `out` is dense (nrow x ncol), or values on the pattern (out_indptr, out_indices) when given
+//  - P is an assignment (P_indices, length nrow) unless P_indptr / P_data are given
+//  - n_threads > 0 runs the kernel-parallel path on that many threads, 0 the serial (run-level) path
+
+template<typename F>
+void _with_threads(int_t n_threads, F f) {
+    if(n_threads > 0) {
+      int prev = omp_get_max_threads();
+      omp_set_num_threads(n_threads);
+      f();
+      omp_set_num_threads(prev);
+    } else {
+      // as in a restart under `parallel='runs'`: kernels see an active parallel region and run serially
+      #pragma omp parallel num_threads(2)
+      {
+        #pragma omp single
+        f();
+      }
     }
 }
 
-PYBIND11_MODULE(_mgmmf_cpp, m) {
+void _wrapped_stacked_multiply(
+  py::array_t<cost_t> out_arr, int_t nrow, int_t ncol, int_t nc,
+  py::array_t<int_t> X_indptr, py::array_t<int_t> X_indices, py::array_t<cost_t> X_data,
+  py::array_t<int_t> Y_indptr, py::array_t<int_t> Y_indices, py::array_t<cost_t> Y_data,
+  py::array_t<int_t> P_indices,
+  std::optional<py::array_t<int_t>>  P_indptr,
+  std::optional<py::array_t<cost_t>> P_data,
+  std::optional<py::array_t<int_t>>  P_old,
+  std::optional<py::array_t<int_t>>  out_indptr,
+  std::optional<py::array_t<int_t>>  out_indices,
+  int_t n_threads
+) {
+    csr_t X, Y, P, out_sp;
+    py2csr(&X, nrow, nrow * nc, X_indices.size(), X_indptr, X_indices, X_data);
+    py2csr(&Y, ncol * nc, ncol, Y_indices.size(), Y_indptr, Y_indices, Y_data);
+    
+    int_t* ind = static_cast<int_t*>(P_indices.request().ptr);
+    if(P_indptr.has_value()) py2csr(&P, nrow, ncol, P_indices.size(), P_indptr.value(), P_indices, P_data.value());
+    int_t* ind_old = P_old.has_value() ? static_cast<int_t*>(P_old.value().request().ptr) : nullptr;
+    
+    arr2d_t<cost_t> out;
+    bool pattern = out_indptr.has_value();
+    if(pattern) {
+      py2csr(&out_sp, nrow, ncol, out_indices.value().size(), out_indptr.value(), out_indices.value(), out_arr);
+    } else {
+      py2arr2d(&out, nrow, ncol, out_arr);
+    }
+    
+    vector<int_t> pos(max(n_threads, (int_t)2) * ncol, -1);
+    
+    py::gil_scoped_release release;
+    
+    _with_threads(n_threads, [&]() {
+      if(pattern) {
+        if(ind_old != nullptr)           stacked_update(&out_sp, nc, &X, ind_old, ind, &Y, pos.data());
+        else if(P_indptr.has_value())    stacked_multiply(&out_sp, nc, &X, &P, &Y, pos.data());
+        else                             stacked_multiply(&out_sp, nc, &X, ind, &Y, pos.data());
+      } else {
+        if(ind_old != nullptr)           stacked_update(&out, nc, &X, ind_old, ind, &Y);
+        else if(P_indptr.has_value())    stacked_multiply(&out, nc, &X, &P, &Y);
+        else                             stacked_multiply(&out, nc, &X, ind, &Y);
+      }
+    });
+}
+
+// Build variants (see CMakeLists.txt):
+//   _mgmmf_cpp         : 32-bit indices, float64
+//   _mgmmf_cpp64       : 64-bit indices (-DMGMMF_INDEX64)
+//   _mgmmf_cpp_f32     : float32 storage, double accumulation of traces (-DMGMMF_FLOAT32)
+//   _mgmmf_cpp64_f32   : both
+#ifndef MGMMF_MODULE
+#define MGMMF_MODULE _mgmmf_cpp
+#endif
+
+PYBIND11_MODULE(MGMMF_MODULE, m) {
     m.def("_mgmmf_cpp", &_wrapped_mgmmf, "M-GMMF Subgraph Matching", 
       py::arg("ind"),
       py::arg("nc"), py::arg("nt"), py::arg("nw"),
@@ -175,7 +475,7 @@ PYBIND11_MODULE(_mgmmf_cpp, m) {
       py::arg("Bt_indptr"), py::arg("Bt_indices"), py::arg("Bt_data"),
 
       py::arg("sim_indptr"), py::arg("sim_indices"), py::arg("sim_data"),
-      py::arg("sim_dense"),
+      py::arg("sim_dense") = py::none(),
 
       py::arg("P_ex_indptr")  = py::none(),
       py::arg("P_ex_indices") = py::none(),
@@ -194,6 +494,61 @@ PYBIND11_MODULE(_mgmmf_cpp, m) {
       py::arg("init_iter")             = 20,
       py::arg("init_doublestochastic") = true,
       
-      py::arg("n_runs")    = 1
+      py::arg("n_runs")    = 1,
+      
+      py::arg("sparse")    = false,
+      
+      py::arg("parallel")  = "auto",
+      py::arg("lap")       = "padded",
+      
+      py::arg("scale_epoch") = 0,
+      
+      py::arg("done")   = py::none(),
+      py::arg("cancel") = py::none(),
+      
+      py::arg("stats_iter")     = py::none(),
+      py::arg("stats_exit")     = py::none(),
+      py::arg("stats_phase_us") = py::none(),
+      
+      py::arg("score")  = py::none(),
+      py::arg("unique") = false,
+      
+      py::arg("prune_margin") = py::none(),
+      py::arg("prune_target") = py::none(),
+      py::arg("prune_after")  = 8
+    );
+    
+    m.def("_stacked_multiply", &_wrapped_stacked_multiply, "`stacked_multiply` / `stacked_update` kernels (for tests)",
+      py::arg("out"), py::arg("nrow"), py::arg("ncol"), py::arg("nc"),
+      py::arg("X_indptr"), py::arg("X_indices"), py::arg("X_data"),
+      py::arg("Y_indptr"), py::arg("Y_indices"), py::arg("Y_data"),
+      py::arg("P_indices"),
+      py::arg("P_indptr")    = py::none(),
+      py::arg("P_data")      = py::none(),
+      py::arg("P_old")       = py::none(),
+      py::arg("out_indptr")  = py::none(),
+      py::arg("out_indices") = py::none(),
+      py::arg("n_threads")   = 0
+    );
+    
+    py::class_<py_lap_workspace_t>(m, "_LapWorkspace", py::module_local(), "Scratch buffers for `_rect_lap` / `_sparse_rect_lap`, reused across calls")
+      .def(py::init<>())
+      .def_property_readonly("cost_sub_cap", [](const py_lap_workspace_t& w) { return w.ws.cost_sub_cap; })
+      .def_property_readonly("sel_cap",      [](const py_lap_workspace_t& w) { return w.ws.sel_cap; });
+    
+    m.def("_rect_lap", &_wrapped_rect_lap, "Rectangular LAP (maximization) on a dense nt x nw cost matrix",
+      py::arg("ind"),
+      py::arg("cost"),
+      py::arg("nt"), py::arg("nw"),
+      py::arg("lap") = "padded",
+      py::arg("ws")  = nullptr
+    );
+    
+    m.def("_sparse_rect_lap", &_wrapped_sparse_rect_lap, "Rectangular LAP (maximization) restricted to the pattern of an nt x nw CSR cost matrix",
+      py::arg("ind"),
+      py::arg("indptr"), py::arg("indices"), py::arg("data"),
+      py::arg("nt"), py::arg("nw"),
+      py::arg("lap") = "padded",
+      py::arg("ws")  = nullptr
     );
 }
\ No newline at end of file
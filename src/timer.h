@@ -20,4 +20,22 @@ struct mu_timer_t {
     }
     return elapsed;
   }
-};
\ No newline at end of file
+};
+
+// Cumulative per-phase timer: `lap(phase)` adds the time since the previous `lap` (or construction)
+// to `ns[phase]`.  Does nothing when `ns` is null, so instrumented code costs a branch when disabled.
+struct phase_timer_t {
+  long long* ns;
+  high_resolution_clock::time_point t0;
+  
+  phase_timer_t(long long* ns) : ns(ns) {
+    if(ns != nullptr) t0 = high_resolution_clock::now();
+  }
+  
+  void lap(int phase) {
+    if(ns == nullptr) return;
+    high_resolution_clock::time_point t1 = high_resolution_clock::now();
+    ns[phase] += duration_cast<nanoseconds>(t1 - t0).count();
+    t0 = t1;
+  }
+};
@@ -0,0 +1,45 @@
+import sys
+import numpy as np
+import pytest
+from contextlib import redirect_stdout
+
+from bench.synth import make_problem
+from mgmmf.prep.generic import prep_generic
+
+
+def _prep(**kwargs):
+    with redirect_stdout(sys.stderr):
+        w_node, w_edge, tmplt, truth = make_problem(**kwargs)
+        t_adjs, w_adjs, nodesim, meta = prep_generic(w_node, w_edge, tmplt)
+
+    return t_adjs, w_adjs, nodesim
+
+
+@pytest.fixture(scope='session')
+def planted():
+    """ small planted problem where most restarts find an exact match """
+    return _prep(nt=4, nw=200, nc=3, deg=10, seed=123)
+
+
+def objective(t_adjs, w_adjs, nodesim, ind):
+    """ brute-force objective of each row of `ind` (run x template node) """
+    ind   = np.atleast_2d(ind)
+    score = np.asarray(nodesim[np.arange(ind.shape[1])[None], ind]).astype(np.float64).sum(axis=1)
+    for c in t_adjs.keys():
+        a, b   = t_adjs[c].nonzero()
+        w_adj  = w_adjs[c].tocsr()
+        score += np.asarray(w_adj[ind[:, a].ravel(), ind[:, b].ravel()]).reshape(ind.shape[0], -1).sum(axis=1)
+
+    return score
+
+
+def is_exact(t_adjs, w_adjs, ind):
+    """ whether each row of `ind` maps every template edge to a world edge on the same channel """
+    ind   = np.atleast_2d(ind)
+    exact = np.ones(ind.shape[0], dtype=bool)
+    for c in t_adjs.keys():
+        a, b   = t_adjs[c].nonzero()
+        w_adj  = w_adjs[c].tocsr()
+        exact &= (np.asarray(w_adj[ind[:, a].ravel(), ind[:, b].ravel()]).reshape(ind.shape[0], -1) != 0).all(axis=1)
+
+    return exact
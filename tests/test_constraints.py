@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.spatial import cKDTree
+
+from mgmmf.prep import constraints
+from mgmmf.prep.constraints import haversine_m, geo_pairs, add_geo_constraints, time_pairs, add_time_constraints
+
+
+def _edges(df):
+    return sorted(zip(df.node1, df.node2, df.channel))
+
+
+@pytest.fixture(scope='module')
+def world():
+    rng = np.random.default_rng(3)
+    n   = 400
+
+    w_node = pd.DataFrame({
+        "name"       : [f'w{i}' for i in range(n)],
+        "rdf_type"   : rng.choice(['a', 'b', 'c'], n),
+        "linkTarget" : rng.choice(np.array(['x', 'y', None], dtype=object), n),
+        "latitude"   : rng.uniform(-89, 89, n),
+        "longitude"  : rng.uniform(-180, 180, n),
+    })
+    w_node.loc[rng.random(n) < 0.1, ['latitude', 'longitude']] = np.nan
+
+    # clusters near the antimeridian + a pole, so small radii find pairs there too
+    w_node.loc[:49, 'latitude']    = rng.uniform(-1, 1, 50)
+    w_node.loc[:49, 'longitude']   = np.where(rng.random(50) < 0.5, rng.uniform(179, 180, 50), rng.uniform(-180, -179, 50))
+    w_node.loc[50:79, 'latitude']  = rng.uniform(89, 90, 30)
+    w_node.loc[50:79, 'longitude'] = rng.uniform(-180, 180, 30)
+
+    w_node['startTime'] = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 30 * 24, n), unit='h')
+    w_node.loc[rng.random(n) < 0.1, 'startTime'] = pd.NaT
+    w_node['step']      = np.where(rng.random(n) < 0.1, np.nan, rng.integers(0, 50, n))
+    w_node['epoch']     = (w_node.startTime - pd.Timestamp('1970-01-01')).dt.total_seconds()
+
+    t_node = pd.DataFrame({
+        "name"       : ['t0', 't1', 't2', 't3'],
+        "rdf_type"   : ['a', 'b', 'c', 'a'],
+        "linkTarget" : [None, None, 'x', 'y'],
+    })
+
+    w_edge = pd.DataFrame({"node1" : ['w0'], "node2" : ['w1'], "rdf_type" : ['r'], "argument" : ['_'], "channel" : ['base']})
+    t_edge = pd.DataFrame({"node1" : ['t0'], "node2" : ['t1'], "rdf_type" : ['r'], "argument" : ['_'], "channel" : ['base']})
+    return t_node, t_edge, w_node, w_edge
+
+
+def _constraints(rows):
+    return pd.DataFrame([
+        dict(node1=n1, node2=n2, minValue=lo, maxValue=hi, constraint=constraint, units=units,
+            rdf_type='cnst', argument='_', channel=f'cnst{k}')
+        for k, (n1, n2, lo, hi, constraint, units) in enumerate(rows)
+    ])
+
+# --
+# geoDistance
+
+def test_haversine_m():
+    haversine = pytest.importorskip('haversine')
+
+    rng = np.random.default_rng(0)
+    a   = np.column_stack([rng.uniform(-90, 90, 100), rng.uniform(-180, 180, 100)])
+    b   = np.column_stack([rng.uniform(-90, 90, 100), rng.uniform(-180, 180, 100)])
+
+    ref = [haversine.haversine(aa, bb, unit='m') for aa, bb in zip(a, b)]
+    assert np.allclose(haversine_m(a, b), ref, rtol=1e-9)
+
+
+@pytest.mark.parametrize('min_value,max_value', [(0, 1e5), (5e4, 2e5), (0, 3e7), (1e6, 1e6 + 1)])
+def test_geo_pairs(min_value, max_value):
+    rng = np.random.default_rng(1)
+    a   = np.column_stack([rng.uniform(-2, 2, 300), rng.uniform(178, 182, 300) % 360 - 180])
+    b   = np.column_stack([rng.uniform(-2, 2, 200), rng.uniform(178, 182, 200) % 360 - 180])
+
+    dist = haversine_m(np.repeat(a, b.shape[0], axis=0), np.tile(b, (a.shape[0], 1))).reshape(a.shape[0], b.shape[0])
+    ref  = set(zip(*np.where((dist >= min_value) & (dist <= max_value))))
+
+    out = set()
+    for i, j in geo_pairs(a, b, min_value, max_value, chunk_size=64):
+        out |= set(zip(i, j))
+
+    assert out == ref
+
+
+def _geo_ref(t_node, w_node, c):
+    """ all-pairs haversine over the candidates of each endpoint (the previous `cdist` approach) """
+    def cand(name):
+        node = t_node[t_node.name == name].iloc[0]
+        sel  = (w_node.rdf_type == node.rdf_type) & w_node.latitude.notnull()
+        if not pd.isnull(node.linkTarget):
+            sel &= w_node.linkTarget == node.linkTarget
+        return w_node[sel]
+
+    c1, c2 = cand(c['node1']), cand(c['node2'])
+    ll1    = np.repeat(c1[['latitude', 'longitude']].values, c2.shape[0], axis=0)
+    ll2    = np.tile(c2[['latitude', 'longitude']].values, (c1.shape[0], 1))
+    sel    = (haversine_m(ll1, ll2) >= c['minValue']) & (haversine_m(ll1, ll2) <= c['maxValue'])
+
+    n1 = np.repeat(c1.name.values, c2.shape[0])[sel]
+    n2 = np.tile(c2.name.values, c1.shape[0])[sel]
+    return [(a, b, c['channel']) for a, b in zip(n1, n2)]
+
+
+def test_add_geo_constraints(world):
+    t_node, t_edge, w_node, w_edge = world
+
+    t_cnst = _constraints([
+        ('t0', 't1', 0,   5e5, 'geoDistance', 'm'),
+        ('t1', 't2', 1e5, 2e6, 'geoDistance', 'm'),
+        ('t0', 't3', 0,   3e7, 'geoDistance', 'm'),
+        ('t2', 't0', 0,   1,   'geoDistance', 'm'), # nothing in range -> channel dropped from the template
+        ('t0', 't1', 0,   1,   'startTime',   's'), # not a geo constraint
+    ])
+
+    t_out, w_out = add_geo_constraints(t_node, t_edge, w_node, w_edge, t_cnst)
+
+    ref = [e for _, c in t_cnst[t_cnst.constraint == 'geoDistance'].iterrows() for e in _geo_ref(t_node, w_node, c)]
+    assert _edges(w_out.iloc[w_edge.shape[0]:]) == sorted(ref)
+    assert _edges(w_out.iloc[:w_edge.shape[0]]) == _edges(w_edge)
+    assert sorted(t_out.channel) == ['base', 'cnst0', 'cnst1', 'cnst2']
+
+
+def test_add_geo_constraints_lazy_trees(world, monkeypatch):
+    t_node, t_edge, w_node, w_edge = world
+
+    built = []
+    def counting_tree(xyz):
+        built.append(xyz.shape[0])
+        return cKDTree(xyz)
+
+    monkeypatch.setattr(constraints, 'cKDTree', counting_tree)
+
+    # node1 groups are never queried, and node2's group ('b', no linkTarget) is shared -> a single tree
+    t_cnst = _constraints([
+        ('t0', 't1', 0, 5e5, 'geoDistance', 'm'),
+        ('t2', 't1', 0, 2e6, 'geoDistance', 'm'),
+        ('t3', 't1', 0, 3e7, 'geoDistance', 'm'),
+    ])
+    add_geo_constraints(t_node, t_edge, w_node, w_edge, t_cnst)
+    assert built == [((w_node.rdf_type == 'b') & w_node.latitude.notnull()).sum()]
+
+
+def test_add_geo_constraints_none(world):
+    t_node, t_edge, w_node, w_edge = world
+
+    t_cnst = _constraints([('t0', 't1', 0, 1, 'startTime', 's')])
+    t_out, w_out = add_geo_constraints(t_node, t_edge, w_node, w_edge, t_cnst)
+    assert t_out is t_edge and w_out is w_edge
+
+# --
+# timeConstraints
+
+@pytest.mark.parametrize('min_value,max_value', [(0, 5), (-3, 3), (10, None), (5, 4)])
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000000])
+def test_time_pairs(min_value, max_value, chunk_size):
+    rng = np.random.default_rng(2)
+    t1  = rng.integers(0, 40, 50).astype(np.float64)
+    t2  = rng.integers(0, 40, 80).astype(np.float64)
+
+    diff = t2[None] - t1[:, None]
+    sel  = diff >= min_value
+    if max_value is not None:
+        sel &= diff <= max_value
+
+    out = [(i, j) for ii, jj in time_pairs(t1, t2, min_value, max_value, chunk_size=chunk_size) for i, j in zip(ii, jj)]
+    assert len(out) == len(set(out))
+    assert set(out) == set(zip(*np.where(sel)))
+
+
+def _time_ref(t_node, w_node, c, scale):
+    """ all candidate pairs, w/ the time difference checked pair by pair """
+    def cand(name):
+        node = t_node[t_node.name == name].iloc[0]
+        sel  = (w_node.rdf_type == node.rdf_type) & w_node[c['constraint']].notnull()
+        if not pd.isnull(node.linkTarget):
+            sel &= w_node.linkTarget == node.linkTarget
+        return w_node[sel]
+
+    out = []
+    for _, a in cand(c['node1']).iterrows():
+        for _, b in cand(c['node2']).iterrows():
+            diff = (b[c['constraint']] - a[c['constraint']]) / scale
+            if diff >= c['minValue'] and (c['maxValue'] is None or pd.isnull(c['maxValue']) or diff <= c['maxValue']):
+                out.append((a['name'], b['name'], c['channel']))
+
+    return out
+
+
+def test_add_time_constraints(world):
+    t_node, t_edge, w_node, w_edge = world
+
+    t_cnst = _constraints([
+        ('t0', 't1', 0,    24,   'startTime',   'h'),
+        ('t1', 't2', -2,   1,    'startTime',   'D'),
+        ('t3', 't0', 10,   None, 'step',        's'),
+        ('t0', 't1', 1e6,  None, 'step',        's'), # nothing in range -> channel dropped from the template
+        ('t0', 't1', 0,    5e5,  'geoDistance', 'm'), # not a time constraint
+        ('t1', 't0', 0,    0.5,  'epoch',       'h'), # numeric epoch seconds, in hours
+        ('t0', 't1', 0,    1,    'rdf_type',    's'), # not a time field
+    ])
+
+    t_out, w_out = add_time_constraints(t_node, t_edge, w_node, w_edge, t_cnst)
+
+    scales = {
+        ('startTime', 'h') : pd.Timedelta(hours=1),
+        ('startTime', 'D') : pd.Timedelta(days=1),
+        ('step', 's')      : 1,
+        ('epoch', 'h')     : 3600,
+    }
+    ref = [
+        e for _, c in t_cnst.iterrows() if (c['constraint'], c['units']) in scales
+        for e in _time_ref(t_node, w_node, c, scales[(c['constraint'], c['units'])])
+    ]
+    assert _edges(w_out.iloc[w_edge.shape[0]:]) == sorted(ref)
+    assert _edges(w_out.iloc[:w_edge.shape[0]]) == _edges(w_edge)
+    assert sorted(t_out.channel) == ['base', 'cnst0', 'cnst1', 'cnst2', 'cnst5']
@@ -0,0 +1,234 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse as sp
+
+from bench.synth import make_problem
+from mgmmf.prep import generic_helpers
+from mgmmf.prep.helpers import missing_node_edge_filter
+from mgmmf.prep.generic_helpers import BinarySimilarity, SimilarityEngine, generic_sim, generic_sim_sparse, make_multiplex
+
+# --
+# Reference implementations (before vectorization)
+
+def _generic_sim_ref(t, w_df):
+    out = np.ones((len(t), w_df.shape[0]))
+    for idx, tt in enumerate(t):
+        for sim in tt['similarities']:
+            out[idx] *= BinarySimilarity.apply(w_df, sim)
+
+    return out
+
+
+def _make_multiplex_ref(tmplt, w_node, w_edge, edgesim):
+    tn_node = len(tmplt['nodedef'])
+    wn_node = w_node.shape[0]
+
+    t_node = np.array([xx['template_id'] for xx in tmplt['nodedef']])
+    t_src  = np.array([xx['node1'] for xx in tmplt['edgedef']])
+    t_dst  = np.array([xx['node2'] for xx in tmplt['edgedef']])
+
+    tnode_lookup = dict(zip(t_node, range(len(t_node))))
+    wnode_lookup = dict(zip(w_node.name.values, range(wn_node)))
+
+    edge2channel = np.array([hash(tuple(e)) for e in edgesim])
+
+    t_adjs, w_adjs = {}, {}
+    for c_id, c in enumerate(np.unique(edge2channel)):
+        tsel = edge2channel == c
+        tr   = [tnode_lookup[xx] for xx in t_src[tsel]]
+        tc   = [tnode_lookup[xx] for xx in t_dst[tsel]]
+        t_adjs[c_id] = sp.csr_matrix((np.ones(tsel.sum()), (tr, tc)), shape=(tn_node, tn_node))
+
+        e    = edgesim[np.where(tsel)[0][0]]
+        esel = e > 0
+        wr   = w_edge[esel].node1.apply(lambda x: wnode_lookup[x])
+        wc   = w_edge[esel].node2.apply(lambda x: wnode_lookup[x])
+        w_adjs[c_id] = sp.csr_matrix((e[esel], (wr, wc)), shape=(wn_node, wn_node))
+
+    return t_adjs, w_adjs
+
+
+def _channels(t_adjs, w_adjs):
+    """ channel ids are arbitrary -- key each channel by its template edges """
+    out = {}
+    for c in t_adjs.keys():
+        key = tuple(sorted(zip(*t_adjs[c].nonzero())))
+        out[key] = (t_adjs[c], w_adjs[c])
+
+    return out
+
+# --
+# Fixtures
+
+@pytest.fixture(scope='module')
+def tables():
+    """ planted problem w/ world node names that aren't row numbers, parallel edges, and a range predicate """
+    w_node, w_edge, tmplt, _ = make_problem(nt=8, nw=300, nc=3, deg=5, t_density=0.5, seed=1)
+
+    rng = np.random.default_rng(1)
+
+    w_node = w_node.assign(name=w_node.name * 7 + 1000)
+    w_edge = w_edge.assign(node1=w_edge.node1 * 7 + 1000, node2=w_edge.node2 * 7 + 1000)
+    w_edge = pd.concat([w_edge, w_edge.sample(200, random_state=1)], ignore_index=True)
+    w_edge['weight'] = rng.random(w_edge.shape[0])
+    w_edge.loc[w_edge.sample(50, random_state=2).index, 'weight'] = np.nan
+
+    for k, e in enumerate(tmplt['edgedef']):
+        if k % 3 == 0:
+            e['similarities'] = e['similarities'] + [
+                {"field_name" : "weight", "function" : {"type" : "range", "min_value" : 0.25, "max_value" : 1}}
+            ]
+
+    w_edge = missing_node_edge_filter(w_node, w_edge)
+    return w_node, w_edge, tmplt
+
+# --
+# Node similarities
+
+def _exact(field, values):
+    return {"field_name" : field, "function" : {"type" : "exact", "values" : values}}
+
+
+def _range(field, lo, hi):
+    return {"field_name" : field, "function" : {"type" : "range", "min_value" : lo, "max_value" : hi}}
+
+
+@pytest.fixture(scope='module')
+def nodes():
+    """ world node table w/ nulls in string + numeric columns, and templates sharing predicates """
+    rng = np.random.default_rng(2)
+    n   = 500
+
+    w_df = pd.DataFrame({
+        "kind"  : rng.choice(np.array(['a', 'b', 'c', None], dtype=object), n),
+        "color" : rng.choice(np.array(['red', 'blue'], dtype=object), n),
+        "size"  : np.where(rng.random(n) < 0.1, np.nan, rng.random(n) * 10),
+    })
+
+    t = [
+        {"similarities" : [_exact('kind', ['a'])]},
+        {"similarities" : [_exact('kind', ['b', 'a']), _range('size', 2, 5)]},
+        {"similarities" : [_exact('kind', ['a', 'b']), _exact('color', ['red'])]}, # same predicate as above, reordered
+        {"similarities" : [_exact('kind', ['c', None])]},
+        {"similarities" : [_range('size', 0, 1), _exact('color', ['green'])]},
+        {"similarities" : []},
+    ]
+    return t, w_df
+
+
+@pytest.mark.parametrize('n_jobs', [1, 3])
+def test_generic_sim(nodes, n_jobs):
+    t, w_df = nodes
+    assert np.array_equal(generic_sim(t, w_df, n_jobs=n_jobs), _generic_sim_ref(t, w_df))
+
+
+def test_generic_sim_arrow(nodes):
+    pa = pytest.importorskip('pyarrow')
+
+    t, w_df = nodes
+    ref     = _generic_sim_ref(t, w_df)
+
+    assert np.array_equal(generic_sim(t, pa.Table.from_pandas(w_df)), ref)
+    assert np.array_equal(generic_sim_sparse(t, pa.Table.from_pandas(w_df)).toarray(), ref)
+
+
+def test_similarity_engine(nodes):
+    t, w_df = nodes
+    engine  = SimilarityEngine(w_df)
+
+    sims = [sim for tt in t for sim in tt['similarities']]
+    engine.prefetch(sims)
+    assert len(engine._masks) == len(sims) - 1 # `kind in [a, b]` is shared
+
+    rows = np.arange(0, w_df.shape[0], 7)
+    for sim in sims:
+        full = BinarySimilarity.apply(w_df, sim) != 0
+        assert np.array_equal(engine.mask(sim), full)
+        assert np.array_equal(SimilarityEngine(w_df).mask(sim, rows), full[rows]) # uncached, restricted to `rows`
+
+
+def test_similarity_engine_unknown_type(nodes):
+    t, w_df = nodes
+    with pytest.raises(ValueError):
+        _ = SimilarityEngine(w_df).mask({"field_name" : "size", "function" : {"type" : "fuzzy"}})
+
+# --
+# Edge similarities
+
+def test_generic_sim_sparse(tables):
+    w_node, w_edge, tmplt = tables
+
+    ref = _generic_sim_ref(tmplt['edgedef'], w_edge)
+    out = generic_sim_sparse(tmplt['edgedef'], w_edge)
+
+    assert sp.isspmatrix_csr(out)
+    assert out.shape == ref.shape
+    assert out.nnz == (ref != 0).sum() # no explicit zeros
+    assert np.array_equal(out.toarray(), ref)
+
+
+def test_generic_sim_sparse_no_match(tables):
+    w_node, w_edge, tmplt = tables
+
+    t = [
+        {"similarities" : [{"field_name" : "edge_type", "function" : {"type" : "exact", "values" : ["missing"]}}]},
+        {"similarities" : []},
+    ]
+    out = generic_sim_sparse(t, w_edge)
+    assert out.getnnz(axis=1).tolist() == [0, w_edge.shape[0]]
+
+# --
+# make_multiplex
+
+@pytest.mark.parametrize('fmt', ['dense', 'csr'])
+def test_make_multiplex(tables, fmt):
+    w_node, w_edge, tmplt = tables
+
+    edgesim = _generic_sim_ref(tmplt['edgedef'], w_edge)
+    ref     = _channels(*_make_multiplex_ref(tmplt, w_node, w_edge, edgesim))
+
+    if fmt == 'csr':
+        edgesim = sp.csr_matrix(edgesim)
+
+    out = _channels(*make_multiplex(tmplt, w_node, w_edge, edgesim))
+
+    assert out.keys() == ref.keys()
+    for key, (t_adj, w_adj) in out.items():
+        assert (t_adj != ref[key][0]).nnz == 0
+        assert (w_adj != ref[key][1]).nnz == 0
+        assert w_adj.has_sorted_indices or w_adj.nnz == 0
+
+
+def test_make_multiplex_index64(tables, monkeypatch):
+    """ w/ more edges / nodes than int32 can index, CSR indices are built as int64 (forced here) """
+    w_node, w_edge, tmplt = tables
+
+    edgesim = generic_sim_sparse(tmplt['edgedef'], w_edge)
+    ref     = _channels(*make_multiplex(tmplt, w_node, w_edge, edgesim))
+
+    monkeypatch.setattr(generic_helpers, '_INT32_MAX', 10)
+    assert generic_helpers._index_dtype(5, 11) == np.int64
+
+    out = _channels(*make_multiplex(tmplt, w_node, w_edge, generic_sim_sparse(tmplt['edgedef'], w_edge)))
+    assert out.keys() == ref.keys()
+    for key, (t_adj, w_adj) in out.items():
+        assert (t_adj != ref[key][0]).nnz == 0
+        assert (w_adj != ref[key][1]).nnz == 0
+
+
+def test_make_multiplex_duplicate_names(tables):
+    w_node, w_edge, tmplt = tables
+
+    edgesim = generic_sim(tmplt['edgedef'], w_edge)
+    w_dup   = pd.concat([w_node, w_node.iloc[:2]], ignore_index=True)
+    with pytest.raises(AssertionError, match='duplicate world node names'):
+        _ = make_multiplex(tmplt, w_dup, w_edge, edgesim)
+
+
+def test_make_multiplex_unknown_node(tables):
+    w_node, w_edge, tmplt = tables
+
+    edgesim = generic_sim(tmplt['edgedef'], w_edge)
+    with pytest.raises(AssertionError):
+        _ = make_multiplex(tmplt, w_node.iloc[1:], w_edge, edgesim)
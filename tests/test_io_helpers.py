@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse as sp
+
+from mgmmf import PreparedWorld
+from mgmmf import io_helpers
+from mgmmf.io_helpers import save_csr, load_csr, save_prep, load_prep, load_gdf, gdf2feather
+
+# --
+# Binary CSR format
+
+def _random_csr(nrow, ncol, density, idx_dtype, val_dtype, seed=0):
+    X = sp.random(nrow, ncol, density=density, format='csr', dtype=val_dtype, random_state=seed)
+    X.indptr  = X.indptr.astype(idx_dtype)
+    X.indices = X.indices.astype(idx_dtype)
+    return X
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+@pytest.mark.parametrize('idx_dtype,val_dtype', [
+    (np.int32, np.float64),
+    (np.int64, np.float64),
+    (np.int32, np.float32),
+    (np.int64, np.float32),
+])
+@pytest.mark.parametrize('shape,density', [((7, 13), 0.3), ((100, 3), 0.05), ((5, 5), 0)])
+def test_csr_roundtrip(tmp_path, mmap, idx_dtype, val_dtype, shape, density):
+    X    = _random_csr(*shape, density, idx_dtype, val_dtype)
+    path = str(tmp_path / 'X.csr')
+
+    save_csr(path, X)
+    Y = load_csr(path, mmap=mmap)
+
+    assert Y.shape == X.shape
+    assert Y.indptr.dtype == X.indptr.dtype and Y.indices.dtype == X.indices.dtype
+    assert Y.data.dtype == X.data.dtype
+    assert Y.has_sorted_indices
+    assert (Y != X).nnz == 0
+
+    if mmap and X.nnz > 0:
+        assert all(isinstance(arr, np.memmap) for arr in (Y.indptr, Y.indices, Y.data)) # no copies
+
+
+def test_csr_unsorted(tmp_path):
+    X = sp.csr_matrix((np.array([1., 2., 3.]), np.array([2, 0, 1]), np.array([0, 3])), shape=(1, 3))
+    save_csr(str(tmp_path / 'X.csr'), X)
+
+    Y = load_csr(str(tmp_path / 'X.csr'))
+    assert np.array_equal(Y.indices, [0, 1, 2])
+    assert np.array_equal(Y.toarray(), X.toarray())
+
+
+def test_load_csr_not_csr(tmp_path):
+    (tmp_path / 'X.csr').write_bytes(b'not a csr file' * 8)
+    with pytest.raises(AssertionError):
+        _ = load_csr(str(tmp_path / 'X.csr'))
+
+# --
+# Prepared worlds
+
+def test_prepared_world_roundtrip(tmp_path, planted):
+    t_adjs, w_adjs, nodesim = planted
+
+    world = PreparedWorld(w_adjs)
+    world.save(str(tmp_path / 'world'))
+    loaded = PreparedWorld.load(str(tmp_path / 'world'))
+
+    assert (loaded.nw, loaded.nc) == (world.nw, world.nc)
+    assert (loaded.B != world.B).nnz == 0
+    assert (loaded.Bt != world.Bt).nnz == 0
+
+
+def test_prep_roundtrip(tmp_path, planted):
+    t_adjs, w_adjs, nodesim = planted
+    meta = {"t_node" : list(range(nodesim.shape[0]))}
+
+    save_prep(str(tmp_path), t_adjs, w_adjs, nodesim, meta)
+    t_adjs2, world, nodesim2, meta2 = load_prep(str(tmp_path))
+
+    assert meta2 == meta
+    assert np.array_equal(np.asarray(nodesim2), nodesim)
+    assert all((t_adjs2[c] != t_adjs[c]).nnz == 0 for c in t_adjs.keys())
+    assert (world.B != PreparedWorld(w_adjs).B).nnz == 0
+    assert not (tmp_path / 'w_adjs.pkl').exists() # the world is only written once, memory-mappable
+
+    save_prep(str(tmp_path / 'pkl'), t_adjs, w_adjs, nodesim, meta, pickle_world=True)
+    assert (tmp_path / 'pkl' / 'w_adjs.pkl').exists()
+
+# --
+# GDF
+
+_GDF = '''nodedef>name VARCHAR,rdf:type VARCHAR,score DOUBLE,count INT,flag BOOLEAN,note
+n0,person,1.5,3,true,'hello, world'
+n1,place,,7,false,plain
+n2,person,-2,,,
+n3,'thing',0.25,-1,true,'it''s'
+edgedef>node1 VARCHAR,node2 VARCHAR,rdf:type VARCHAR,weight DOUBLE
+n0,n1,knows,1
+n1,n2,'near, by',
+n2,n3,knows,0.5
+'''
+
+def _gdf_expected():
+    nodes = pd.DataFrame({
+        "name"     : pd.Series(['n0', 'n1', 'n2', 'n3'], dtype=object),
+        "rdf_type" : pd.Series(['person', 'place', 'person', 'thing'], dtype=object),
+        "score"    : [1.5, np.nan, -2, 0.25],
+        "count"    : pd.array([3, 7, None, -1], dtype='Int64'),
+        "flag"     : pd.array([True, False, None, True], dtype='boolean'),
+        "note"     : pd.Series(['hello, world', 'plain', np.nan, "it's"], dtype=object),
+    })
+    edges = pd.DataFrame({
+        "node1"    : pd.Series(['n0', 'n1', 'n2'], dtype=object),
+        "node2"    : pd.Series(['n1', 'n2', 'n3'], dtype=object),
+        "rdf_type" : pd.Series(['knows', 'near, by', 'knows'], dtype=object),
+        "weight"   : [1, np.nan, 0.5],
+    })
+    return nodes, edges
+
+
+@pytest.mark.parametrize('headers', [('nodedef>', 'edgedef>'), ('NODEDEF>', 'EDGEDEF>'), ('NodeDef>', 'EdgeDef>')])
+@pytest.mark.parametrize('block,chunksize', [(1 << 24, 1000000), (5, 1), (9, 2)])
+def test_load_gdf(tmp_path, monkeypatch, block, chunksize, headers):
+    monkeypatch.setattr(io_helpers, '_GDF_BLOCK', block) # small blocks split headers + rows across reads
+
+    path = tmp_path / 'world.gdf'
+    path.write_text(_GDF.replace('nodedef>', headers[0]).replace('edgedef>', headers[1]))
+
+    nodes, edges = load_gdf(str(path), chunksize=chunksize)
+    ref_nodes, ref_edges = _gdf_expected()
+
+    pd.testing.assert_frame_equal(nodes, ref_nodes, check_dtype=False)
+    pd.testing.assert_frame_equal(edges, ref_edges, check_dtype=False)
+    assert str(nodes['count'].dtype) == 'Int64' and str(nodes['flag'].dtype) == 'boolean'
+
+
+def test_load_gdf_no_edges(tmp_path):
+    path = tmp_path / 'world.gdf'
+    path.write_text(_GDF.split('edgedef>')[0])
+
+    nodes, edges = load_gdf(str(path))
+    assert nodes.shape == (4, 6)
+    assert edges.shape == (0, 0)
+
+    path.write_text('nodedef>name VARCHAR\nedgedef>node1 VARCHAR,node2 VARCHAR\n')
+    nodes, edges = load_gdf(str(path))
+    assert nodes.shape[0] == 0 and edges.shape[0] == 0
+    assert list(edges.columns) == ['node1', 'node2']
+
+
+def test_load_gdf_not_gdf(tmp_path):
+    path = tmp_path / 'world.gdf'
+    path.write_text('name,type\nn0,person\n')
+    with pytest.raises(AssertionError):
+        _ = load_gdf(str(path))
+
+
+def test_gdf2feather(tmp_path):
+    feather = pytest.importorskip('pyarrow.feather')
+
+    path = tmp_path / 'world.gdf'
+    path.write_text(_GDF)
+
+    gdf2feather(str(path), str(tmp_path / 'node.feather'), str(tmp_path / 'edge.feather'), chunksize=2, drop=['note'])
+
+    ref_nodes, ref_edges = load_gdf(str(path))
+    ref_nodes = ref_nodes.drop(columns=['note'])
+    nodes = feather.read_table(str(tmp_path / 'node.feather')).to_pandas().astype(ref_nodes.dtypes.to_dict())
+    edges = feather.read_table(str(tmp_path / 'edge.feather')).to_pandas()
+
+    pd.testing.assert_frame_equal(nodes, ref_nodes, check_dtype=False)
+    pd.testing.assert_frame_equal(edges, ref_edges, check_dtype=False)
@@ -0,0 +1,120 @@
+import sys
+import threading
+import numpy as np
+import pytest
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+
+from mgmmf import submit, stream_mgmmf
+
+
+@pytest.fixture
+def blocked():
+    """ single-worker executor, busy until `gate` is set -- jobs submitted to it are queued, not started """
+    gate     = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.submit(gate.wait)
+    yield executor, gate
+    gate.set()
+    executor.shutdown()
+
+# --
+# Cancellation
+
+@pytest.mark.parametrize('unique', [False, True])
+def test_cancel_before_start(planted, blocked, unique):
+    t_adjs, w_adjs, nodesim = planted
+    executor, gate = blocked
+
+    with redirect_stdout(sys.stderr):
+        job = submit(t_adjs, w_adjs, nodesim, n_runs=8, unique=unique, executor=executor)
+
+    assert job.cancel()
+    assert job.cancelled()
+    gate.set()
+
+    ind, _ = job.result(timeout=60)
+    if unique:
+        ind = ind.ind
+
+    assert ind.shape == (0, nodesim.shape[0])
+    assert not job.completed.any()
+
+
+def test_stream_finish_before_start(planted, blocked):
+    t_adjs, w_adjs, nodesim = planted
+    executor, gate = blocked
+
+    with redirect_stdout(sys.stderr):
+        stream = stream_mgmmf(t_adjs, w_adjs, nodesim, n_runs=8, executor=executor)
+
+    threading.Timer(0.1, gate.set).start()
+    stream._finish() # eg, the iterator is torn down while the job is still queued
+
+    assert stream.stop_reason == 'exhausted'
+    assert stream.job.result()[0].shape[0] == 0
+
+# --
+# Streaming w/ early stopping
+
+def _stream(planted, n_runs=64, **kwargs):
+    t_adjs, w_adjs, nodesim = planted
+    with redirect_stdout(sys.stderr):
+        return stream_mgmmf(t_adjs, w_adjs, nodesim, n_runs=n_runs, poll_interval=0.01, **kwargs)
+
+
+def _check(stream, seen):
+    """ matches / hits agree w/ what was yielded """
+    new = [ind for _, ind, is_new in seen if is_new]
+    assert stream.n_seen == len(seen)
+    assert stream.hits().sum() == len(seen)
+    assert np.array_equal(stream.matches(), np.array(new).reshape(-1, stream.job.ind.shape[1]))
+    assert np.unique(np.array([ind for _, ind, _ in seen]), axis=0).shape[0] == len(new)
+
+
+def test_stream_exhausted(planted):
+    stream = _stream(planted)
+    seen   = list(stream)
+
+    assert stream.stop_reason == 'exhausted'
+    assert sorted(run_id for run_id, _, _ in seen) == list(range(64))
+    _check(stream, seen)
+
+    ind, _ = stream.job.result()
+    assert np.array_equal(np.unique(ind, axis=0), np.unique(stream.matches(), axis=0))
+
+
+def test_stream_max_unique(planted):
+    stream = _stream(planted, max_unique=3)
+    seen   = list(stream)
+
+    assert stream.stop_reason == 'max_unique'
+    assert stream.matches().shape[0] == 3
+    assert seen[-1][2] # stopped on the 3rd new match
+    assert stream.job.cancelled()
+    _check(stream, seen)
+
+
+def test_stream_patience(planted):
+    stream = _stream(planted, n_runs=512, patience=3)
+    seen   = list(stream)
+
+    assert stream.stop_reason == 'patience'
+    assert [is_new for _, _, is_new in seen[-3:]] == [False] * 3
+    assert len(seen) < 512
+    assert stream.job.cancelled()
+    _check(stream, seen)
+
+
+def test_stream_async(planted):
+    import asyncio
+
+    async def _consume(stream):
+        return [x async for x in stream]
+
+    stream = _stream(planted, max_unique=2)
+    seen   = asyncio.run(_consume(stream))
+
+    assert stream.stop_reason == 'max_unique'
+    assert stream.matches().shape[0] == 2
+    _check(stream, seen)
@@ -0,0 +1,183 @@
+import numpy as np
+import pytest
+from scipy import sparse as sp
+
+from mgmmf.mgmmf import _prep_adjs
+from mgmmf._mgmmf_cpp import _stacked_multiply
+
+
+def _multiplex(nt, nw, nc, seed):
+    """ random template + world channels w/ small integer weights, so sums are exact in any order """
+    rng = np.random.default_rng(seed)
+
+    def _adj(n, density):
+        X = sp.random(n, n, density=density, random_state=rng, data_rvs=lambda k: rng.integers(1, 4, k))
+        return X.tocsr()
+
+    t_adjs = {c: _adj(nt, 0.3) for c in range(nc)}
+    w_adjs = {c: _adj(nw, 8 / nw) for c in range(nc)}
+    return t_adjs, w_adjs
+
+
+def _assignment(rng, nt, nw):
+    return rng.choice(nw, nt, replace=False).astype(np.int32)
+
+
+def _ind2csr(ind, nw):
+    return sp.csr_matrix((np.ones(ind.shape[0]), (np.arange(ind.shape[0]), ind)), shape=(ind.shape[0], nw))
+
+
+def _random_P(rng, nt, nw, k=5):
+    """ row-stochastic P w/ `k` entries per row """
+    cols = np.stack([rng.choice(nw, k, replace=False) for _ in range(nt)])
+    vals = rng.random((nt, k))
+    vals /= vals.sum(axis=1, keepdims=True)
+    P    = sp.csr_matrix((vals.ravel(), cols.ravel(), np.arange(0, nt * k + 1, k)), shape=(nt, nw))
+    P.sort_indices()
+    return P
+
+
+def _reference(X, Y, P, nc):
+    """ sum over channels m of X_m @ P @ Y_m """
+    nt, nw = P.shape
+    return sum((X[:, m * nt:(m + 1) * nt] @ P @ Y[m * nw:(m + 1) * nw]).toarray() for m in range(nc))
+
+
+def _kernel(X, Y, P, nc, nw, out=None, P_old=None, pattern=None, n_threads=0):
+    """ run `stacked_multiply` (or `stacked_update` from `P_old`, in place on `out`).  Returns dense `out` """
+    nt = X.shape[0]
+    if out is None:
+        out = np.zeros(pattern.nnz if pattern is not None else nt * nw)
+
+    kwargs = dict(P_indices=P) if isinstance(P, np.ndarray) else dict(P_indices=P.indices, P_indptr=P.indptr, P_data=P.data)
+    if P_old is not None:
+        kwargs['P_old'] = P_old
+    if pattern is not None:
+        kwargs.update(out_indptr=pattern.indptr, out_indices=pattern.indices)
+
+    _stacked_multiply(
+        out=out, nrow=nt, ncol=nw, nc=nc,
+        X_indptr=X.indptr, X_indices=X.indices, X_data=X.data,
+        Y_indptr=Y.indptr, Y_indices=Y.indices, Y_data=Y.data,
+        n_threads=n_threads, **kwargs
+    )
+
+    if pattern is not None:
+        return out, sp.csr_matrix((out, pattern.indices, pattern.indptr), shape=(nt, nw)).toarray()
+
+    return out, out.reshape(nt, nw)
+
+
+@pytest.fixture(scope='module')
+def world():
+    nt, nw, nc  = 6, 20000, 2
+    t_adjs, w_adjs = _multiplex(nt, nw, nc, seed=1)
+    A, At = _prep_adjs(t_adjs, dim=1)
+    B, Bt = _prep_adjs(w_adjs, dim=0)
+    return A, At, B, Bt, nc, nw
+
+
+def _pattern(rng, nt, nw, ind):
+    """ candidate pattern (sorted csr), covering `ind` """
+    X = sp.random(nt, nw, density=0.05, random_state=rng, format='csr')
+    X = (X + _ind2csr(ind, nw)).tocsr()
+    X.sort_indices()
+    return X
+
+# --
+# Kernel-level parallelism
+
+@pytest.mark.parametrize('pattern', [False, True])
+@pytest.mark.parametrize('assignment', [False, True])
+def test_stacked_multiply_parallel(world, assignment, pattern):
+    A, At, B, Bt, nc, nw = world
+    nt  = A.shape[0]
+    rng = np.random.default_rng(2)
+
+    ind = _assignment(rng, nt, nw)
+    P   = ind if assignment else _random_P(rng, nt, nw)
+    pat = _pattern(rng, nt, nw, ind) if pattern else None
+
+    ref = _reference(At, B, _ind2csr(ind, nw) if assignment else P, nc)
+    if pattern:
+        ref = ref * (pat.toarray() != 0)
+
+    _, serial = _kernel(At, B, P, nc, nw, pattern=pat)
+    assert np.allclose(serial, ref)
+
+    for n_threads in [1, 2, 4]: # 4 threads -> row x column-block tiles
+        _, out = _kernel(At, B, P, nc, nw, pattern=pat, n_threads=n_threads)
+        assert np.array_equal(out, serial)
+
+# --
+# Incremental updates
+
+def _next_assignment(rng, ind, nw):
+    """ change a few rows: a swap between two rows, and one row moved to a fresh world node """
+    ind    = ind.copy()
+    i, j   = rng.choice(ind.shape[0], 2, replace=False)
+    ind[[i, j]] = ind[[j, i]]
+    free   = np.setdiff1d(np.arange(nw), ind)
+    ind[rng.integers(ind.shape[0])] = rng.choice(free)
+    return ind
+
+
+@pytest.mark.parametrize('pattern', [False, True])
+@pytest.mark.parametrize('n_threads', [0, 4])
+def test_stacked_update(world, pattern, n_threads):
+    A, At, B, Bt, nc, nw = world
+    nt  = A.shape[0]
+    rng = np.random.default_rng(3)
+
+    ind  = _assignment(rng, nt, nw)
+    inds = [ind]
+    for _ in range(10):
+        inds.append(_next_assignment(rng, inds[-1], nw))
+
+    inds.append(inds[-1].copy()) # no change
+    pat = _pattern(rng, nt, nw, inds[0]) if pattern else None
+
+    for X, Y in [(At, B), (A, Bt)]: # Z0p, Z1p
+        Zp, _ = _kernel(X, Y, inds[0], nc, nw, pattern=pat)
+        for prev, ind in zip(inds[:-1], inds[1:]):
+            _, inc  = _kernel(X, Y, ind, nc, nw, out=Zp, P_old=prev, pattern=pat, n_threads=n_threads)
+            _, full = _kernel(X, Y, ind, nc, nw, pattern=pat)
+            assert np.array_equal(inc, full) # integer weights: exact
+
+
+def test_closed_form_traces(world):
+    """ c = <Z0, P> and u = <sim, P>, carried across Frank-Wolfe steps as in `mgmmf`, vs recomputing them """
+    A, At, B, Bt, nc, nw = world
+    nt  = A.shape[0]
+    rng = np.random.default_rng(4)
+
+    sim = rng.random((nt, nw))
+    P   = _random_P(rng, nt, nw)
+    _, Z0 = _kernel(At, B, P, nc, nw)
+    Z0  = Z0.copy()
+    c   = (Z0 * P.toarray()).sum()
+    u   = (sim * P.toarray()).sum()
+
+    ind_prev = _assignment(rng, nt, nw)
+    Zp, _    = _kernel(At, B, ind_prev, nc, nw)
+    for _ in range(8):
+        ind = _next_assignment(rng, ind_prev, nw)
+        _, Z0p = _kernel(At, B, ind, nc, nw, out=Zp, P_old=ind_prev)
+        ind_prev = ind
+
+        rows = np.arange(nt)
+        d    = (Z0p * P.toarray()).sum() + Z0[rows, ind].sum() # d0 + d1
+        e    = Z0p[rows, ind].sum()
+        v    = sim[rows, ind].sum()
+
+        alpha = rng.uniform(0.1, 0.9)
+        P     = (alpha * P + (1 - alpha) * _ind2csr(ind, nw)).tocsr()
+        Z0    = alpha * Z0 + (1 - alpha) * Z0p
+        c     = alpha * alpha * c + alpha * (1 - alpha) * d + (1 - alpha) * (1 - alpha) * e
+        u     = alpha * u + (1 - alpha) * v
+
+        P.sort_indices()
+        _, full = _kernel(At, B, P, nc, nw)
+        assert np.allclose(Z0, full)
+        assert np.isclose(c, (full * P.toarray()).sum())
+        assert np.isclose(u, (sim * P.toarray()).sum())
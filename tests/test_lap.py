@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from scipy import sparse as sp
+from scipy.optimize import linear_sum_assignment
+
+from mgmmf._mgmmf_cpp import _rect_lap, _sparse_rect_lap, _LapWorkspace
+
+
+def _solve(cost, lap, ws=None):
+    nt, nw = cost.shape
+    ind    = np.zeros(nt, dtype=np.int32)
+    if sp.issparse(cost):
+        _sparse_rect_lap(ind, cost.indptr, cost.indices, cost.data, nt, nw, lap, ws)
+    else:
+        _rect_lap(ind, np.ascontiguousarray(cost.ravel()), nt, nw, lap, ws)
+
+    return ind
+
+
+@pytest.mark.parametrize('lap', ['padded', 'sap'])
+@pytest.mark.parametrize('nt,nw', [(1, 1), (5, 5), (5, 40), (30, 200), (64, 65)])
+def test_rect_lap_optimal(lap, nt, nw):
+    rng = np.random.default_rng(nt * nw)
+    for cost in [rng.random((nt, nw)), rng.integers(0, 3, (nt, nw)).astype(np.float64)]: # continuous, w/ ties
+        ind = _solve(cost, lap)
+
+        assert np.unique(ind).shape[0] == nt
+        assert ((ind >= 0) & (ind < nw)).all()
+
+        r, c = linear_sum_assignment(cost, maximize=True)
+        assert np.isclose(cost[np.arange(nt), ind].sum(), cost[r, c].sum())
+
+
+@pytest.mark.parametrize('rows', [[2], [0, 1, 2, 3, 4]])
+def test_rect_lap_nan(rows):
+    """ w/ NaN costs, sap finds no augmenting path -- it falls back to the padded solver instead of reading out of bounds """
+    cost = np.random.default_rng(0).random((5, 40))
+    cost[rows] = np.nan
+
+    ind = _solve(cost, 'sap')
+    assert ((ind >= 0) & (ind < 40)).all() # no meaningful assignment, but no garbage indices either
+
+
+@pytest.mark.parametrize('lap', ['padded', 'sap'])
+@pytest.mark.parametrize('sparse', [False, True])
+def test_rect_lap_workspace_reuse(lap, sparse):
+    """ one workspace across problems that grow and shrink in n and u (distinct candidate columns) """
+    rng = np.random.default_rng(5)
+    ws  = _LapWorkspace()
+
+    caps = []
+    for nt, nw in [(5, 40), (30, 200), (3, 10), (64, 65), (1, 1), (30, 2000), (8, 8)]:
+        if sparse:
+            cost = sp.random(nt, nw, density=0.5, random_state=rng, format='csr')
+            cost.data += 0.1 # candidates beat the zeros off the pattern
+            cost.sort_indices()
+        else:
+            cost = rng.random((nt, nw))
+
+        ind = _solve(cost, lap, ws)
+        assert np.unique(ind).shape[0] == nt
+        assert np.array_equal(ind, _solve(cost, lap)) # fresh workspace
+
+        dense = cost.toarray() if sparse else cost
+        r, c  = linear_sum_assignment(dense, maximize=True)
+        assert np.isclose(dense[np.arange(nt), ind].sum(), dense[r, c].sum())
+
+        caps.append((ws.sel_cap, ws.cost_sub_cap))
+
+    assert (np.diff(caps, axis=0) >= 0).all() # buffers only grow
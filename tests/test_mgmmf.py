@@ -0,0 +1,299 @@
+import os
+import sys
+import json
+import threading
+import subprocess
+import numpy as np
+import pytest
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from scipy import sparse as sp
+
+from mgmmf import run_mgmmf, submit, set_stats_hook, PreparedWorld, STATS_PHASES, EXIT_REASONS
+from mgmmf.mgmmf import _mgmmf_args, _mgmmf_core
+from tests.conftest import _prep, objective, is_exact
+
+
+def _run(t_adjs, w_adjs, nodesim, n_runs=32, **kwargs):
+    with redirect_stdout(sys.stderr):
+        ind, _, stats = run_mgmmf(t_adjs, w_adjs, nodesim, n_runs=n_runs, stats=True, **kwargs)
+
+    return ind, stats
+
+# --
+# Sparse (candidate-restricted) mode
+
+def test_sparse_vs_dense(planted):
+    t_adjs, w_adjs, nodesim = planted
+
+    d_ind, d_stats = _run(t_adjs, w_adjs, nodesim)
+    s_ind, s_stats = _run(t_adjs, w_adjs, sp.csr_matrix(nodesim), sparse=True)
+
+    assert np.allclose(d_stats['objective'], objective(t_adjs, w_adjs, nodesim, d_ind))
+    assert np.allclose(s_stats['objective'], objective(t_adjs, w_adjs, nodesim, s_ind))
+
+    # same best match, and sparse mode only assigns template nodes to their candidates
+    assert s_stats['objective'].max() == d_stats['objective'].max()
+    assert is_exact(t_adjs, w_adjs, s_ind).any()
+    assert (nodesim[np.arange(s_ind.shape[1])[None], s_ind] > 0).all()
+
+
+def test_sparse_leaves_nodesim_alone(planted):
+    t_adjs, w_adjs, nodesim = planted
+
+    X      = sp.csr_matrix(nodesim)
+    X.data[::2] = 0 # explicit zeros
+    before = (X.data.copy(), X.indices.copy(), X.indptr.copy())
+
+    _ = _run(t_adjs, w_adjs, X, n_runs=2, sparse=True, scale_init=True, scale_eps=0.5)
+
+    for a, b in zip(before, (X.data, X.indices, X.indptr)):
+        assert np.array_equal(a, b)
+
+# --
+# Prepared world
+
+@pytest.mark.parametrize('dtype', ['float64', 'float32'])
+def test_prepared_world_reuse(planted, dtype):
+    t_adjs, w_adjs, nodesim = planted
+
+    world  = PreparedWorld(w_adjs, dtype=dtype)
+    before = [X.copy() for X in (world.B, world.Bt)]
+
+    # used in place, not copied
+    with redirect_stdout(sys.stderr):
+        args = _mgmmf_args(t_adjs, world, nodesim, dtype=dtype)
+
+    for k, X in [('B', world.B), ('Bt', world.Bt)]:
+        for attr in ['indptr', 'indices', 'data']:
+            assert np.shares_memory(args[f'{k}_{attr}'], getattr(X, attr))
+
+    # many templates (here, the planted one + a sub-template) against the same world
+    sub = {c: a[:3][:, :3] for c, a in t_adjs.items()}
+    _, ref = _run(t_adjs, w_adjs, nodesim, dtype=dtype)
+    for t, sim in [(t_adjs, nodesim), (sub, nodesim[:3]), (t_adjs, nodesim)]:
+        ind, stats = _run(t, world, sim, dtype=dtype)
+        assert np.allclose(stats['objective'], objective(t, w_adjs, sim, ind), rtol=1e-5)
+        if t is t_adjs:
+            assert stats['objective'].max() == ref['objective'].max()
+
+    for X, Y in zip(before, (world.B, world.Bt)): # never modified
+        assert (X != Y).nnz == 0 and X.dtype == Y.dtype
+
+# --
+# Index width / value type dispatch
+
+def _world64(w_adjs, dtype=np.float64):
+    world = PreparedWorld(w_adjs, dtype=dtype)
+    for X in (world.B, world.Bt):
+        X.indptr  = X.indptr.astype(np.int64)
+        X.indices = X.indices.astype(np.int64)
+
+    return world
+
+
+@pytest.mark.parametrize('index64', [False, True])
+@pytest.mark.parametrize('dtype', ['float64', 'float32'])
+def test_dispatch(planted, index64, dtype):
+    t_adjs, w_adjs, nodesim = planted
+
+    world = _world64(w_adjs, dtype) if index64 else PreparedWorld(w_adjs, dtype=dtype)
+    with redirect_stdout(sys.stderr):
+        args = _mgmmf_args(t_adjs, world, nodesim, dtype=dtype)
+
+    name = '_mgmmf_cpp' + ('64' if index64 else '') + ('_f32' if dtype == 'float32' else '')
+    assert args['ind'].dtype == (np.int64 if index64 else np.int32)
+    assert all(args[k].dtype == args['ind'].dtype for k in args if k.endswith(('_indptr', '_indices')) and args[k] is not None)
+    assert _mgmmf_core(args).__module__ == f'mgmmf.{name}'
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_index64_vs_index32(planted, sparse):
+    t_adjs, w_adjs, nodesim = planted
+
+    i32, s32 = _run(t_adjs, w_adjs, nodesim, sparse=sparse)
+    i64, s64 = _run(t_adjs, _world64(w_adjs), nodesim, sparse=sparse)
+
+    assert i64.dtype == np.int64 and i32.dtype == np.int32
+    assert np.allclose(s64['objective'], objective(t_adjs, w_adjs, nodesim, i64))
+    assert s64['objective'].max() == s32['objective'].max()
+
+
+def test_index64_saved_world(planted, tmp_path):
+    t_adjs, w_adjs, nodesim = planted
+
+    _world64(w_adjs).save(str(tmp_path / 'world'))
+    world = PreparedWorld.load(str(tmp_path / 'world'))
+    with redirect_stdout(sys.stderr):
+        args = _mgmmf_args(t_adjs, world, nodesim)
+
+    assert args['ind'].dtype == np.int64
+    assert isinstance(args['B_indices'], np.memmap) # used in place, not copied
+
+# --
+# float32 vs float64
+
+@pytest.fixture(scope='module')
+def planted8():
+    """ larger planted problem, w/ ~30% of restarts finding an exact match """
+    return _prep(nt=8, nw=1000, nc=3, deg=6, seed=7)
+
+
+@pytest.mark.parametrize('problem', ['planted', 'planted8'])
+@pytest.mark.parametrize('sparse', [False, True])
+def test_float32_vs_float64(request, problem, sparse):
+    t_adjs, w_adjs, nodesim = request.getfixturevalue(problem)
+
+    out = {}
+    for dtype in ['float64', 'float32']:
+        ind, stats = _run(t_adjs, w_adjs, nodesim, n_runs=512, sparse=sparse, dtype=dtype)
+        assert np.allclose(stats['objective'], objective(t_adjs, w_adjs, nodesim, ind), rtol=1e-5)
+        out[dtype] = (is_exact(t_adjs, w_adjs, ind).mean(), stats['objective'].max())
+
+    # same best match, and about the same fraction of restarts finding an exact match
+    assert out['float32'][1] == out['float64'][1]
+    assert abs(out['float32'][0] - out['float64'][0]) < 0.1
+
+# --
+# Solver stats
+
+@pytest.mark.parametrize('kwargs', [dict(), dict(sparse=True), dict(prune_margin=0, prune_after=2)])
+def test_stats(planted, kwargs):
+    t_adjs, w_adjs, nodesim = planted
+
+    with redirect_stdout(sys.stderr):
+        ind, elapsed, stats = run_mgmmf(t_adjs, w_adjs, nodesim, n_runs=32, stats=True, **kwargs)
+
+    n_iter, reason = stats['n_iter'], stats['exit_reason']
+    assert stats['n_runs'] == 32 and stats['elapsed'] == elapsed
+    assert np.array_equal(reason, np.array(EXIT_REASONS)[stats['exit']])
+    assert set(reason) <= {'converged', 'max_iter', 'pruned'}
+
+    # 1..max_iter (20) iterations; restarts that hit the limit ran all of them, pruned ones at least `prune_after`
+    assert ((n_iter >= 1) & (n_iter <= 20)).all()
+    assert (n_iter[reason == 'max_iter'] == 20).all()
+    assert (n_iter[reason == 'pruned'] >= 2).all()
+    assert (reason == 'pruned').any() == ('prune_margin' in kwargs)
+
+    assert np.allclose(stats['objective'], objective(t_adjs, w_adjs, nodesim, ind))
+
+    phase_us = stats['phase_us']
+    assert list(phase_us.keys()) == list(STATS_PHASES)
+    assert all(v >= 0 for v in phase_us.values())
+    assert phase_us['init'] > 0 and phase_us['lap'] > 0
+    assert sum(phase_us.values()) <= elapsed * 1e6 * os.cpu_count() * 1.1 # summed over threads
+    if 'prune_margin' not in kwargs:
+        assert phase_us['round'] > 0 and phase_us['score'] > 0
+
+
+def test_stats_hook_and_skipped(planted):
+    t_adjs, w_adjs, nodesim = planted
+
+    seen = []
+    prev = set_stats_hook(seen.append)
+    try:
+        with redirect_stdout(sys.stderr), ThreadPoolExecutor(max_workers=1) as executor:
+            ind, _ = run_mgmmf(t_adjs, w_adjs, nodesim, n_runs=4)
+
+            gate = threading.Event()
+            executor.submit(gate.wait) # keep the job queued until it's cancelled
+            job  = submit(t_adjs, w_adjs, nodesim, n_runs=4, executor=executor)
+            job.cancel()
+            gate.set()
+            job.result()
+    finally:
+        set_stats_hook(prev)
+
+    assert len(seen) == 2
+    assert seen[0]['n_runs'] == 4 and (seen[0]['exit'] >= 0).all()
+    assert job.stats is seen[1]
+
+    # restarts cancelled before they ran
+    skipped = seen[1]['exit'] == -1
+    assert (seen[1]['exit_reason'][skipped] == 'skipped').all()
+    assert (seen[1]['n_iter'][skipped] == 0).all()
+    assert np.isnan(seen[1]['objective'][skipped]).all()
+    assert skipped.all() and not job.completed.any()
+
+# --
+# Deduplicated matches
+
+def _dedupe(ind, score):
+    """ client-side: unique rows of `ind`, hit counts + best score, sorted like `Matches` """
+    u, inv, hits = np.unique(ind, axis=0, return_inverse=True, return_counts=True)
+    best  = np.full(u.shape[0], -np.inf)
+    np.maximum.at(best, inv.ravel(), score)
+    order = np.lexsort((-hits, -best))
+    return u[order], hits[order], best[order]
+
+
+@pytest.mark.parametrize('kwargs', [dict(), dict(sparse=True), dict(lap='sap'), dict(prune_margin=0.1, prune_after=2)])
+def test_unique(planted, kwargs):
+    t_adjs, w_adjs, nodesim = planted
+
+    with redirect_stdout(sys.stderr):
+        m, _, stats = run_mgmmf(t_adjs, w_adjs, nodesim, n_runs=64, unique=True, stats=True, **kwargs)
+
+    kept = stats['exit_reason'] != 'pruned'
+
+    assert m.ind.shape == (m.hits.shape[0], nodesim.shape[0])
+    assert np.unique(m.ind, axis=0).shape[0] == m.ind.shape[0]
+    assert m.hits.sum() == kept.sum()
+    assert np.allclose(m.score, objective(t_adjs, w_adjs, nodesim, m.ind))
+    assert (np.diff(m.score) <= 0).all()
+
+    # restarts behind each match (same call, so same assignments): hits + scores agree w/ the per-restart objectives
+    assert np.allclose(np.sort(np.repeat(m.score, m.hits)), np.sort(stats['objective'][kept]))
+
+
+def test_unique_vs_dedupe(planted):
+    t_adjs, w_adjs, nodesim = planted
+
+    ind, stats = _run(t_adjs, w_adjs, nodesim, n_runs=64)
+    with redirect_stdout(sys.stderr):
+        m, _ = run_mgmmf(t_adjs, w_adjs, nodesim, n_runs=64, unique=True)
+
+    u, hits, best = _dedupe(ind, stats['objective'])
+
+    assert m.ind.dtype == ind.dtype
+    assert np.isclose(m.score[0], best[0])
+    assert is_exact(t_adjs, w_adjs, m.ind[:1]).all() and is_exact(t_adjs, w_adjs, u[:1]).all()
+    assert m.hits.sum() == hits.sum()
+
+# --
+# Diversity scaling w/ run-level parallelism
+
+_DIVERSITY_SCRIPT = """
+import sys, json
+from contextlib import redirect_stdout
+from tests.conftest import _prep
+from mgmmf import run_mgmmf
+
+t_adjs, w_adjs, nodesim = _prep(nt=4, nw=200, nc=3, deg=10, seed=123)
+with redirect_stdout(sys.stderr):
+    m, _ = run_mgmmf(t_adjs, w_adjs, nodesim, n_runs=64, unique=True, parallel='runs', **json.loads(sys.argv[1]))
+
+print(json.dumps([int(m.ind.shape[0]), int(m.hits.sum())]))
+"""
+
+def _n_unique(n_threads, **kwargs):
+    """ (unique matches, restarts behind them), in a fresh process w/ `n_threads` OpenMP threads """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env  = dict(os.environ, OMP_NUM_THREADS=str(n_threads), PYTHONPATH=root)
+    out  = subprocess.run([sys.executable, '-c', _DIVERSITY_SCRIPT, json.dumps(kwargs)], env=env, cwd=root,
+        capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_diversity_parallel(sparse):
+    """ diversity runs on all threads (epochs of 4 restarts), and finds as many unique matches as on one """
+    diversity = dict(scale_eps=0.5, scale_sim=True, scale_epoch=4, sparse=sparse)
+
+    serial,   serial_hits = _n_unique(1, **diversity)
+    parallel, hits        = _n_unique(4, **diversity)
+    baseline, _           = _n_unique(4, sparse=sparse)
+
+    assert serial_hits == hits == 64
+    assert abs(parallel - serial) <= 0.1 * serial # restarts share the global `rand` state, so not bit-identical
+    assert parallel > 2 * baseline
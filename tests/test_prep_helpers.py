@@ -0,0 +1,107 @@
+import sys
+import numpy as np
+import pytest
+from contextlib import redirect_stdout
+from scipy import sparse as sp
+
+from bench.synth import make_problem
+from mgmmf.prep.generic import prep_generic
+from mgmmf.prep.helpers import arc_consistency_filter, channel_degrees, degree_filter, degree_filter_sparse, iterated_degree_filter
+from tests.conftest import is_exact
+
+
+def _arc_consistency_ref(t_adjs, w_adjs, nodesim):
+    """ naive fixed point: (world node x template node) candidates, re-filtered until nothing changes """
+    cand = np.asarray(nodesim.T != 0)
+    while True:
+        prev = cand.copy()
+        for c in t_adjs.keys():
+            B = (w_adjs[c] != 0).astype(np.float64)
+            S_out = (B   @ cand) > 0 # S_out[j, i2]: some out-neighbor of j is a candidate for i2
+            S_in  = (B.T @ cand) > 0
+            for i, i2 in zip(*t_adjs[c].nonzero()):
+                cand[:, i]  &= S_out[:, i2]
+                cand[:, i2] &= S_in[:, i]
+
+        if (cand == prev).all():
+            return cand
+
+
+@pytest.mark.parametrize('slack', [0, 2])
+def test_degree_filter_sparse(slack):
+    rng  = np.random.default_rng(slack)
+    t    = rng.integers(0, 4, (8, 6))
+    w    = rng.integers(0, 6, (500, 6))
+    cand = sp.random(8, 500, density=0.3, random_state=rng, format='csr')
+    cand.data[::5] = 0 # explicit zeros aren't candidates
+
+    ref  = degree_filter(t, w, slack) & (cand.toarray() != 0)
+    data = cand.data.copy()
+    for x in [cand, cand.toarray(), cand.tocoo()]: # the COO shares `cand`'s data
+        out = degree_filter_sparse(t, w, x, slack)
+        assert sp.isspmatrix_csr(out) and out.dtype == bool
+        assert out.nnz == ref.sum() # no explicit False entries
+        assert np.array_equal(out.toarray(), ref)
+        assert np.array_equal(cand.data, data) # input left alone
+
+
+def _iterated_degree_filter_ref(t_adjs, w_adjs, nodesim, slack):
+    """ naive fixed point: recount degrees of the surviving graph, drop nodes w/o a fitting candidate """
+    t_deg = channel_degrees(t_adjs)
+    keep  = np.ones(nodesim.shape[1], dtype=bool)
+    while True:
+        w_deg = channel_degrees({c: a.multiply(keep[:, None]).multiply(keep[None]) for c, a in w_adjs.items()})
+        fits  = (t_deg[:, None] <= w_deg[None] + slack).all(axis=-1) & (nodesim != 0)
+        new   = keep & fits.any(axis=0) & (w_deg.sum(axis=1) > 0)
+        if (new == keep).all():
+            return keep, nodesim[:, keep] * fits[:, keep]
+
+        keep = new
+
+
+@pytest.mark.parametrize('slack', [0, 1])
+def test_iterated_degree_filter(slack):
+    with redirect_stdout(sys.stderr):
+        w_node, w_edge, tmplt, truth = make_problem(nt=8, nw=1000, nc=3, deg=6, t_density=0.4, seed=5)
+        t_adjs, w_adjs, nodesim, _   = prep_generic(w_node, w_edge, tmplt)
+
+    ref_keep, ref_out = _iterated_degree_filter_ref(t_adjs, w_adjs, nodesim, slack)
+    keep, out         = iterated_degree_filter(t_adjs, w_adjs, nodesim, slack=slack)
+
+    assert ref_keep.sum() < nodesim.shape[1] # something was pruned
+    assert keep[truth].all()                 # planted match survives
+    assert np.array_equal(keep, ref_keep)
+    assert np.array_equal(out, ref_out)
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_arc_consistency_filter(seed):
+    with redirect_stdout(sys.stderr):
+        w_node, w_edge, tmplt, truth = make_problem(nt=6, nw=300, nc=2, deg=3, t_density=0.5, seed=seed)
+        t_adjs, w_adjs, nodesim, _   = prep_generic(w_node, w_edge, tmplt)
+
+    cand = _arc_consistency_ref(t_adjs, w_adjs, nodesim)
+    keep, out = arc_consistency_filter(t_adjs, w_adjs, nodesim)
+
+    assert cand.sum() < (nodesim != 0).sum() # something was pruned
+    assert np.array_equal(keep, cand.any(axis=1))
+    assert np.array_equal(out, nodesim[:, keep] * cand[keep].T)
+
+    assert cand[truth, np.arange(truth.shape[0])].all() # planted match survives
+
+
+def test_arc_consistency_keeps_exact_matches(planted):
+    from mgmmf import run_mgmmf
+
+    t_adjs, w_adjs, nodesim = planted
+    with redirect_stdout(sys.stderr):
+        ind, _ = run_mgmmf(t_adjs, w_adjs, nodesim, n_runs=32)
+
+    ind = ind[is_exact(t_adjs, w_adjs, ind)]
+    assert ind.shape[0] > 0
+
+    keep, out = arc_consistency_filter(t_adjs, w_adjs, nodesim)
+    assert keep[ind].all()
+
+    col = np.cumsum(keep) - 1 # world node -> column of `out`
+    assert (out[np.arange(ind.shape[1])[None], col[ind]] != 0).all()
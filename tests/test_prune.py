@@ -0,0 +1,82 @@
+import sys
+import numpy as np
+import pytest
+from contextlib import redirect_stdout
+from scipy import sparse as sp
+
+from mgmmf import run_mgmmf
+from mgmmf.mgmmf import _mgmmf_args
+from tests.conftest import objective, is_exact
+
+
+def _run(planted, **kwargs):
+    t_adjs, w_adjs, nodesim = planted
+    with redirect_stdout(sys.stderr):
+        ind, _, stats = run_mgmmf(t_adjs, w_adjs, nodesim, n_runs=64, stats=True, **kwargs)
+
+    return ind, stats
+
+
+def test_prune_keeps_exact_match(planted):
+    t_adjs, w_adjs, nodesim = planted
+    target = objective(t_adjs, w_adjs, nodesim, _run(planted)[0]).max()
+
+    for kwargs in [dict(prune_target='exact', prune_margin=0, sparse=True), dict(prune_margin=0)]:
+        ind, stats = _run(planted, **kwargs)
+        exact      = is_exact(t_adjs, w_adjs, ind)
+        pruned     = stats['exit_reason'] == 'pruned'
+
+        assert pruned.any()
+        assert not (exact & pruned).any()                 # restarts at an exact match are never pruned
+        assert exact.mean() > 0.25                        # ~0.6 w/o pruning
+        assert stats['objective'].max() == target
+        assert exact[stats['objective'].argmax()]
+
+
+def test_prune_objective(planted):
+    t_adjs, w_adjs, nodesim = planted
+    ind, stats = _run(planted, prune_margin=0.1, prune_after=2)
+
+    assert (stats['exit_reason'] == 'pruned').any()
+    assert np.allclose(stats['objective'], objective(t_adjs, w_adjs, nodesim, ind))
+
+
+def _exact_target(t_adjs, w_adjs, nodesim, sparse):
+    with redirect_stdout(sys.stderr):
+        return _mgmmf_args(t_adjs, w_adjs, nodesim, sparse=sparse, prune_target='exact')['prune_target']
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+def test_prune_exact_target(planted, sparse):
+    """ w/ candidates of different similarity, 'exact' is a lower bound on every exact match's objective """
+    t_adjs, w_adjs, nodesim = planted
+
+    rng     = np.random.default_rng(0)
+    nodesim = nodesim * rng.uniform(0.95, 1, nodesim.shape)
+    X       = sp.csr_matrix(nodesim) if sparse else nodesim
+
+    with redirect_stdout(sys.stderr):
+        ind, _, stats = run_mgmmf(t_adjs, w_adjs, X, n_runs=64, sparse=sparse, stats=True)
+
+    exact  = is_exact(t_adjs, w_adjs, ind)
+    target = _exact_target(t_adjs, w_adjs, X, sparse)
+
+    assert exact.any()
+    n_edges = sum(a.nnz for a in t_adjs.values())
+    assert stats['objective'][exact].min() < nodesim.max(axis=1).sum() + n_edges # best-candidate target would overshoot
+    assert target <= stats['objective'][exact].min()
+
+    with redirect_stdout(sys.stderr):
+        ind, _, stats = run_mgmmf(t_adjs, w_adjs, X, n_runs=64, sparse=sparse, stats=True, prune_target='exact', prune_margin=0)
+
+    assert is_exact(t_adjs, w_adjs, ind).any()
+    assert not (is_exact(t_adjs, w_adjs, ind) & (stats['exit_reason'] == 'pruned')).any()
+
+
+def test_prune_exact_target_binary(planted):
+    """ binary similarities + edge weights, candidates only: the target is the exact match's objective """
+    t_adjs, w_adjs, nodesim = planted
+    ind, stats = _run(planted)
+
+    exact = is_exact(t_adjs, w_adjs, ind)
+    assert np.allclose(stats['objective'][exact], _exact_target(t_adjs, w_adjs, sp.csr_matrix(nodesim), True))